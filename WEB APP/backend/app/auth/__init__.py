@@ -0,0 +1,6 @@
+"""
+🔐 Authentication Module
+Le esportazioni pubbliche sono centralizzate in auth_init.
+"""
+from app.auth.auth_init import *  # noqa: F401,F403
+from app.auth.auth_init import __all__  # noqa: F401
@@ -2,19 +2,25 @@
 Authentication API Endpoints con Rate Limiting
 Endpoint FastAPI per registrazione, login e password reset.
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Request
 from pydantic import BaseModel, EmailStr, Field
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 import secrets
 
-from app.db.database import get_db
+from app.db.database import get_db, get_read_db
 from app.models.models import User
 from app.auth.auth_service import register_user, login_user
+from app.auth.auth_cache import Principal, principal_cache
 from app.auth.auth_dependencies import get_current_user
 from app.auth.auth_tokens import create_access_token, create_refresh_token, verify_token
 from app.auth.auth_hashing import hash_password, verify_password
-from app.auth.auth_logger import logger
+from app.auth.auth_revocation import revocation_store
+from app.auth.auth_logger import get_auth_logger
+from app.services.rate_limit import limit_by_ip
+
+logger = get_auth_logger("api")
 
 
 # ══════════════════════════════════════════════════════════════
@@ -80,6 +86,11 @@ class RefreshTokenRequest(BaseModel):
     refresh_token: str = Field(..., description="Refresh token")
 
 
+class LogoutRequest(BaseModel):
+    """Richiesta di logout: il refresh token della sessione, da revocare insieme all'access token."""
+    refresh_token: Optional[str] = Field(None, description="Refresh token della sessione")
+
+
 class ForgotPasswordRequest(BaseModel):
     """Richiesta di reset password."""
     email: EmailStr = Field(..., description="Email dell'utente")
@@ -115,6 +126,13 @@ class HealthCheckResponse(BaseModel):
 router = APIRouter(prefix="/api/auth", tags=["authentication"])
 
 
+def revoke_token_payload(db: Session, payload: dict) -> None:
+    """Revoca per jti il token verificato (fino alla sua scadenza)."""
+    if payload.get("jti"):
+        expires_at = datetime.fromtimestamp(payload["exp"], tz=timezone.utc)
+        revocation_store.revoke(db, payload["jti"], expires_at)
+
+
 # ──────────────────────────────────────────────────────────────
 # Health Check (per diagnostica)
 # ──────────────────────────────────────────────────────────────
@@ -136,7 +154,7 @@ def health_check():
 # Registrazione con Rate Limiting
 # ──────────────────────────────────────────────────────────────
 
-@router.post("/register", response_model=AuthResponse)
+@router.post("/register", response_model=AuthResponse, dependencies=[Depends(limit_by_ip("register"))])
 def register(
     data: RegisterRequest,
     request: Request,
@@ -145,7 +163,7 @@ def register(
     """
     Registra un nuovo utente.
     
-    Rate Limit: 5 tentativi per IP ogni 15 minuti
+    Rate Limit: 5 tentativi per IP ogni 15 minuti (RATE_LIMIT_REGISTER)
     
     - Valida email e password
     - Crea l'utente nel database
@@ -157,7 +175,7 @@ def register(
     - 429: Too many requests
     - 500: Errore interno
     """
-    logger.info(f"POST /register - Nuova registrazione: {data.email}")
+    logger.info("POST /register - Nuova registrazione: %s", data.email)
     
     try:
         result = register_user(
@@ -178,7 +196,7 @@ def register(
             email=result["email"],
         )
     except Exception as e:
-        logger.error(f"Errore durante registrazione di {data.email}: {str(e)}")
+        logger.error("Errore durante registrazione di %s: %s", data.email, e)
         raise
 
 
@@ -186,7 +204,7 @@ def register(
 # Login con Rate Limiting
 # ──────────────────────────────────────────────────────────────
 
-@router.post("/login", response_model=AuthResponse)
+@router.post("/login", response_model=AuthResponse, dependencies=[Depends(limit_by_ip("login"))])
 def login(
     data: LoginRequest,
     request: Request,
@@ -195,7 +213,7 @@ def login(
     """
     Autentica un utente e restituisce JWT token.
     
-    Rate Limit: 5 tentativi per IP ogni minuto
+    Rate Limit: 5 tentativi per IP ogni minuto (RATE_LIMIT_LOGIN)
     
     - Verifica email e password
     - Restituisce access token valido per 24 ore
@@ -206,7 +224,7 @@ def login(
     - 429: Too many requests
     - 500: Errore interno
     """
-    logger.info(f"POST /login - Login attempt: {data.email}")
+    logger.info("POST /login - Login attempt: %s", data.email)
     
     try:
         result = login_user(
@@ -226,7 +244,7 @@ def login(
             email=result["email"],
         )
     except Exception as e:
-        logger.error(f"Errore durante login di {data.email}: {str(e)}")
+        logger.error("Errore durante login di %s: %s", data.email, e)
         raise
 
 
@@ -243,8 +261,9 @@ def refresh(
     Rinova l'access token usando il refresh token.
     
     - Valida il refresh token
-    - Genera un nuovo access token
-    - Ritorna il nuovo access token
+    - Genera un nuovo access token e un nuovo refresh token
+    - Revoca il refresh token usato (rotazione): ogni sessione ha un solo
+      refresh token valido, quello che il logout revoca
     
     **Raises:**
     - 401: Refresh token non valido o scaduto
@@ -270,17 +289,19 @@ def refresh(
     ).scalars().first()
     
     if not user:
-        logger.warning(f"Utente non trovato: {email}")
+        logger.warning("Utente non trovato: %s", email)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Utente non trovato",
         )
     
+    revoke_token_payload(db, payload)
+    
     # Genera nuovo access token
     access_token = create_access_token({"email": email})
     refresh_token = create_refresh_token({"email": email})
     
-    logger.info(f"Token rinnovato per: {email}")
+    logger.info("Token rinnovato per: %s", email)
     
     return AuthResponse(
         access_token=access_token,
@@ -295,7 +316,7 @@ def refresh(
 # Password Reset
 # ──────────────────────────────────────────────────────────────
 
-@router.post("/forgot-password")
+@router.post("/forgot-password", dependencies=[Depends(limit_by_ip("forgot_password"))])
 def forgot_password(
     data: ForgotPasswordRequest,
     request: Request,
@@ -304,7 +325,7 @@ def forgot_password(
     """
     Invia un link di reset password via email.
     
-    Rate Limit: 3 tentativi per IP ogni 10 minuti
+    Rate Limit: 3 tentativi per IP ogni 10 minuti (RATE_LIMIT_FORGOT_PASSWORD)
     
     - Genera un token di reset
     - Salva il token nel database (opzionale)
@@ -314,7 +335,7 @@ def forgot_password(
     
     **Returns**: Messaggio di successo (anche se email non mandato)
     """
-    logger.info(f"POST /forgot-password - Reset request per: {data.email}")
+    logger.info("POST /forgot-password - Reset request per: %s", data.email)
     
     from sqlalchemy import select
     user = db.execute(
@@ -323,7 +344,7 @@ def forgot_password(
     
     if not user:
         # Non dire se l'email esiste o meno (security best practice)
-        logger.warning(f"Tentativo di reset per email non esistente: {data.email}")
+        logger.warning("Tentativo di reset per email non esistente: %s", data.email)
         return {
             "status": "ok",
             "message": "Se l'email esiste, riceverai un link di reset."
@@ -336,7 +357,7 @@ def forgot_password(
     # TODO: Salva il token in un modello PasswordReset nel database
     # TODO: Invia email con il link: https://tuodominio.com/reset-password?token=...
     
-    logger.info(f"Token di reset generato per: {data.email}")
+    logger.info("Token di reset generato per: %s", data.email)
     
     return {
         "status": "ok",
@@ -378,30 +399,59 @@ def reset_password(
 
 @router.get("/me", response_model=UserResponse)
 def get_current_user_info(
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
 ):
     """
     Ottiene i dati dell'utente attualmente autenticato.
     
+    Il principal in cache ha solo id, email e locale: il profilo
+    completo viene letto dal database.
+    
     **Richiede:** Authorization header con Bearer token
     """
-    logger.debug(f"GET /me - Utente: {current_user.email}")
-    return UserResponse.model_validate(current_user)
+    logger.debug("GET /me - Utente: %s", current_user.email)
+    user = db.get(User, current_user.id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Utente non trovato",
+        )
+    return UserResponse.model_validate(user)
 
 
 @router.post("/logout")
 def logout(
-    current_user: User = Depends(get_current_user)
+    data: Optional[LogoutRequest] = None,
+    authorization: str = Header(None),
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db),
 ):
     """
     Logout dell'utente.
     
-    Nota: Poiché usiamo JWT stateless, il logout viene gestito
-    dal frontend eliminando il token da localStorage.
+    Il token viene revocato per jti fino alla sua scadenza: verify_token lo
+    rifiuta da subito (anche negli altri processi, al loro prossimo sync) e
+    il server lo rimuove dalla cache dei principal. Il frontend elimina
+    comunque il token da localStorage.
+    
+    Con {"refresh_token": ...} nel body viene revocato anche il refresh
+    token della sessione: senza, /refresh continuerebbe a emettere nuovi
+    access token fino alla sua scadenza (7 giorni).
     
     **Richiede:** Authorization header con Bearer token
     """
-    logger.info(f"POST /logout - Logout: {current_user.email}")
+    logger.info("POST /logout - Logout: %s", current_user.email)
+    token = authorization.split()[1]
+    payload = verify_token(token)
+    if payload:
+        revoke_token_payload(db, payload)
+    principal_cache.invalidate_token(token)
+    if data and data.refresh_token:
+        refresh_payload = verify_token(data.refresh_token)
+        # Solo un token dello stesso utente
+        if refresh_payload and refresh_payload["email"] == current_user.email:
+            revoke_token_payload(db, refresh_payload)
     return {
         "status": "ok",
         "message": "Logout completato. Elimina il token dal client.",
@@ -0,0 +1,155 @@
+"""
+Cache in-process dei principal autenticati.
+Evita decodifica JWT e query su users a ogni richiesta protetta.
+
+La chiave è lo SHA-256 del token: a parità di token la firma è già stata
+verificata al primo accesso. Una voce scade dopo PRINCIPAL_CACHE_TTL_SECONDS
+o alla scadenza del token, se prima; oltre PRINCIPAL_CACHE_MAX_ENTRIES
+vengono rimosse le meno usate (LRU).
+
+Invalidazione: logout (token), modifica o cancellazione dell'utente via ORM
+(tutti i suoi token, tramite gli eventi del mapper User), revoca per jti
+vista da auth_revocation (anche quella fatta da un altro processo, al
+successivo sync). La cache è per processo: le altre modifiche fatte da altri
+worker scadono con il TTL.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+
+from app.models.models import User
+from .auth_config import AuthConfig
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Utente autenticato: quanto serve alle route, senza sessione ORM."""
+    id: str
+    email: str
+    locale: str
+
+
+def token_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+class PrincipalCache:
+    """LRU + TTL thread-safe: token → Principal."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = max_entries > 0 and ttl_seconds > 0
+        self._entries: OrderedDict[bytes, tuple[float, Principal, Optional[str]]] = OrderedDict()
+        self._by_user: dict[str, set[bytes]] = {}
+        self._by_jti: dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, key: bytes) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, principal, _ = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return principal
+
+    def put(
+        self, key: bytes, principal: Principal, token_exp: Optional[float] = None, jti: Optional[str] = None,
+    ) -> None:
+        """Salva il principal; token_exp (epoch, claim exp) limita la durata della voce."""
+        if not self.enabled:
+            return
+        ttl = self.ttl_seconds
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+            if ttl <= 0:
+                return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, principal, jti)
+            self._by_user.setdefault(principal.id, set()).add(key)
+            if jti:
+                self._by_jti[jti] = key
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate_token(self, token: str) -> None:
+        with self._lock:
+            if token_key(token) in self._entries:
+                self._remove(token_key(token))
+                self._invalidations += 1
+
+    def invalidate_jti(self, jti: str) -> None:
+        """Rimuove il token con questo jti (revocato, anche da un altro processo)."""
+        with self._lock:
+            key = self._by_jti.get(jti)
+            if key is not None:
+                self._remove(key)
+                self._invalidations += 1
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Rimuove tutti i token dell'utente (password, profilo o account cambiati)."""
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._remove(key)
+                self._invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self._by_jti.clear()
+
+    def metrics(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations,
+        }
+
+    def _remove(self, key: bytes) -> None:
+        _, principal, jti = self._entries.pop(key)
+        if jti:
+            self._by_jti.pop(jti, None)
+        keys = self._by_user.get(principal.id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[principal.id]
+
+
+principal_cache = PrincipalCache(
+    max_entries=AuthConfig.PRINCIPAL_CACHE_MAX_ENTRIES,
+    ttl_seconds=AuthConfig.PRINCIPAL_CACHE_TTL_SECONDS,
+)
+
+
+# Password, email o locale cambiati, account cancellato: i token già in
+# cache non devono più risolvere al vecchio principal
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(_mapper, _connection, target: User) -> None:
+    principal_cache.invalidate_user(target.id)
@@ -23,6 +23,32 @@ class AuthConfig:
     PASSWORD_MIN_LENGTH = 6
     PASSWORD_SCHEMES = ["argon2"]
     
+    # Argon2 (tarare con: python -m app.auth.auth_hashing --calibrate)
+    ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+    ARGON2_MEMORY_KIB = int(os.getenv("ARGON2_MEMORY_KIB", "65536"))
+    ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+    
+    # Executor di hashing: processi dedicati e coda limitata (0 worker = inline)
+    HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+    HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "0")) or 4 * max(HASH_WORKERS, 1)
+    HASH_TIMEOUT_SECONDS = float(os.getenv("HASH_TIMEOUT_SECONDS", "30"))
+    HASH_RETRY_AFTER_SECONDS = int(os.getenv("HASH_RETRY_AFTER_SECONDS", "2"))
+    
+    # Principal Cache (auth_cache.py); TTL 0 = disattivata
+    PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+    PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+    
+    # Revoca dei token (auth_revocation.py); SYNC 0 = un solo processo, niente thread
+    REVOCATION_BLOOM_CAPACITY = int(os.getenv("REVOCATION_BLOOM_CAPACITY", "100000"))
+    REVOCATION_BLOOM_ERROR_RATE = float(os.getenv("REVOCATION_BLOOM_ERROR_RATE", "0.001"))
+    REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", "30"))
+    REVOCATION_GC_SECONDS = float(os.getenv("REVOCATION_GC_SECONDS", "3600"))
+    
+    # Amministratori (endpoint /debug): email separate da virgola; vuoto = nessuno
+    ADMIN_EMAILS = frozenset(
+        email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()
+    )
+    
     # CORS Configuration
     CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:5173,http://localhost:3000").split(",")
     
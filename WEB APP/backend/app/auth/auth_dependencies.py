@@ -4,32 +4,30 @@ Fornisce le dipendenze per proteggere le route.
 """
 from typing import Optional
 from fastapi import Depends, HTTPException, status, Header
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import select
 
-from app.db.database import get_db
+from app.db.database import get_async_db, get_read_db
 from app.models.models import User
+from .auth_cache import Principal, principal_cache, token_key
+from .auth_config import AuthConfig
 from .auth_tokens import verify_token
-from .auth_logger import logger
+from .auth_logger import get_auth_logger
 
+logger = get_auth_logger("dependencies")
 
-async def get_current_user(
-    authorization: str = Header(None),
-    db: Session = Depends(get_db),
-) -> User:
+
+# Solo le colonne del principal, non l'intera riga utente
+PRINCIPAL_QUERY = select(User.id, User.email, User.locale)
+
+
+def _token_from_authorization(authorization: Optional[str]) -> str:
     """
-    Dipendenza per proteggere le route.
-    Estrae il token JWT dall'header Authorization e restituisce l'utente.
+    Estrae il token dall'header Authorization ("Bearer <token>").
     
-    Args:
-        authorization: Header Authorization (Bearer <token>)
-        db: Sessione database
-        
-    Returns:
-        User: Oggetto utente dal database
-        
     Raises:
-        HTTPException: 401 se token non valido, non trovato, o utente non esiste
+        HTTPException: 401 se header mancante o malformato
     """
     # Verifica che le credenziali siano fornite
     if not authorization:
@@ -46,14 +44,22 @@ async def get_current_user(
         if scheme.lower() != "bearer":
             raise ValueError("Schema non valido")
     except ValueError:
-        logger.warning(f"Header Authorization malformato: {authorization}")
+        logger.warning("Header Authorization malformato: %s", authorization)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authorization header malformato",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return token
+
+
+def _verified_payload(token: str) -> dict:
+    """
+    Verifica firma e scadenza del token JWT (nessun accesso al database).
     
-    # Verifica il token JWT
+    Raises:
+        HTTPException: 401 se token non valido, scaduto o senza email
+    """
     payload = verify_token(token)
     if payload is None:
         logger.warning("Token non valido o scaduto")
@@ -71,42 +77,127 @@ async def get_current_user(
             detail="Token non valido: email mancante",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return payload
+
+
+def _authenticated(row, email: str, key: bytes, payload: dict) -> Principal:
+    """Principal dell'utente trovato (salvato in cache), o 401 se non esiste."""
+    if not row:
+        logger.warning("Utente non trovato nel database: %s", email)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Utente non trovato",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
-    # Recupera l'utente dal database
-    try:
-        user = db.execute(
-            select(User).where(User.email == email)
-        ).scalars().first()
-        
-        if not user:
-            logger.warning(f"Utente non trovato nel database: {email}")
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Utente non trovato",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+    principal = Principal(id=row.id, email=row.email, locale=row.locale)
+    principal_cache.put(key, principal, payload.get("exp"), payload.get("jti"))
+    logger.debug("Utente autenticato: %s", principal.email)
+    return principal
+
+
+def _database_error(e: Exception) -> HTTPException:
+    logger.error("Errore nel recuperare l'utente dal database: %s", e)
+    return HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail="Errore interno durante l'autenticazione",
+    )
+
+
+def get_current_user(
+    authorization: str = Header(None),
+    db: Session = Depends(get_read_db),
+) -> Principal:
+    """
+    Dipendenza per proteggere le route.
+    Estrae il token JWT dall'header Authorization e restituisce il principal
+    (id, email, locale) dell'utente.
+    
+    Se il token è nella cache dei principal non tocca né JWT né database;
+    altrimenti verifica il token, legge l'utente e lo mette in cache.
+    È una def sync: FastAPI la esegue nel threadpool, così la query
+    bloccante non ferma l'event loop.
+    
+    Args:
+        authorization: Header Authorization (Bearer <token>)
+        db: Sessione database
         
-        logger.debug(f"Utente autenticato: {user.email}")
-        return user
+    Returns:
+        Principal dell'utente autenticato
         
-    except HTTPException:
-        # Re-raise HTTPException
-        raise
+    Raises:
+        HTTPException: 401 se token non valido, non trovato, o utente non esiste
+    """
+    token = _token_from_authorization(authorization)
+    key = token_key(token)
+    principal = principal_cache.get(key)
+    if principal is not None:
+        db.close()
+        return principal
+    
+    payload = _verified_payload(token)
+    email = payload["email"]
+    
+    # Recupera l'utente dal database
+    try:
+        row = db.execute(PRINCIPAL_QUERY.where(User.email == email)).first()
+    except Exception as e:
+        raise _database_error(e)
+    finally:
+        # La connessione torna al pool mentre la richiesta attende un thread
+        # per l'endpoint: altrimenti, con più richieste che thread, i thread
+        # restano in attesa di connessioni tenute da richieste senza thread.
+        db.close()
+    return _authenticated(row, email, key, payload)
+
+
+async def get_current_user_async(
+    authorization: str = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+) -> Principal:
+    """
+    Come get_current_user, con una sessione async (route async, DB_ASYNC=1).
+    La query attende il driver async senza bloccare l'event loop.
+    """
+    token = _token_from_authorization(authorization)
+    key = token_key(token)
+    principal = principal_cache.get(key)
+    if principal is not None:
+        return principal
+    
+    payload = _verified_payload(token)
+    email = payload["email"]
+    
+    try:
+        row = (await db.execute(PRINCIPAL_QUERY.where(User.email == email))).first()
     except Exception as e:
-        logger.error(f"Errore nel recuperare l'utente dal database: {str(e)}")
+        raise _database_error(e)
+    return _authenticated(row, email, key, payload)
+
+
+def get_current_admin(current_user: Principal = Depends(get_current_user)) -> Principal:
+    """
+    Come get_current_user, ma solo per gli utenti in ADMIN_EMAILS.
+    
+    Raises:
+        HTTPException: 401 come get_current_user, 403 se l'utente non è amministratore
+    """
+    if current_user.email.lower() not in AuthConfig.ADMIN_EMAILS:
+        logger.warning("Accesso admin negato a: %s", current_user.email)
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Errore interno durante l'autenticazione",
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Riservato agli amministratori.",
         )
+    return current_user
 
 
-async def get_current_user_optional(
+def get_current_user_optional(
     authorization: str = Header(None),
-    db: Session = Depends(get_db),
-) -> Optional[User]:
+    db: Session = Depends(get_read_db),
+) -> Optional[Principal]:
     """
     Dipendenza opzionale per l'autenticazione.
-    Ritorna l'utente se autenticato, None altrimenti.
+    Ritorna il principal se autenticato, None altrimenti.
     Utile per endpoint che supportano sia accesso autenticato che anonimo.
     
     Args:
@@ -114,7 +205,7 @@ async def get_current_user_optional(
         db: Sessione database
         
     Returns:
-        User se autenticato, None altrimenti
+        Principal se autenticato, None altrimenti
     """
     if not authorization:
         return None
@@ -126,6 +217,11 @@ async def get_current_user_optional(
     except ValueError:
         return None
     
+    key = token_key(token)
+    principal = principal_cache.get(key)
+    if principal is not None:
+        return principal
+    
     payload = verify_token(token)
     
     if payload is None:
@@ -136,10 +232,12 @@ async def get_current_user_optional(
         return None
     
     try:
-        user = db.execute(
-            select(User).where(User.email == email)
-        ).scalars().first()
-        return user
+        row = db.execute(PRINCIPAL_QUERY.where(User.email == email)).first()
     except Exception as e:
-        logger.error(f"Errore nel recuperare l'utente (optional): {str(e)}")
-        return None
\ No newline at end of file
+        logger.error("Errore nel recuperare l'utente (optional): %s", e)
+        return None
+    if not row:
+        return None
+    principal = Principal(id=row.id, email=row.email, locale=row.locale)
+    principal_cache.put(key, principal, payload.get("exp"), payload.get("jti"))
+    return principal
\ No newline at end of file
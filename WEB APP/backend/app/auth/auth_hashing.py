@@ -2,22 +2,194 @@
 Password Hashing Module
 Gestisce l'hashing e la verifica delle password con Argon2.
 Migliorato con error handling e logging.
+
+Argon2 gira in un pool di processi dedicato (HASH_WORKERS), fuori dal
+threadpool delle richieste e senza GIL. Le richieste in attesa sono al più
+HASH_MAX_PENDING: oltre, HashingBusyError (le route rispondono 503 con
+Retry-After) invece di accodare login e registrazioni all'infinito. Lo
+stesso errore arriva se il worker non risponde entro HASH_TIMEOUT_SECONDS
+o se il pool è caduto: è un problema di capacità, non una password errata.
+
+Taratura dei parametri Argon2 per l'host:
+    python -m app.auth.auth_hashing --calibrate --target-ms 250
 """
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from passlib.context import CryptContext
 from typing import Optional
 
 from .auth_config import AuthConfig
-from .auth_logger import logger
+from .auth_logger import get_auth_logger
+
+logger = get_auth_logger("hashing")
+
+
+def build_context(time_cost: int, memory_kib: int, parallelism: int) -> CryptContext:
+    """Contesto Argon2; min_rounds fa sì che gli hash con meno iterazioni vadano aggiornati."""
+    return CryptContext(
+        schemes=AuthConfig.PASSWORD_SCHEMES,
+        deprecated="auto",
+        argon2__rounds=time_cost,  # Numero di iterazioni Argon2
+        argon2__min_rounds=time_cost,
+        argon2__memory_cost=memory_kib,
+        argon2__parallelism=parallelism,
+    )
 
 
 # Configura il contesto per l'hashing
-pwd_context = CryptContext(
-    schemes=AuthConfig.PASSWORD_SCHEMES,
-    deprecated="auto",
-    argon2__rounds=3,  # Numero di iterazioni Argon2
+pwd_context = build_context(
+    AuthConfig.ARGON2_TIME_COST,
+    AuthConfig.ARGON2_MEMORY_KIB,
+    AuthConfig.ARGON2_PARALLELISM,
 )
 
 
+# ──────────────────────────────────────────────
+# EXECUTOR
+# ──────────────────────────────────────────────
+class HashingBusyError(RuntimeError):
+    """Coda di hashing piena: riprovare dopo retry_after secondi."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Coda di hashing piena")
+        self.retry_after = retry_after
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _warmup() -> str:
+    """Import del modulo e caricamento del backend Argon2 nel processo worker."""
+    return pwd_context.handler().get_backend()
+
+
+class HashingExecutor:
+    """
+    Pool di processi per Argon2 con un numero limitato di richieste in
+    attesa. Il thread chiamante attende il risultato (a GIL rilasciato);
+    se i posti sono finiti fallisce subito con HashingBusyError.
+    Un posto resta occupato finché il task non termina davvero, anche se
+    il chiamante ha smesso di aspettarlo per timeout.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()  # contatori aggiornati da più thread di richiesta
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def start(self) -> None:
+        """Avvia i processi subito: il primo login non paga lo spawn."""
+        if not self.enabled:
+            return
+        pool = self._ensure_pool()
+        try:
+            for future in [pool.submit(_warmup) for _ in range(self.workers)]:
+                future.result()
+        except Exception:
+            # Niente pool a metà: il primo run ne ricrea uno
+            self.stop()
+            raise
+        logger.info("Executor di hashing avviato: %s processi, max %s in attesa", self.workers, self.max_pending)
+
+    def stop(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def run(self, fn, *args):
+        if not self.enabled:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._rejected += 1
+            raise HashingBusyError(AuthConfig.HASH_RETRY_AFTER_SECONDS)
+        with self._stats_lock:
+            self._pending += 1
+        try:
+            pool = self._ensure_pool()
+            future = pool.submit(fn, *args)
+        except BaseException as exc:
+            self._release_slot()
+            if isinstance(exc, BrokenProcessPool):
+                self._discard_pool(pool)
+                raise HashingBusyError(AuthConfig.HASH_RETRY_AFTER_SECONDS) from exc
+            raise
+        future.add_done_callback(self._release_slot)
+
+        try:
+            result = future.result(timeout=AuthConfig.HASH_TIMEOUT_SECONDS)
+        except TimeoutError:
+            # Ancora in coda: non parte più. Già in esecuzione: il posto si
+            # libera quando finisce, non adesso
+            future.cancel()
+            with self._stats_lock:
+                self._timeouts += 1
+            logger.warning("Hashing oltre %ss: richiesta abbandonata", AuthConfig.HASH_TIMEOUT_SECONDS)
+            raise HashingBusyError(AuthConfig.HASH_RETRY_AFTER_SECONDS) from None
+        except BrokenProcessPool as exc:
+            # Un processo è morto (es. OOM): il prossimo run ricrea il pool
+            self._discard_pool(pool)
+            raise HashingBusyError(AuthConfig.HASH_RETRY_AFTER_SECONDS) from exc
+        with self._stats_lock:
+            self._completed += 1
+        return result
+
+    def metrics(self) -> dict:
+        with self._stats_lock:
+            return {
+                "enabled": self.enabled,
+                "workers": self.workers,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "timeouts": self._timeouts,
+            }
+
+    def _release_slot(self, _future: Future | None = None) -> None:
+        with self._stats_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def _discard_pool(self, pool: ProcessPoolExecutor) -> None:
+        """Dimentica il pool rotto, se nel frattempo nessuno l'ha già sostituito."""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: niente fork di un processo con thread e connessioni aperte
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+
+hashing_executor = HashingExecutor(AuthConfig.HASH_WORKERS, AuthConfig.HASH_MAX_PENDING)
+
+
 def hash_password(password: str) -> str:
     """
     Hash una password usando Argon2.
@@ -30,6 +202,7 @@ def hash_password(password: str) -> str:
         
     Raises:
         ValueError: Se la password è vuota o None
+        HashingBusyError: Se la coda di hashing è piena, in timeout o il pool è caduto
     """
     if not password or not isinstance(password, str):
         logger.warning("Tentativo di hashare una password non valida")
@@ -37,18 +210,20 @@ def hash_password(password: str) -> str:
     
     if len(password) < AuthConfig.PASSWORD_MIN_LENGTH:
         logger.warning(
-            f"Password troppo corta: {len(password)} < {AuthConfig.PASSWORD_MIN_LENGTH}"
+            "Password troppo corta: %s < %s", len(password), AuthConfig.PASSWORD_MIN_LENGTH
         )
         raise ValueError(
             f"Password deve essere lunga almeno {AuthConfig.PASSWORD_MIN_LENGTH} caratteri"
         )
     
     try:
-        hashed = pwd_context.hash(password)
+        hashed = hashing_executor.run(_hash, password)
         logger.debug("Password hashata con successo")
         return hashed
+    except HashingBusyError:
+        raise
     except Exception as e:
-        logger.error(f"Errore durante l'hashing della password: {str(e)}")
+        logger.error("Errore durante l'hashing della password: %s", e)
         raise
 
 
@@ -62,13 +237,16 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         
     Returns:
         True se le password corrispondono, False altrimenti
+        
+    Raises:
+        HashingBusyError: Se la coda di hashing è piena, in timeout o il pool è caduto
     """
     if not plain_password or not hashed_password:
         logger.warning("Tentativo di verificare password o hash vuoti")
         return False
     
     try:
-        is_valid = pwd_context.verify(plain_password, hashed_password)
+        is_valid = hashing_executor.run(_verify, plain_password, hashed_password)
         
         if is_valid:
             logger.debug("Password verificata con successo")
@@ -76,8 +254,10 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
             logger.warning("Password non corrisponde all'hash")
         
         return is_valid
+    except HashingBusyError:
+        raise
     except Exception as e:
-        logger.error(f"Errore durante la verifica della password: {str(e)}")
+        logger.error("Errore durante la verifica della password: %s", e)
         return False
 
 
@@ -94,5 +274,67 @@ def needs_password_rehash(hashed_password: str) -> bool:
     try:
         return pwd_context.needs_update(hashed_password)
     except Exception as e:
-        logger.error(f"Errore nel controllare se il rehashing è necessario: {str(e)}")
+        logger.error("Errore nel controllare se il rehashing è necessario: %s", e)
         return False
+
+
+# ──────────────────────────────────────────────
+# CALIBRATION
+# ──────────────────────────────────────────────
+def measure_ms(context: CryptContext, samples: int = 3) -> float:
+    """Mediana del tempo di hash (ms) con i parametri del contesto."""
+    import statistics
+    import time
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.hash("calibrazione-password")
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate(target_ms: float, memory_kib: int, parallelism: int, min_memory_kib: int = 19456) -> tuple[int, int, float]:
+    """
+    Parametri più costosi che restano entro target_ms su questo host:
+    a memoria fissa sale con le iterazioni; se già una iterazione supera
+    il target dimezza la memoria (non sotto min_memory_kib, minimo OWASP).
+    Ritorna (time_cost, memory_kib, ms misurati).
+    """
+    while True:
+        best = None
+        time_cost = 1
+        while True:
+            ms = measure_ms(build_context(time_cost, memory_kib, parallelism))
+            if ms > target_ms:
+                break
+            best = (time_cost, memory_kib, ms)
+            time_cost += 1
+        if best is not None:
+            return best
+        if memory_kib // 2 < min_memory_kib:
+            return 1, memory_kib, ms
+        memory_kib //= 2
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Taratura dei parametri Argon2 per una latenza obiettivo")
+    parser.add_argument("--calibrate", action="store_true", help="misura e stampa i parametri consigliati")
+    parser.add_argument("--target-ms", type=float, default=250.0, help="latenza massima di un hash")
+    parser.add_argument("--memory-kib", type=int, default=AuthConfig.ARGON2_MEMORY_KIB)
+    parser.add_argument("--parallelism", type=int, default=AuthConfig.ARGON2_PARALLELISM)
+    args = parser.parse_args()
+
+    current = measure_ms(pwd_context)
+    print(
+        f"Attuale: t={AuthConfig.ARGON2_TIME_COST}, m={AuthConfig.ARGON2_MEMORY_KIB} KiB, "
+        f"p={AuthConfig.ARGON2_PARALLELISM} → {current:.0f} ms"
+    )
+    if args.calibrate:
+        time_cost, memory_kib, ms = calibrate(args.target_ms, args.memory_kib, args.parallelism)
+        print(f"Consigliato per {args.target_ms:.0f} ms → {ms:.0f} ms. Nel .env:")
+        print(f"ARGON2_TIME_COST={time_cost}")
+        print(f"ARGON2_MEMORY_KIB={memory_kib}")
+        print(f"ARGON2_PARALLELISM={args.parallelism}")
+        print("Gli hash esistenti vengono aggiornati al prossimo login.")
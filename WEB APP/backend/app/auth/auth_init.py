@@ -6,7 +6,9 @@ Centralizza tutte le esportazioni del modulo di autenticazione.
 # Import dalle dipendenze interne
 from app.auth.auth_hashing import hash_password, verify_password
 from app.auth.auth_tokens import create_access_token, verify_token
-from app.auth.auth_dependencies import get_current_user, get_current_user_optional
+from app.auth.auth_cache import Principal, principal_cache
+from app.auth.auth_revocation import revocation_store
+from app.auth.auth_dependencies import get_current_admin, get_current_user, get_current_user_async, get_current_user_optional
 from app.auth.auth_service import register_user, login_user
 from app.auth.auth_logger import logger
 from app.auth.auth_config import config
@@ -21,9 +23,18 @@ __all__ = [
     "create_access_token",
     "verify_token",
     
+    # Principal cache
+    "Principal",
+    "principal_cache",
+    
+    # Revoca dei token
+    "revocation_store",
+    
     # Dependencies
     "get_current_user",
+    "get_current_user_async",
     "get_current_user_optional",
+    "get_current_admin",
     
     # Service
     "register_user",
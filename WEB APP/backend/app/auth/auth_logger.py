@@ -1,30 +1,121 @@
 """
 Logger strutturato per l'autenticazione.
 Usa il modulo logging di Python per registrare eventi in modo professionale.
+
+Il thread della richiesta non formatta né scrive: i record passano da un
+QueueHandler a un QueueListener che li formatta (JSON, una riga per record)
+e li scrive su file e console in un thread separato. Prima di entrare in
+coda:
+- il livello del logger (LOG_LEVEL, default INFO) scarta i record prima che
+  vengano creati; i messaggi usano lo stile %-args, così gli argomenti non
+  vengono formattati se il livello è filtrato;
+- i record DEBUG dei logger in LOG_SAMPLE_RATES (prefisso=frazione)
+  vengono campionati, es. LOG_SAMPLE_RATES=mare_calmo.auth.tokens=0.01.
 """
+import atexit
+import json
 import logging
 import logging.handlers
 import os
-from datetime import datetime
+import queue
+import random
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+LOG_SAMPLE_RATES = os.getenv(
+    "LOG_SAMPLE_RATES", "mare_calmo.auth.tokens=0.01,mare_calmo.auth.dependencies=0.01"
+)
+
+# Attributi standard di LogRecord: il resto viene da extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Un oggetto JSON per riga: ts, level, logger, message, campi extra, exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Tiene una frazione dei record sotto max_level, per prefisso del nome del logger."""
+
+    def __init__(self, rates: dict[str, float], max_level: int = logging.DEBUG):
+        super().__init__()
+        # Prefissi più lunghi prima: vince la regola più specifica
+        self.rates = sorted(rates.items(), key=lambda item: -len(item[0]))
+        self.max_level = max_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                return random.random() < rate
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler che non formatta nel thread chiamante: la coda è in
+    processo, quindi il record (msg + args) arriva intatto al listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    """'nome=0.1,altro=0.5' → {'nome': 0.1, 'altro': 0.5}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
 
 
-def setup_auth_logger(name: str = "mare_calmo.auth") -> logging.Logger:
+def setup_auth_logger(
+    name: str = "mare_calmo.auth",
+    level: str = LOG_LEVEL,
+    sample_rates: str = LOG_SAMPLE_RATES,
+    json_output: bool = LOG_FORMAT == "json",
+    logs_dir: str = os.path.join(os.path.dirname(__file__), "../../logs"),
+) -> tuple[logging.Logger, logging.handlers.QueueListener | None]:
     """
     Configura un logger strutturato per l'autenticazione.
-    
+
     Args:
         name: Nome del logger (es. "mare_calmo.auth")
-        
+        level: Livello minimo (i record sotto non vengono creati)
+        sample_rates: Campionamento per logger, "prefisso=frazione,..."
+        json_output: JSON per riga (altrimenti testo)
+        logs_dir: Cartella di auth.log
+
     Returns:
-        Logger configurato
+        Logger configurato e QueueListener avviato (None se già configurato)
     """
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    
+    logger.setLevel(level)
+
+    # Aggiungi handler se non già presenti
+    if logger.handlers:
+        return logger, None
+
     # Crea directory logs se non esiste
-    logs_dir = os.path.join(os.path.dirname(__file__), "../../logs")
     os.makedirs(logs_dir, exist_ok=True)
-    
+
     # File handler con rotazione
     log_file = os.path.join(logs_dir, "auth.log")
     file_handler = logging.handlers.RotatingFileHandler(
@@ -33,26 +124,47 @@ def setup_auth_logger(name: str = "mare_calmo.auth") -> logging.Logger:
         backupCount=5
     )
     file_handler.setLevel(logging.DEBUG)
-    
+
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
-    
+
     # Formatter
-    formatter = logging.Formatter(
-        fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
+    if json_output:
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
-    
-    # Aggiungi handler se non già presenti
-    if not logger.handlers:
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
-    
-    return logger
+
+    # Richiesta → coda; formattazione e I/O nel thread del listener
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(sample_rates)))
+    logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    listener.start()
+    # Alla chiusura il listener scrive quanto resta in coda
+    atexit.register(stop_listener, listener)
+    return logger, listener
+
+
+def stop_listener(listener: logging.handlers.QueueListener) -> None:
+    """Svuota la coda e ferma il listener; nessun effetto se già fermo."""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def get_auth_logger(component: str) -> logging.Logger:
+    """Logger figlio (es. mare_calmo.auth.tokens): stessi handler, campionamento proprio."""
+    return logger.getChild(component)
 
 
 # Logger singleton
-logger = setup_auth_logger()
+logger, log_listener = setup_auth_logger()
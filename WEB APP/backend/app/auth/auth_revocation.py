@@ -0,0 +1,212 @@
+"""
+Revoca dei token per jti (logout).
+
+Ogni token porta un claim jti casuale. Il logout salva (jti, scadenza)
+nella tabella revoked_tokens e in un Bloom filter in memoria. verify_token
+chiede a is_revoked: se il filtro risponde "assente" (il caso comune) la
+risposta è certa con una sola lookup in memoria; solo sui positivi (token
+revocati davvero o falsi positivi, circa REVOCATION_BLOOM_ERROR_RATE) legge
+la tabella.
+
+Un Bloom filter non supporta cancellazioni: un thread ogni
+REVOCATION_SYNC_SECONDS aggiunge le revoche fatte da altri processi e ogni
+REVOCATION_GC_SECONDS cancella le righe scadute e ricostruisce il filtro
+con quelle rimaste. Con REVOCATION_SYNC_SECONDS=0 (un solo processo) la
+pulizia avviene solo all'avvio.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.db.database import ReadSessionLocal, SessionLocal
+from app.models.models import RevokedToken, as_utc, utcnow
+from .auth_cache import principal_cache
+from .auth_config import AuthConfig
+from .auth_logger import get_auth_logger
+
+logger = get_auth_logger("revocation")
+
+
+class BloomFilter:
+    """Bloom filter su bytearray: k posizioni per chiave con doppio hashing."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+
+class RevocationStore:
+    """Filtro in memoria davanti alla tabella revoked_tokens."""
+
+    def __init__(
+        self,
+        capacity: int = AuthConfig.REVOCATION_BLOOM_CAPACITY,
+        error_rate: float = AuthConfig.REVOCATION_BLOOM_ERROR_RATE,
+        sync_seconds: float = AuthConfig.REVOCATION_SYNC_SECONDS,
+        gc_seconds: float = AuthConfig.REVOCATION_GC_SECONDS,
+        session_factory=SessionLocal,
+        read_session_factory=ReadSessionLocal,
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_seconds = sync_seconds
+        self.gc_seconds = gc_seconds
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+
+        self._filter: Optional[BloomFilter] = None
+        self._synced_until: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._checks = 0
+        self._table_checks = 0
+        self._false_positives = 0
+        self._rejected = 0
+
+    # ── lettura ────────────────────────────────────
+    def is_revoked(self, jti: str) -> bool:
+        """True se il token è revocato; la tabella solo se il filtro risponde "forse"."""
+        self._checks += 1
+        if jti not in self._ensure_filter():
+            return False
+        self._table_checks += 1
+        with self.read_session_factory() as db:
+            revoked = db.get(RevokedToken, jti) is not None
+        if revoked:
+            self._rejected += 1
+        else:
+            self._false_positives += 1
+        return revoked
+
+    # ── scrittura ──────────────────────────────────
+    def revoke(self, db: Session, jti: str, expires_at: datetime) -> None:
+        """Registra la revoca (commit sulla sessione data) e la aggiunge al filtro."""
+        if expires_at <= utcnow():
+            return  # già scaduto: verify_token lo rifiuta comunque
+        db.merge(RevokedToken(jti=jti, expires_at=expires_at, revoked_at=utcnow()))
+        db.commit()
+        self._ensure_filter()
+        with self._lock:
+            self._filter.add(jti)
+
+    # ── manutenzione ───────────────────────────────
+    def start(self) -> None:
+        """Pulizia e caricamento del filtro; avvia il thread di sincronizzazione."""
+        self.collect_garbage()
+        if self.sync_seconds > 0 and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="token-revocation", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def collect_garbage(self) -> int:
+        """Cancella le revoche scadute e ricostruisce il filtro. Ritorna le righe cancellate."""
+        with self.session_factory() as db:
+            deleted = db.execute(delete(RevokedToken).where(RevokedToken.expires_at <= utcnow())).rowcount
+            db.commit()
+        self._rebuild()
+        if deleted:
+            logger.info("Revoche scadute rimosse: %s", deleted)
+        return deleted
+
+    def sync(self) -> int:
+        """Aggiunge al filtro le revoche registrate da altri processi dopo l'ultima lettura."""
+        if self._filter is None:
+            self._rebuild()
+            return 0
+        # Sovrapposizione di un intervallo: orologi di altri host un po' indietro
+        since = self._synced_until - timedelta(seconds=self.sync_seconds)
+        with self.read_session_factory() as db:
+            rows = db.execute(
+                select(RevokedToken.jti, RevokedToken.revoked_at)
+                .where(RevokedToken.revoked_at >= since)
+            ).all()
+        with self._lock:
+            bloom = self._filter
+            for jti, revoked_at in rows:
+                if jti not in bloom:
+                    bloom.add(jti)
+                # Con la voce in cache il token salterebbe verify_token fino al TTL
+                principal_cache.invalidate_jti(jti)
+                self._synced_until = max(self._synced_until, as_utc(revoked_at))
+        if bloom.count > bloom.capacity:
+            self._rebuild()  # oltre la capacità i falsi positivi crescono
+        return len(rows)
+
+    def metrics(self) -> dict:
+        bloom = self._filter
+        return {
+            "entries": bloom.count if bloom else 0,
+            "filter_bytes": bloom.nbytes if bloom else 0,
+            "checks": self._checks,
+            "table_checks": self._table_checks,
+            "false_positives": self._false_positives,
+            "rejected": self._rejected,
+        }
+
+    def _run(self) -> None:
+        last_gc = time.monotonic()
+        while not self._stop.wait(self.sync_seconds):
+            try:
+                if self.gc_seconds > 0 and time.monotonic() - last_gc >= self.gc_seconds:
+                    self.collect_garbage()
+                    last_gc = time.monotonic()
+                else:
+                    self.sync()
+            except Exception as e:
+                logger.error("Errore nella sincronizzazione delle revoche: %s", e)
+
+    def _rebuild(self) -> None:
+        """Nuovo filtro con le revoche in tabella, dimensionato con margine."""
+        # Sotto lock: una revoke() locale o è già in tabella o attende il nuovo filtro
+        with self._lock:
+            started = utcnow()
+            with self.read_session_factory() as db:
+                jtis = db.execute(select(RevokedToken.jti)).scalars().all()
+            bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+            for jti in jtis:
+                bloom.add(jti)
+            self._filter = bloom
+            self._synced_until = started
+
+    def _ensure_filter(self) -> BloomFilter:
+        if self._filter is None:
+            self._rebuild()
+        return self._filter
+
+
+revocation_store = RevocationStore()
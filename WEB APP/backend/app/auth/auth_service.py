@@ -6,15 +6,17 @@ Migliorato con validazione input, logging, e error handling robusto.
 from typing import Dict, Any
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 from app.models.models import User, Fish, FishState, SeaState
-from .auth_hashing import hash_password, verify_password
+from .auth_hashing import HashingBusyError, hash_password, needs_password_rehash, verify_password
 from .auth_tokens import create_access_token
-from .auth_logger import logger
+from .auth_logger import get_auth_logger
 from .auth_config import AuthConfig
 
+logger = get_auth_logger("service")
+
 
 # Dimensioni di default per i pesci
 DEFAULT_FISH_DIMENSIONS = ["studio", "lavoro", "benessere"]
@@ -35,6 +37,16 @@ class InvalidCredentialsError(AuthenticationError):
     pass
 
 
+def hashing_busy(e: HashingBusyError) -> HTTPException:
+    """503 con Retry-After quando la coda di hashing è piena."""
+    logger.warning("Coda di hashing piena: richiesta rifiutata")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Servizio momentaneamente occupato. Riprova tra poco.",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
 def validate_email(email: str) -> bool:
     """
     Valida il formato di un'email.
@@ -98,7 +110,7 @@ def register_user(
         UserAlreadyExistsError: Se email già registrata
         AuthenticationError: Se errori di validazione o database
     """
-    logger.info(f"Inizio registrazione utente: {email}")
+    logger.info("Inizio registrazione utente: %s", email)
     
     # Validazione input
     if not email or not email.strip():
@@ -108,33 +120,37 @@ def register_user(
     email = email.strip().lower()
     
     if not validate_email(email):
-        logger.warning(f"Email non valida: {email}")
+        logger.warning("Email non valida: %s", email)
         raise AuthenticationError("Email non valida")
     
     is_valid_pwd, pwd_error = validate_password(password)
     if not is_valid_pwd:
-        logger.warning(f"Password non valida per {email}: {pwd_error}")
+        logger.warning("Password non valida per %s: %s", email, pwd_error)
         raise AuthenticationError(pwd_error)
     
     try:
+        # Hash prima di toccare il database: la sessione non tiene una
+        # connessione mentre Argon2 lavora
+        hashed_password = hash_password(password)
+        
         # Verifica se email esiste già
         existing_user = db.execute(
             select(User).where(User.email == email)
         ).scalars().first()
         
         if existing_user:
-            logger.warning(f"Email già registrata: {email}")
+            logger.warning("Email già registrata: %s", email)
             raise UserAlreadyExistsError("Email già registrata")
         
         # Crea l'utente
         user = User(
             email=email,
-            hashed_password=hash_password(password),
+            hashed_password=hashed_password,
             locale=locale,
         )
         db.add(user)
         db.flush()  # Ottieni user.id senza commit
-        logger.info(f"User creato: {user.id} ({email})")
+        logger.info("User creato: %s (%s)", user.id, email)
         
         # Crea i 3 pesci iniziali
         for dimension in DEFAULT_FISH_DIMENSIONS:
@@ -146,9 +162,9 @@ def register_user(
                 # Crea lo stato del pesce
                 fish_state = FishState(fish_id=fish.id)
                 db.add(fish_state)
-                logger.debug(f"Fish creato: {fish.id} (dimensione: {dimension})")
+                logger.debug("Fish creato: %s (dimensione: %s)", fish.id, dimension)
             except Exception as e:
-                logger.error(f"Errore nella creazione del pesce {dimension}: {str(e)}")
+                logger.error("Errore nella creazione del pesce %s: %s", dimension, e)
                 db.rollback()
                 raise AuthenticationError(f"Errore nella creazione dei dati iniziali")
         
@@ -165,16 +181,16 @@ def register_user(
                 },
             )
             db.add(sea_state)
-            logger.debug(f"SeaState creato per user_id: {user.id}")
+            logger.debug("SeaState creato per user_id: %s", user.id)
         except Exception as e:
-            logger.error(f"Errore nella creazione del sea_state: {str(e)}")
+            logger.error("Errore nella creazione del sea_state: %s", e)
             db.rollback()
             raise AuthenticationError("Errore nella creazione dello stato del mare")
         
         # Commit di tutti i dati
         db.commit()
         db.refresh(user)
-        logger.info(f"Registrazione completata: {email}")
+        logger.info("Registrazione completata: %s", email)
         
         # Genera il token
         token = create_access_token({"email": user.email})
@@ -191,6 +207,9 @@ def register_user(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email già registrata. Accedi con il tuo account.",
         )
+    except HashingBusyError as e:
+        db.rollback()
+        raise hashing_busy(e)
     except AuthenticationError as e:
         db.rollback()
         raise HTTPException(
@@ -199,21 +218,21 @@ def register_user(
         )
     except IntegrityError as e:
         db.rollback()
-        logger.error(f"IntegrityError durante registrazione: {str(e)}")
+        logger.error("IntegrityError durante registrazione: %s", e)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Errore di validazione dei dati. Email potrebbe già essere registrata.",
         )
     except SQLAlchemyError as e:
         db.rollback()
-        logger.error(f"Database error durante registrazione: {str(e)}")
+        logger.error("Database error durante registrazione: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Errore nel database durante la registrazione.",
         )
     except Exception as e:
         db.rollback()
-        logger.error(f"Errore inaspettato durante registrazione: {type(e).__name__}: {str(e)}")
+        logger.error("Errore inaspettato durante registrazione: %s: %s", type(e).__name__, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Errore interno durante la registrazione.",
@@ -240,7 +259,7 @@ def login_user(
         InvalidCredentialsError: Se credenziali non valide
         AuthenticationError: Se errori di database
     """
-    logger.info(f"Inizio login: {email}")
+    logger.info("Inizio login: %s", email)
     
     # Validazione input
     if not email or not email.strip():
@@ -250,20 +269,38 @@ def login_user(
     email = email.strip().lower()
     
     if not password:
-        logger.warning(f"Password vuota fornita nel login per: {email}")
+        logger.warning("Password vuota fornita nel login per: %s", email)
         raise AuthenticationError("Password è richiesta")
     
     try:
         # Trova l'utente
-        stmt = select(User).where(User.email == email)
-        user = db.execute(stmt).scalars().first()
+        stmt = select(User.id, User.email, User.hashed_password).where(User.email == email)
+        user = db.execute(stmt).first()
+        # Fine della lettura: la connessione torna al pool mentre Argon2 lavora
+        db.rollback()
         
         # Verifica password
         if not user or not verify_password(password, user.hashed_password):
-            logger.warning(f"Login fallito - credenziali non valide per: {email}")
+            logger.warning("Login fallito - credenziali non valide per: %s", email)
             raise InvalidCredentialsError("Email o password non valide")
         
-        logger.info(f"Login completato: {email}")
+        # Hash con parametri Argon2 superati: aggiornato ora che la password è nota
+        if needs_password_rehash(user.hashed_password):
+            try:
+                new_hash = hash_password(password)
+            except HashingBusyError:
+                new_hash = None  # il login riesce comunque; si riprova al prossimo
+            if new_hash:
+                db.execute(
+                    update(User)
+                    .where(User.id == user.id)
+                    .where(User.hashed_password == user.hashed_password)
+                    .values(hashed_password=new_hash)
+                )
+                db.commit()
+                logger.info("Hash della password aggiornato per: %s", email)
+        
+        logger.info("Login completato: %s", email)
         
         # Genera il token
         token = create_access_token({"email": user.email})
@@ -280,19 +317,21 @@ def login_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email o password non valide.",
         )
+    except HashingBusyError as e:
+        raise hashing_busy(e)
     except AuthenticationError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e),
         )
     except SQLAlchemyError as e:
-        logger.error(f"Database error durante login: {str(e)}")
+        logger.error("Database error durante login: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Errore nel database durante il login.",
         )
     except Exception as e:
-        logger.error(f"Errore inaspettato durante login: {type(e).__name__}: {str(e)}")
+        logger.error("Errore inaspettato durante login: %s: %s", type(e).__name__, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Errore interno durante il login.",
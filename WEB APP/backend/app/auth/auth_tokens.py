@@ -2,13 +2,18 @@
 JWT Token Module
 Crea e verifica JWT tokens per l'autenticazione.
 Supporta sia access token che refresh token.
+Ogni token ha un jti: il logout lo revoca (vedi auth_revocation.py).
 """
+import secrets
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any
 from jose import jwt, JWTError
 
 from .auth_config import AuthConfig
-from .auth_logger import logger
+from .auth_logger import get_auth_logger
+from .auth_revocation import revocation_store
+
+logger = get_auth_logger("tokens")
 
 
 def create_access_token(
@@ -48,7 +53,8 @@ def create_access_token(
         
         to_encode.update({
             "exp": expire,
-            "iat": datetime.now(timezone.utc)
+            "iat": datetime.now(timezone.utc),
+            "jti": secrets.token_urlsafe(16),
         })
         
         # Codifica il token
@@ -58,11 +64,11 @@ def create_access_token(
             algorithm=AuthConfig.ALGORITHM
         )
         
-        logger.info(f"Access token creato per: {data.get('email')}")
+        logger.info("Access token creato per: %s", data.get('email'))
         return encoded_jwt
         
     except Exception as e:
-        logger.error(f"Errore nella generazione del token: {str(e)}")
+        logger.error("Errore nella generazione del token: %s", e)
         raise RuntimeError(f"Errore nella generazione del token: {str(e)}")
 
 
@@ -88,7 +94,7 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
         token: JWT token da verificare
         
     Returns:
-        Dict con il payload se valido, None altrimenti
+        Dict con email, exp e jti se valido, None altrimenti (anche se revocato)
     """
     if not token or not isinstance(token, str):
         logger.warning("Tentativo di verificare token non valido")
@@ -106,14 +112,20 @@ def verify_token(token: str) -> Optional[Dict[str, Any]]:
             logger.warning("Email non trovata nel token")
             return None
         
-        logger.debug(f"Token verificato per: {email}")
-        return {"email": email}
+        # Una lookup nel Bloom filter; la tabella solo sui positivi
+        jti = payload.get("jti")
+        if jti and revocation_store.is_revoked(jti):
+            logger.warning("Token revocato per: %s", email)
+            return None
+        
+        logger.debug("Token verificato per: %s", email)
+        return {"email": email, "exp": payload.get("exp"), "jti": jti}
         
     except JWTError as e:
-        logger.warning(f"Token JWT non valido: {str(e)}")
+        logger.warning("Token JWT non valido: %s", e)
         return None
     except Exception as e:
-        logger.error(f"Errore non previsto nella verifica del token: {str(e)}")
+        logger.error("Errore non previsto nella verifica del token: %s", e)
         return None
 
 
@@ -142,7 +154,7 @@ def is_token_expired(token: str) -> bool:
         is_expired = datetime.now(timezone.utc) > exp_datetime
         
         if is_expired:
-            logger.info(f"Token scaduto per: {payload.get('email')}")
+            logger.info("Token scaduto per: %s", payload.get('email'))
         
         return is_expired
         
@@ -172,5 +184,5 @@ def decode_token_no_verify(token: str) -> Optional[Dict[str, Any]]:
         )
         return payload
     except Exception as e:
-        logger.error(f"Errore nel decodificare il token: {str(e)}")
+        logger.error("Errore nel decodificare il token: %s", e)
         return None
@@ -1,18 +1,101 @@
 """
 Database configuration — SQLite (lightweight, no Docker needed)
+
+Percorso sync (Session) sempre disponibile. Con DB_ASYNC=1 l'auth e le
+route calde usano un AsyncSession sullo stesso database: il driver async
+è configurabile con ASYNC_DATABASE_URL (per SQLite serve aiosqlite).
+
+Con SQLITE_PROFILE=production ogni connessione riceve i pragma di
+produzione (WAL, synchronous=NORMAL, mmap, cache, busy_timeout,
+temp_store) e le letture passano da un pool di connessioni read-only
+(ReadSessionLocal / get_read_db), mentre le scritture usano un'unica
+connessione dedicata (SessionLocal / get_db): i writer si mettono in coda
+sul pool invece di contendersi il lock del file.
 """
-from sqlalchemy import create_engine
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
 DATABASE_URL = "sqlite:///./mare_calmo.db"
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "sqlite+aiosqlite:///./mare_calmo.db")
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+
+SQLITE_PRODUCTION = os.getenv("SQLITE_PROFILE", "default") == "production"
+SQLITE_READERS = int(os.getenv("SQLITE_READERS", "8"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_KIB = int(os.getenv("SQLITE_CACHE_KIB", str(64 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def apply_sqlite_pragmas(engine, read_only: bool = False) -> None:
+    """
+    Pragma di produzione su ogni nuova connessione dell'engine.
+    journal_mode=WAL è persistente nel file: lo imposta il writer (init_db
+    apre per prima una sua connessione); i reader aggiungono query_only.
+    """
+    @event.listens_for(engine, "connect")
+    def _pragmas(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        if not read_only:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")  # con WAL: fsync ai checkpoint, non a ogni commit
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KIB}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},  # needed for SQLite + FastAPI
-    echo=False,
-)
+if SQLITE_PRODUCTION:
+    # Un solo writer: le scritture attendono la connessione sul pool
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=1,
+        max_overflow=0,
+        echo=False,
+    )
+    read_engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},
+        pool_size=SQLITE_READERS,
+        max_overflow=0,
+        echo=False,
+    )
+    apply_sqlite_pragmas(engine)
+    apply_sqlite_pragmas(read_engine, read_only=True)
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False},  # needed for SQLite + FastAPI
+        echo=False,
+    )
+    read_engine = engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Engine async (opzionale): senza il driver si resta sul percorso sync
+try:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    if SQLITE_PRODUCTION and async_engine.dialect.name == "sqlite":
+        apply_sqlite_pragmas(async_engine.sync_engine)
+except ImportError:
+    async_engine = None
+    AsyncSessionLocal = None
+    if DB_ASYNC:
+        print("DB_ASYNC=1 ma il driver async non è installato (pip install aiosqlite). Uso il percorso sync.")
+
+ASYNC_DB_ENABLED = DB_ASYNC and AsyncSessionLocal is not None
+_sqlite_write_lock = asyncio.Lock()
 
 
 class Base(DeclarativeBase):
@@ -27,6 +110,82 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    """Sessione per le sole letture (pool read-only nel profilo production)."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def check_database() -> dict:
+    """SELECT 1 sul pool di lettura (non accoda dietro al writer): stato e latenza."""
+    started = time.perf_counter()
+    try:
+        with read_engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+    return {"status": "connected", "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+@asynccontextmanager
+async def write_transaction(db):
+    """
+    Transazione di scrittura di una sessione async, con commit all'uscita.
+
+    Su SQLite c'è un solo writer alla volta: i writer async si mettono in
+    coda su un lock asyncio (attesa sul loop, in ordine) e aprono la
+    transazione con BEGIN IMMEDIATE, così il lock del file si prende
+    subito invece che a metà transazione, dove due writer concorrenti
+    andrebbero in deadlock ("database is locked").
+    """
+    if db.bind.dialect.name != "sqlite":
+        yield
+        await db.commit()
+        return
+    async with _sqlite_write_lock:
+        await db.execute(text("BEGIN IMMEDIATE"))
+        yield
+        await db.commit()
+
+
+def add_missing_columns():
+    """
+    Aggiunge ai DB già esistenti le colonne nuove dei modelli.
+    create_all() crea solo le tabelle mancanti, non altera quelle esistenti.
+    """
+    with engine.begin() as conn:
+        # Ispezione sulla stessa connessione: il writer può averne una sola
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                ))
+
+
+def add_missing_indexes():
+    """Crea gli indici dei modelli assenti nelle tabelle già esistenti."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
 def init_db():
     """Create all tables."""
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    add_missing_indexes()
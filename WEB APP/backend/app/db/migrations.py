@@ -0,0 +1,122 @@
+"""
+Migrazioni dati — riempie le colonne aggiunte ai database già esistenti.
+
+init_db() crea le colonne e gli indici mancanti; qui si calcolano i
+valori per le righe scritte prima che le colonne esistessero.
+
+Da eseguire prima di avviare il backend su un database esistente: senza
+watermark last_event_seq la crescita riassorbirebbe tutto lo storico.
+
+Run:
+    python -m app.db.migrations
+"""
+from sqlalchemy import MetaData, Table, and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models.models import Event, Fish, FishState, event_hot_columns, next_event_seq
+
+
+def backfill_event_columns(db: Session, batch_size: int = 5000) -> int:
+    """
+    Estrae fish_id, anxiety_level e dimension da metadata_json per gli
+    eventi esistenti. Idempotente; procede a pagine ordinate per id.
+    Ritorna il numero di eventi aggiornati.
+    """
+    updated = 0
+    last_id = ""
+    while True:
+        rows = db.execute(
+            select(Event.id, Event.metadata_json)
+            .where(Event.id > last_id)
+            .order_by(Event.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        changes = []
+        for event_id, metadata in rows:
+            columns = event_hot_columns(metadata)
+            if any(value is not None for value in columns.values()):
+                changes.append({"id": event_id, **columns})
+        if changes:
+            db.execute(update(Event), changes)
+            updated += len(changes)
+        db.commit()
+
+    return updated
+
+
+def backfill_event_seq(db: Session, batch_size: int = 5000) -> int:
+    """
+    Assegna Event.seq agli eventi scritti prima della colonna, in ordine
+    (created_at, id), dopo i valori già riservati. Idempotente.
+    Ritorna il numero di eventi aggiornati.
+    """
+    updated = 0
+    while True:
+        ids = db.execute(
+            select(Event.id)
+            .where(Event.seq.is_(None))
+            .order_by(Event.created_at, Event.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+
+        first = next_event_seq(db.connection(), len(ids))
+        db.execute(update(Event), [{"id": event_id, "seq": first + n} for n, event_id in enumerate(ids)])
+        db.commit()
+        updated += len(ids)
+
+    return updated
+
+
+def backfill_growth_watermarks(db: Session) -> int:
+    """
+    Converte i vecchi watermark (last_event_at, last_event_id) in
+    last_event_seq: il seq più alto tra gli eventi dell'utente fino a quel
+    punto in ordine (created_at, id). Da eseguire dopo backfill_event_seq.
+    Ritorna il numero di pesci aggiornati.
+    """
+    legacy = Table(FishState.__tablename__, MetaData(), autoload_with=db.connection())
+    if "last_event_at" not in legacy.c:
+        return 0  # database creato dopo l'introduzione di Event.seq
+
+    rows = db.execute(
+        select(legacy.c.fish_id, Fish.user_id, legacy.c.last_event_at, legacy.c.last_event_id)
+        .join(Fish, Fish.id == legacy.c.fish_id)
+        .where(legacy.c.last_event_seq.is_(None))
+        .where(legacy.c.last_event_at.is_not(None))
+    ).all()
+    for fish_id, user_id, last_event_at, last_event_id in rows:
+        seq = db.execute(
+            select(func.max(Event.seq))
+            .where(Event.user_id == user_id)
+            .where(or_(
+                Event.created_at < last_event_at,
+                and_(Event.created_at == last_event_at, Event.id <= last_event_id),
+            ))
+        ).scalar()
+        # Nessun evento caldo prima del watermark: erano tutti archiviati
+        db.execute(update(FishState).where(FishState.fish_id == fish_id).values(last_event_seq=seq or 0))
+    db.commit()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    from app.db.database import SessionLocal, init_db
+    from app.services.daily_stats import backfill_daily_stats
+
+    init_db()
+    db = SessionLocal()
+    events = backfill_event_columns(db)
+    print(f"✅ Colonne evento popolate: {events} eventi")
+    sequenced = backfill_event_seq(db)
+    print(f"✅ Ordine di inserimento assegnato: {sequenced} eventi")
+    watermarks = backfill_growth_watermarks(db)
+    print(f"✅ Watermark di crescita convertiti: {watermarks} pesci")
+    days = backfill_daily_stats(db)
+    print(f"✅ Rollup giornaliero ricostruito: {days} righe (utente, giorno)")
+    db.close()
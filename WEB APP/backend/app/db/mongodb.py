@@ -4,15 +4,44 @@ MongoDB Integration — Analytics & Data Export
 Optional MongoDB connection per analytics e insights.
 Se MongoDB non è disponibile, il sistema funziona comunque (fallback).
 """
-from pymongo import MongoClient, errors
+from pymongo import MongoClient, errors, monitoring
 from datetime import datetime, timezone
 import os
 
+from app.services.tracing import traced, tracer
+
 # MongoDB connection (opzionale)
 MONGODB_URL = os.getenv("MONGODB_URL", None)  # Configura da env var
 mongo_client = None
 mongo_db = None
 
+
+class TracingCommandListener(monitoring.CommandListener):
+    """Uno span CLIENT per comando MongoDB, figlio dello span corrente (pymongo chiama nel thread del comando)."""
+
+    def __init__(self):
+        self._spans = {}
+
+    def started(self, event):
+        span = tracer.start_span(
+            f"mongodb {event.command_name}",
+            kind="CLIENT",
+            attributes={"db.system": "mongodb", "db.name": event.database_name, "db.operation": event.command_name},
+            root=False,
+        )
+        if span is not None and span.sampled:
+            self._spans[event.request_id] = span
+
+    def succeeded(self, event):
+        tracer.end_span(self._spans.pop(event.request_id, None))
+
+    def failed(self, event):
+        span = self._spans.pop(event.request_id, None)
+        if span is not None:
+            span.status = {"code": "STATUS_CODE_ERROR", "message": str(event.failure)}
+            tracer.end_span(span)
+
+
 def init_mongodb():
     """Inizializza MongoDB connection (opzionale)."""
     global mongo_client, mongo_db
@@ -21,7 +50,8 @@ def init_mongodb():
         return False
     
     try:
-        mongo_client = MongoClient(MONGODB_URL, serverSelectionTimeoutMS=5000)
+        listeners = [TracingCommandListener()] if tracer.enabled else []
+        mongo_client = MongoClient(MONGODB_URL, serverSelectionTimeoutMS=5000, event_listeners=listeners)
         mongo_client.admin.command('ping')
         mongo_db = mongo_client['mare_calmo']
         print("MongoDB connesso")
@@ -37,6 +67,7 @@ def init_mongodb():
         mongo_db = None
         return False
 
+@traced
 def upload_user_analytics(user_id: str, email: str, events_data: list, summary: dict):
     """
     Salva i dati di analisi su MongoDB per insights futuri.
@@ -47,7 +78,7 @@ def upload_user_analytics(user_id: str, email: str, events_data: list, summary:
         events_data: Lista di eventi (check-in)
         summary: Statistiche aggregate
     """
-    if not mongo_db:
+    if mongo_db is None:
         return {"skipped": True, "reason": "MongoDB not available"}
     
     try:
@@ -83,7 +114,7 @@ def get_user_insights(user_id: str) -> dict | None:
     Returns:
         Dict con insights, o None se non disponibile
     """
-    if not mongo_db:
+    if mongo_db is None:
         return None
     
     try:
@@ -98,7 +129,7 @@ def get_user_insights(user_id: str) -> dict | None:
         
         # Trend ansia (ultimi 7 eventi)
         recent_events = events[-7:] if events else []
-        anxiety_values = [e.get('anxiety', 0) for e in recent_events]
+        anxiety_values = [e['anxiety'] for e in recent_events if e.get('anxiety') is not None]
         
         if len(anxiety_values) > 1:
             anxiety_trend = anxiety_values[-1] - anxiety_values[0]  # + = peggio, - = meglio
@@ -109,8 +140,8 @@ def get_user_insights(user_id: str) -> dict | None:
         dimensions = {}
         for event in events:
             dim = event.get('dimension')
-            anx = event.get('anxiety', 0)
-            if dim:
+            anx = event.get('anxiety')
+            if dim and anx is not None:
                 if dim not in dimensions:
                     dimensions[dim] = []
                 dimensions[dim].append(anx)
@@ -2,21 +2,28 @@
 Mare Calmo - Main App
 API per l'app di supporto all'ansia
 
-Con rate limiting per proteggere gli endpoint auth
+Con rate limiting condiviso tra i worker (services/rate_limit.py) su
+login, registrazione, reset password ed eventi
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
 
 # Import auth router (NUOVO SISTEMA)
 from app.auth.auth_api import router as auth_router
 from app.auth.auth_config import AuthConfig
+from app.auth.auth_hashing import hashing_executor
+from app.auth.auth_revocation import revocation_store
+from app.routes.api import router as api_router
+from app.routes.api_async import router as async_api_router
+from app.routes.debug import router as debug_router
 
-from app.db.database import init_db
+from app.db.database import ASYNC_DB_ENABLED, async_engine, check_database, engine, init_db, read_engine
+from app.services.metrics import MetricsMiddleware, instrument_engine, render_metrics
+from app.services import sql_profiler, tracing
+from app.services.recompute import recompute_scheduler
+from app.services.write_buffer import EVENT_GROUP_COMMIT, event_writer
 
 # Create app
 app = FastAPI(
@@ -25,23 +32,6 @@ app = FastAPI(
     version="1.0.0",
 )
 
-# ══════════════════════════════════════════════════════════════
-# RATE LIMITING CONFIGURATION
-# ══════════════════════════════════════════════════════════════
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
-
-@app.exception_handler(RateLimitExceeded)
-async def rate_limit_exceeded_handler(request, exc):
-    """Gestione errori rate limit"""
-    return JSONResponse(
-        status_code=429,
-        content={
-            "detail": "Troppi tentativi. Riprova più tardi.",
-            "retry_after": exc.detail,
-        },
-    )
-
 def _get_cors_origins():
     """Leggi CORS origins da env, con fallback per Vercel"""
     cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:5173,http://localhost:3000").split(",")
@@ -60,16 +50,54 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["Authorization", "Content-Type"],
+    expose_headers=["Retry-After", sql_profiler.PROFILE_HEADER, tracing.TRACE_HEADER],  # 429/503; debug
 )
 
+# Metriche: latenza per route, richieste in corso, SQL per richiesta (GET /metrics)
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine, "primary")
+instrument_engine(read_engine, "read")  # stesso engine fuori dal profilo production: ignorato
+if async_engine is not None:
+    instrument_engine(async_engine.sync_engine, "async")
+
+# Profilo SQL per richiesta e sospetti N+1 (opt-in: SQL_PROFILE=1)
+app.add_middleware(sql_profiler.SQLProfilerMiddleware)
+# Tracing: span per richiesta, servizi, SQL e MongoDB (TRACE_EXPORTER, TRACE_SAMPLE_RATE)
+app.add_middleware(tracing.TracingMiddleware)
+# I listener si registrano una volta per engine (read_engine può coincidere con engine)
+for _engine in [engine, read_engine, *([async_engine.sync_engine] if async_engine is not None else [])]:
+    sql_profiler.instrument_engine(_engine)
+    tracing.instrument_engine(_engine)
+
 # Init DB on startup
 @app.on_event("startup")
 def startup():
     init_db()
+    hashing_executor.start()
+    revocation_store.start()
+    if EVENT_GROUP_COMMIT:
+        event_writer.start()
+    recompute_scheduler.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    event_writer.stop()
+    recompute_scheduler.stop()
+    hashing_executor.stop()
+    revocation_store.stop()
 
 # Include routers con rate limiting
-# I limiti sono definiti nei singoli endpoint di auth_api.py
+# I limiti sono dipendenze delle singole route (auth_api.py, POST /events)
 app.include_router(auth_router)
+# Con DB_ASYNC=1 le route calde async vengono registrate prima e hanno la
+# precedenza sulle omonime sync
+if ASYNC_DB_ENABLED:
+    app.include_router(async_api_router, prefix="/api")
+# API dati (eventi, pesci, mare); /api/auth resta servito da auth_router
+app.include_router(api_router, prefix="/api")
+# Diagnostica (contatori dei componenti, profilo a campionamento), solo ADMIN_EMAILS
+app.include_router(debug_router)
 
 # Root endpoint
 @app.get("/")
@@ -79,10 +107,21 @@ def read_root():
         "message": "Mare Calmo API v1.0.0",
     }
 
-# Health check
+# Health check: solo il DB (i contatori dei componenti sono in /debug/status)
 @app.get("/health")
 def health_check():
-    return {
-        "status": "healthy",
-        "database": "connected",
-    }
\ No newline at end of file
+    database = check_database()
+    body = {
+        "status": "healthy" if database["status"] == "connected" else "unhealthy",
+        "database": database["status"],
+        "latency_ms": database.get("latency_ms"),
+    }
+    if database["status"] != "connected":
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+
+# Metriche Prometheus (formato testo)
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
\ No newline at end of file
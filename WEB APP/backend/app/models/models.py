@@ -4,10 +4,12 @@ Uses String IDs instead of PostgreSQL UUID.
 Uses JSON instead of JSONB.
 """
 import uuid
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from typing import Optional, Dict, Any
-from sqlalchemy import Boolean, DateTime, Float, ForeignKey, Index, JSON, String, Text
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import Boolean, Date, DateTime, Float, ForeignKey, Index, Integer, JSON, String, Text
+from sqlalchemy import DDL, event, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Mapped, Session, mapped_column, relationship
 
 from app.db.database import Base
 
@@ -20,6 +22,13 @@ def utcnow() -> datetime:
     return datetime.now(timezone.utc)
 
 
+def as_utc(value: datetime) -> datetime:
+    """SQLite restituisce datetime naive: li riporta in UTC aware."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
 # ──────────────────────────────────────────────
 # USERS
 # ──────────────────────────────────────────────
@@ -36,6 +45,7 @@ class User(Base):
     # relationships
     events: Mapped[list["Event"]] = relationship("Event", back_populates="user", cascade="all, delete-orphan")
     fish: Mapped[list["Fish"]] = relationship("Fish", back_populates="user", cascade="all, delete-orphan")
+    event_segments: Mapped[list["EventSegment"]] = relationship("EventSegment", cascade="all, delete-orphan")
     sea_state: Mapped[Optional["SeaState"]] = relationship("SeaState", back_populates="user", uselist=False)
 
 
@@ -51,13 +61,92 @@ class Event(Base):
     metadata_json: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSON, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow, index=True)
 
+    # Chiavi "calde" di metadata_json promosse a colonne (vedi event_hot_columns)
+    fish_id: Mapped[Optional[str]] = mapped_column(String(36), nullable=True)
+    anxiety_level: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    dimension: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+
+    # Ordine di inserimento: assegnato nella transazione di scrittura (vedi next_event_seq)
+    seq: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
     user: Mapped["User"] = relationship(back_populates="events")
 
     __table_args__ = (
         Index("idx_events_user_time", "user_id", "created_at"),
+        Index("idx_events_user_fish_time", "user_id", "fish_id", "created_at"),
+        Index("idx_events_user_type_time", "user_id", "event_type", "created_at"),
+        Index("idx_events_user_seq", "user_id", "seq"),
     )
 
 
+class EventSequence(Base):
+    """Contatore di Event.seq: una sola riga (id=1), creata con la tabella."""
+    __tablename__ = "event_sequence"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    value: Mapped[int] = mapped_column(Integer, default=0)
+
+
+event.listen(
+    EventSequence.__table__,
+    "after_create",
+    DDL("INSERT INTO event_sequence (id, value) VALUES (1, 0)"),
+)
+
+
+def next_event_seq(connection: Connection, count: int) -> int:
+    """
+    Riserva count valori consecutivi di Event.seq e ritorna il primo.
+
+    L'UPDATE del contatore tiene il lock di scrittura (la riga, fuori da
+    SQLite) fino alla fine della transazione: chi scrive eventi si mette in
+    fila sul contatore, quindi seq cresce nell'ordine di commit. Un evento
+    visibile ha sempre seq più alto di quelli già committati, e un valore
+    non viene mai riusato, anche se gli eventi più recenti vengono
+    cancellati o archiviati. Le transazioni annullate lasciano buchi.
+    """
+    counter = EventSequence.__table__
+    last = connection.execute(
+        update(counter)
+        .where(counter.c.id == 1)
+        .values(value=counter.c.value + count)
+        .returning(counter.c.value)
+    ).scalar_one()
+    return last - count + 1
+
+
+# Eventi scritti via ORM (db.add): seq assegnato al flush, nella stessa transazione
+@event.listens_for(Session, "before_flush")
+def _assign_event_seq(session: Session, _flush_context, _instances) -> None:
+    pending = [obj for obj in session.new if isinstance(obj, Event) and obj.seq is None]
+    if pending:
+        first = next_event_seq(session.connection(), len(pending))
+        for offset, obj in enumerate(pending):
+            obj.seq = first + offset
+
+
+def event_hot_columns(metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Valori delle colonne fish_id, anxiety_level e dimension estratti da metadata.
+    Da passare al costruttore di Event quando l'evento viene scritto.
+    """
+    metadata = metadata or {}
+
+    fish_id = metadata.get("fish_id")
+    anxiety = metadata.get("anxiety_level", metadata.get("anxiety"))
+    try:
+        anxiety = int(anxiety) if anxiety is not None else None
+    except (TypeError, ValueError):
+        anxiety = None
+    dimension = metadata.get("dimension") or metadata.get("context")
+
+    return {
+        "fish_id": str(fish_id) if fish_id is not None else None,
+        "anxiety_level": anxiety,
+        "dimension": str(dimension) if dimension else None,
+    }
+
+
 # ──────────────────────────────────────────────
 # FISH
 # ──────────────────────────────────────────────
@@ -84,6 +173,9 @@ class FishState(Base):
     visual_stage: Mapped[str] = mapped_column(String(20), default="small")
     last_computed: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
 
+    # Watermark: Event.seq dell'ultimo evento già assorbito in growth_level
+    last_event_seq: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
     fish: Mapped["Fish"] = relationship(back_populates="state")
 
 
@@ -100,3 +192,70 @@ class SeaState(Base):
     last_computed: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
 
     user: Mapped["User"] = relationship(back_populates="sea_state")
+
+
+# ──────────────────────────────────────────────
+# USER DAILY STATS (rollup — derived from events)
+# ──────────────────────────────────────────────
+class UserDailyStats(Base):
+    __tablename__ = "user_daily_stats"
+
+    user_id: Mapped[str] = mapped_column(String(36), ForeignKey("users.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)  # giorno UTC di created_at
+    event_count: Mapped[int] = mapped_column(Integer, default=0)
+    checkin_count: Mapped[int] = mapped_column(Integer, default=0)
+    anxiety_count: Mapped[int] = mapped_column(Integer, default=0)  # check-in con anxiety_level
+    anxiety_sum: Mapped[int] = mapped_column(Integer, default=0)
+    anxiety_sq_sum: Mapped[int] = mapped_column(Integer, default=0)
+
+
+# ──────────────────────────────────────────────
+# SNAPSHOTS (derived — punti di ripartenza per il replay)
+# ──────────────────────────────────────────────
+class FishSnapshot(Base):
+    """Stato di un pesce a fine giornata (UTC), dopo il replay fino a quel giorno."""
+    __tablename__ = "fish_snapshots"
+
+    fish_id: Mapped[str] = mapped_column(String(36), ForeignKey("fish.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    user_id: Mapped[str] = mapped_column(String(36), ForeignKey("users.id"))
+    growth_level: Mapped[float] = mapped_column(Float, default=0.0)
+
+    __table_args__ = (
+        Index("idx_fish_snapshots_user_day", "user_id", "day"),
+    )
+
+
+class SeaSnapshot(Base):
+    """Stato del mare a fine giornata (UTC); esiste un FishSnapshot per ogni pesce dello stesso giorno."""
+    __tablename__ = "sea_snapshots"
+
+    user_id: Mapped[str] = mapped_column(String(36), ForeignKey("users.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    sea_state_score: Mapped[float] = mapped_column(Float, default=0.0)
+
+
+# ──────────────────────────────────────────────
+# EVENT SEGMENTS (archivio freddo — vedi services/archive.py)
+# ──────────────────────────────────────────────
+class EventSegment(Base):
+    """Eventi di un utente spostati nel suo segmento compresso di un mese."""
+    __tablename__ = "event_segments"
+
+    user_id: Mapped[str] = mapped_column(String(36), ForeignKey("users.id"), primary_key=True)
+    month: Mapped[str] = mapped_column(String(7), primary_key=True)  # "YYYY-MM" (UTC)
+    event_count: Mapped[int] = mapped_column(Integer, default=0)
+    first_at: Mapped[datetime] = mapped_column(DateTime)
+    last_at: Mapped[datetime] = mapped_column(DateTime)
+
+
+# ──────────────────────────────────────────────
+# REVOKED TOKENS (logout — vedi auth/auth_revocation.py)
+# ──────────────────────────────────────────────
+class RevokedToken(Base):
+    """Token revocato prima della scadenza; la riga serve solo fino a expires_at."""
+    __tablename__ = "revoked_tokens"
+
+    jti: Mapped[str] = mapped_column(String(64), primary_key=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+    revoked_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow, index=True)
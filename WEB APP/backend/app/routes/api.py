@@ -5,99 +5,164 @@ L'API è progettata secondo un modello event-driven minimale,
 in cui il backend centralizza la logica di progressione e
 restituisce esclusivamente stati discreti pronti per la visualizzazione.
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import FileResponse, JSONResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy import select
-from uuid import uuid4
-import json
-import tempfile
-from app.db.database import get_db
-from app.models.models import Event, Fish, FishState, SeaState, User
+from datetime import datetime
+from app.db.database import ReadSessionLocal, get_db, get_read_db
+from app.models.models import Event, Fish, SeaState, User, as_utc, event_hot_columns, utcnow
 from app.schemas import (
 ComputeResponse,
 EventCreate,
 EventResponse,
+EventBatchItem,
+EventBatchResponse,
 FishResponse,
 SeaStateResponse,
-UserCreate,
-UserResponse,
-RegisterRequest,
-LoginRequest,
-AuthResponse,
+WorldResponse,
 )
-from app.services.growth import compute_fish_growth
-from app.services.sea_state import compute_sea_state
-from app.services.export import export_user_data, sync_to_mongodb, get_user_analytics
-from app.auth import register_user, login_user, get_current_user
+from app.services.daily_stats import record_event_stats
+from app.services.growth import compute_fish_growth, discretize_visual_stage
+from app.services.ingest import MAX_BATCH_EVENTS, event_row, ingest_events
+from app.services.rate_limit import enforce, limit_by_user
+from app.services.recompute import recompute_scheduler
+from app.services.write_buffer import event_writer
+from app.services.replay import replay_state
+from app.services.sea_state import compute_sea_state, discretize_sea_state, visual_params_from_state
+from app.services.export import export_header, stream_user_export, sync_to_mongodb, get_user_analytics
+from app.auth import Principal, get_current_user
 router = APIRouter()
 
 
 # ──────────────────────────────────────────────
-# AUTHENTICATION — Autenticazione utenti
+# UTILS
 # ──────────────────────────────────────────────
+def fish_response(fish: Fish) -> FishResponse:
+    """Pesce con il suo stato (già caricato insieme al pesce)."""
+    state = fish.state
+    return FishResponse(
+        fish_id=fish.id,
+        dimension=fish.dimension,
+        growth_level=state.growth_level if state else 0.0,
+        visual_stage=state.visual_stage if state else "small",
+    )
 
 
-# Test endpoint
-@router.post("/auth/test")
-def test_endpoint():
-    """Endpoint di test per verificare che il routing funziona."""
-    print("[TEST] Test endpoint called")
-    return {"status": "ok", "message": "Backend funziona"}
-
-
-@router.post("/auth/register", response_model=AuthResponse)
-def register(data: RegisterRequest, db: Session = Depends(get_db)):
-    """Registra un nuovo utente con email e password."""
-    result = register_user(
-        email=data.email,
-        password=data.password,
-        locale=data.locale,
-        db=db
+def sea_state_response(sea_state: SeaState) -> SeaStateResponse:
+    return SeaStateResponse(
+        state=sea_state.sea_state_label,
+        score=sea_state.sea_state_score,
+        visual_params=sea_state.visual_params or {},
     )
-    return AuthResponse(**result)
 
 
-@router.post("/auth/login", response_model=AuthResponse)
-def login(data: LoginRequest, db: Session = Depends(get_db)):
-    """Accedi al tuo diario con email e password."""
-    result = login_user(data.email, data.password, db)
-    return AuthResponse(**result)
+def replayed_world_response(replayed: dict) -> WorldResponse:
+    """WorldResponse dallo stato ricostruito da replay_state."""
+    score = replayed["sea_state_score"]
+    label = discretize_sea_state(score) if score is not None else None
+    return WorldResponse(
+        fish=[
+            FishResponse(
+                fish_id=f["fish_id"],
+                dimension=f["dimension"],
+                growth_level=f["growth_level"],
+                visual_stage=discretize_visual_stage(f["growth_level"]),
+            )
+            for f in replayed["fish"]
+        ],
+        sea_state=SeaStateResponse(
+            state=label,
+            score=score,
+            visual_params=visual_params_from_state(label),
+        ) if label else None,
+    )
 
 
 # ──────────────────────────────────────────────
 # 1. POST /events — Registra qualsiasi interazione
 # ──────────────────────────────────────────────
-@router.post("/events", response_model=EventResponse)
+@router.post("/events", response_model=EventResponse, dependencies=[Depends(limit_by_user("events", get_current_user))])
 def create_event(
     data: EventCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Registra un evento immutabile.
-    Il frontend non sa cosa succede dopo.
+    Il frontend non sa cosa succede dopo: il ricalcolo di pesci
+    e mare viene accodato e gira in background.
     
-    Richiede autenticazione.
+    Richiede autenticazione. Rate Limit: RATE_LIMIT_EVENTS per utente.
     """
-    event = Event(
-        user_id=current_user.id,
-        event_type=data.event_type,
-        metadata_json=data.metadata,
-    )
-    db.add(event)
-    db.commit()
+    user_id = current_user.id
+    created_at = utcnow()
+    if event_writer.enabled:
+        # Group commit: risponde dopo il commit del gruppo che contiene l'evento.
+        # La connessione torna al pool prima dell'attesa.
+        db.close()
+        event_writer.write(event_row(user_id, data.event_type, data.metadata, created_at))
+    else:
+        event = Event(
+            user_id=current_user.id,
+            event_type=data.event_type,
+            metadata_json=data.metadata,
+            created_at=created_at,
+            **event_hot_columns(data.metadata),
+        )
+        db.add(event)
+        # Rollup giornaliero nella stessa transazione dell'evento
+        record_event_stats(db, current_user.id, event.event_type, event.anxiety_level, created_at)
+        db.commit()
+    recompute_scheduler.enqueue(user_id)
     return EventResponse(status="ok")
 
 
+# ──────────────────────────────────────────────
+# 1b. POST /events/batch — Diario offline / import storico
+# ──────────────────────────────────────────────
+@router.post("/events/batch", response_model=EventBatchResponse)
+def create_events_batch(
+    items: list[EventBatchItem],
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Registra in blocco eventi accumulati offline, con il loro created_at.
+    Valida tutto prima di scrivere; gli elementi validi entrano in una
+    sola transazione, gli altri sono riportati con il motivo del rifiuto.
+    
+    Richiede autenticazione. Rate Limit: RATE_LIMIT_EVENTS_BATCH eventi per
+    utente (ogni evento del batch costa un gettone).
+    """
+    if len(items) > MAX_BATCH_EVENTS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Massimo {MAX_BATCH_EVENTS} eventi per richiesta.",
+        )
+    enforce("events_batch", current_user.id, cost=len(items))
+
+    results = ingest_events(db, current_user.id, items)
+    db.commit()
+
+    accepted = sum(1 for r in results if r["status"] == "ok")
+    if accepted:
+        recompute_scheduler.enqueue(current_user.id)
+    return EventBatchResponse(
+        accepted=accepted,
+        rejected=len(results) - accepted,
+        results=results,
+    )
+
+
 # ──────────────────────────────────────────────
 # 2. GET /user/{user_id}/sea-state
 # ──────────────────────────────────────────────
 @router.get("/user/{user_id}/sea-state", response_model=SeaStateResponse)
 def get_sea_state(
     user_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """
     Restituisce lo stato del mare già calcolato.
@@ -114,11 +179,7 @@ def get_sea_state(
     if not sea_state:
         raise HTTPException(status_code=404, detail="Sea state not found")
 
-    return SeaStateResponse(
-        state=sea_state.sea_state_label,
-        score=sea_state.sea_state_score,
-        visual_params=sea_state.visual_params or {},
-    )
+    return sea_state_response(sea_state)
 
 
 # ──────────────────────────────────────────────
@@ -127,8 +188,8 @@ def get_sea_state(
 @router.get("/user/{user_id}/fish", response_model=list[FishResponse])
 def get_user_fish(
     user_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
 ):
     """
     Restituisce stato dei pesci. visual_stage è già discretizzato.
@@ -142,19 +203,57 @@ def get_user_fish(
         )
     
     fish_list = db.execute(
-        select(Fish).where(Fish.user_id == user_id)
+        select(Fish)
+        .where(Fish.user_id == user_id)
+        .options(joinedload(Fish.state))
     ).scalars().all()
 
-    result = []
-    for f in fish_list:
-        state = db.get(FishState, f.id)
-        result.append(FishResponse(
-            fish_id=f.id,
-            dimension=f.dimension,
-            growth_level=state.growth_level if state else 0.0,
-            visual_stage=state.visual_stage if state else "small",
-        ))
-    return result
+    return [fish_response(f) for f in fish_list]
+
+
+# ──────────────────────────────────────────────
+# 3b. GET /user/{user_id}/world — pesci + mare insieme
+# ──────────────────────────────────────────────
+@router.get("/user/{user_id}/world", response_model=WorldResponse)
+def get_user_world(
+    user_id: str,
+    at: datetime | None = None,
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_read_db)
+):
+    """
+    Pesci con i loro stati e stato del mare in una sola risposta,
+    al posto di /fish + /sea-state. Numero di query costante.
+
+    Con ?at=<ISO 8601> restituisce lo stato a quella data, ricostruito
+    dallo snapshot giornaliero più vicino più gli eventi successivi.
+    
+    Richiede autenticazione, e user_id deve corrispondere all'utente.
+    """
+    if user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Non hai accesso ai dati di questo utente.",
+        )
+
+    if at is not None:
+        if as_utc(at) > utcnow():
+            raise HTTPException(status_code=400, detail="La data non può essere nel futuro.")
+        return replayed_world_response(replay_state(db, user_id, at))
+
+    user = db.execute(
+        select(User)
+        .where(User.id == user_id)
+        .options(
+            selectinload(User.fish).joinedload(Fish.state),
+            joinedload(User.sea_state),
+        )
+    ).scalar_one()
+
+    return WorldResponse(
+        fish=[fish_response(f) for f in user.fish],
+        sea_state=sea_state_response(user.sea_state) if user.sea_state else None,
+    )
 
 
 # ──────────────────────────────────────────────
@@ -163,12 +262,16 @@ def get_user_fish(
 @router.post("/user/{user_id}/compute-state", response_model=ComputeResponse)
 def compute_state(
     user_id: str,
-    current_user: User = Depends(get_current_user),
+    full_rebuild: bool = False,
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Trigger ricalcolo di crescita pesci + stato mare.
-    In produzione diventa un cron job.
+    Trigger ricalcolo sincrono di crescita pesci + stato mare.
+    Di norma non serve: POST /events accoda già il ricalcolo in background.
+
+    Di default la crescita è incrementale (solo eventi nuovi);
+    full_rebuild=true la ricostruisce da tutto lo storico.
     
     Richiede autenticazione, e user_id deve corrispondere all'utente.
     """
@@ -178,7 +281,7 @@ def compute_state(
             detail="Non hai accesso ai dati di questo utente.",
         )
     
-    compute_fish_growth(db, user_id)
+    compute_fish_growth(db, user_id, full_rebuild=full_rebuild)
     compute_sea_state(db, user_id)
 
     return ComputeResponse(status="recomputed")
@@ -190,13 +293,20 @@ def compute_state(
 @router.get("/user/{user_id}/export-data")
 def export_user_data_endpoint(
     user_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
 ):
     """
-    Esporta i dati dell'utente in formato JSON.
+    Esporta i dati dell'utente in streaming.
     Include events, game state, e statistiche.
     
+    - format=json: un documento JSON (user, events, game_state, summary, ...)
+    - format=ndjson: un oggetto per riga, eventi uno alla volta, summary in fondo
+    
+    Gli eventi escono a blocchi dal cursore mentre il client legge: memoria
+    costante e primo byte subito, anche con anni di storico.
+    
     Richiede autenticazione, e user_id deve corrispondere all'utente.
     """
     if user_id != current_user.id:
@@ -205,14 +315,19 @@ def export_user_data_endpoint(
             detail="Non hai accesso ai dati di questo utente.",
         )
     
-    return export_user_data(db, user_id)
+    header = export_header(db, user_id)
+    if header is None:
+        return {"error": "User not found"}
+    
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    return StreamingResponse(stream_user_export(ReadSessionLocal, user_id, header, format), media_type=media_type)
 
 
 @router.post("/user/{user_id}/export-mongodb")
 def sync_user_to_mongodb_endpoint(
     user_id: str,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
 ):
     """
     Esporta i dati dell'utente e sincronizza con MongoDB.
@@ -235,7 +350,7 @@ def sync_user_to_mongodb_endpoint(
 @router.get("/user/{user_id}/analytics")
 def get_user_analytics_endpoint(
     user_id: str,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     """
     Recupera insights e analisi per l'utente da MongoDB.
@@ -0,0 +1,142 @@
+"""
+API Routes async — le route calde su AsyncSession (DB_ASYNC=1).
+
+Stessi path, schemi e comportamento delle omonime in api.py: main.py
+monta questo router prima di quello sync, quindi queste hanno la
+precedenza. Nessuna chiamata bloccante sull'event loop: le query
+attendono il driver async, i servizi sync (rollup, replay) girano con
+run_sync sulla connessione async e il group commit si attende come
+Future.
+"""
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.auth import Principal, get_current_user_async
+from app.db.database import get_async_db, write_transaction
+from app.models.models import Event, Fish, SeaState, User, as_utc, event_hot_columns, utcnow
+from app.routes.api import fish_response, replayed_world_response, sea_state_response
+from app.schemas import EventCreate, EventResponse, FishResponse, SeaStateResponse, WorldResponse
+from app.services.daily_stats import record_event_stats
+from app.services.ingest import event_row
+from app.services.rate_limit import limit_by_user
+from app.services.recompute import recompute_scheduler
+from app.services.replay import replay_state
+from app.services.write_buffer import event_writer
+
+router = APIRouter()
+
+
+def _check_owner(user_id: str, current_user: Principal) -> None:
+    if user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Non hai accesso ai dati di questo utente.",
+        )
+
+
+# ──────────────────────────────────────────────
+# POST /events
+# ──────────────────────────────────────────────
+@router.post("/events", response_model=EventResponse, dependencies=[Depends(limit_by_user("events", get_current_user_async))])
+async def create_event(
+    data: EventCreate,
+    current_user: Principal = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Registra un evento immutabile (versione async di api.create_event)."""
+    user_id = current_user.id
+    created_at = utcnow()
+    if event_writer.enabled:
+        await db.close()
+        await event_writer.write_async(event_row(user_id, data.event_type, data.metadata, created_at))
+    else:
+        async with write_transaction(db):
+            event = Event(
+                user_id=user_id,
+                event_type=data.event_type,
+                metadata_json=data.metadata,
+                created_at=created_at,
+                **event_hot_columns(data.metadata),
+            )
+            db.add(event)
+            await db.run_sync(
+                lambda session: record_event_stats(session, user_id, event.event_type, event.anxiety_level, created_at)
+            )
+    recompute_scheduler.enqueue(user_id)
+    return EventResponse(status="ok")
+
+
+# ──────────────────────────────────────────────
+# GET /user/{user_id}/sea-state
+# ──────────────────────────────────────────────
+@router.get("/user/{user_id}/sea-state", response_model=SeaStateResponse)
+async def get_sea_state(
+    user_id: str,
+    current_user: Principal = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Stato del mare già calcolato."""
+    _check_owner(user_id, current_user)
+
+    sea_state = await db.get(SeaState, user_id)
+    if not sea_state:
+        raise HTTPException(status_code=404, detail="Sea state not found")
+    return sea_state_response(sea_state)
+
+
+# ──────────────────────────────────────────────
+# GET /user/{user_id}/fish
+# ──────────────────────────────────────────────
+@router.get("/user/{user_id}/fish", response_model=list[FishResponse])
+async def get_user_fish(
+    user_id: str,
+    current_user: Principal = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Stato dei pesci, con visual_stage già discretizzato."""
+    _check_owner(user_id, current_user)
+
+    fish_list = (await db.execute(
+        select(Fish)
+        .where(Fish.user_id == user_id)
+        .options(joinedload(Fish.state))
+    )).scalars().all()
+    return [fish_response(f) for f in fish_list]
+
+
+# ──────────────────────────────────────────────
+# GET /user/{user_id}/world
+# ──────────────────────────────────────────────
+@router.get("/user/{user_id}/world", response_model=WorldResponse)
+async def get_user_world(
+    user_id: str,
+    at: datetime | None = None,
+    current_user: Principal = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Pesci + stato del mare in una risposta; ?at= per una data passata."""
+    _check_owner(user_id, current_user)
+
+    if at is not None:
+        if as_utc(at) > utcnow():
+            raise HTTPException(status_code=400, detail="La data non può essere nel futuro.")
+        replayed = await db.run_sync(lambda session: replay_state(session, user_id, at))
+        return replayed_world_response(replayed)
+
+    user = (await db.execute(
+        select(User)
+        .where(User.id == user_id)
+        .options(
+            selectinload(User.fish).joinedload(Fish.state),
+            joinedload(User.sea_state),
+        )
+    )).scalar_one()
+
+    return WorldResponse(
+        fish=[fish_response(f) for f in user.fish],
+        sea_state=sea_state_response(user.sea_state) if user.sea_state else None,
+    )
@@ -0,0 +1,85 @@
+"""
+Route di diagnostica sul processo in esecuzione (solo amministratori, ADMIN_EMAILS).
+"""
+import asyncio
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+from app.auth import Principal, get_current_admin
+from app.auth.auth_cache import principal_cache
+from app.auth.auth_hashing import hashing_executor
+from app.auth.auth_revocation import revocation_store
+from app.db.database import ASYNC_DB_ENABLED, check_database
+from app.services import tracing
+from app.services.profiler import DEBUG_PROFILE_MAX_SECONDS, profiler
+from app.services.rate_limit import rate_limiter
+from app.services.recompute import recompute_scheduler
+from app.services.write_buffer import event_writer
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+
+@router.get("/status")
+def process_status(admin: Principal = Depends(get_current_admin)):
+    """
+    Contatori dei componenti del worker che riceve la richiesta: ricalcolo,
+    group commit, cache dei principal, hashing, revoche, rate limit e
+    tracing, più l'esito completo del controllo sul DB. /health, pubblico,
+    riporta solo stato e latenza del DB.
+    """
+    return {
+        "database": check_database(),
+        "db_mode": "async" if ASYNC_DB_ENABLED else "sync",
+        "recompute": recompute_scheduler.metrics(),
+        "group_commit": event_writer.metrics(),
+        "auth_cache": principal_cache.metrics(),
+        "hashing": hashing_executor.metrics(),
+        "revocation": revocation_store.metrics(),
+        "rate_limit": rate_limiter.metrics(),
+        "tracing": tracing.tracer.metrics(),
+    }
+
+
+@router.get("/profile")
+async def profile_process(
+    seconds: float = Query(10, gt=0, le=DEBUG_PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=100),
+    format: str = Query("json", pattern="^(json|collapsed)$"),
+    top: int = Query(30, ge=1, le=500),
+    allocations: bool = False,
+    admin: Principal = Depends(get_current_admin),
+):
+    """
+    Campiona gli stack di tutti i thread del worker per `seconds` secondi
+    mentre serve il traffico normale (la route attende senza occupare
+    l'event loop né un thread).
+
+    - format=json: tabella delle funzioni più calde, stack collassati e,
+      con allocations=true, le righe che hanno allocato di più (tracemalloc);
+    - format=collapsed: solo il file di stack collassati, da passare a
+      flamegraph.pl o da aprire in speedscope.
+
+    Con più worker uvicorn il profilo è quello del worker che riceve la
+    richiesta. 409 se un altro profilo è in corso.
+    """
+    if not profiler.start(interval_ms / 1000, allocations):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Un altro profilo è in corso.",
+        )
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        # join del thread e snapshot tracemalloc fuori dall'event loop
+        result = await run_in_threadpool(profiler.stop)
+
+    if format == "collapsed":
+        filename = f"profile-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.collapsed"
+        return PlainTextResponse(
+            result.collapsed(),
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+    return {**result.summary(top), "collapsed": result.collapsed()}
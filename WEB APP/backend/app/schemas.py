@@ -45,6 +45,25 @@ class EventResponse(BaseModel):
     status: str = "ok"
 
 
+class EventBatchItem(EventCreate):
+    """Evento registrato offline: created_at è l'orario del client (UTC se naive)."""
+    created_at: datetime | None = None
+
+
+class EventBatchItemResult(BaseModel):
+    index: int
+    status: str  # ok | rejected
+    event_id: str | None = None
+    detail: str | None = None
+
+
+class EventBatchResponse(BaseModel):
+    status: str = "ok"
+    accepted: int
+    rejected: int
+    results: list[EventBatchItemResult]
+
+
 # ──────────────────────────────────────────────
 # USER
 # ──────────────────────────────────────────────
@@ -78,6 +97,14 @@ class SeaStateResponse(BaseModel):
     visual_params: dict
 
 
+# ──────────────────────────────────────────────
+# WORLD (pesci + mare in una risposta)
+# ──────────────────────────────────────────────
+class WorldResponse(BaseModel):
+    fish: list[FishResponse]
+    sea_state: SeaStateResponse | None = None
+
+
 # ──────────────────────────────────────────────
 # COMPUTE
 # ──────────────────────────────────────────────
@@ -0,0 +1,452 @@
+"""
+Archivio freddo degli eventi — segmenti colonnari compressi per utente e mese.
+
+Gli eventi più vecchi di ARCHIVE_AFTER_DAYS e già assorbiti nello stato
+derivato escono dalla tabella events (e dai suoi indici) e finiscono in un
+file per utente e mese UTC, EVENT_ARCHIVE_DIR/<user_id>/events-YYYY-MM.json.gz:
+JSON gzip con una lista per colonna, righe ordinate per (created_at, id).
+Leggere lo storico di un utente decodifica solo i suoi file, qualunque sia
+il numero di utenti; cancellare l'utente cancella la sua cartella (dopo il
+commit). La tabella event_segments dice quali mesi contengono eventi di un
+utente, con conteggio e primo/ultimo evento.
+
+Un evento è archiviabile quando:
+- il suo seq non supera il watermark di crescita più vecchio tra i pesci
+  dell'utente (growth incrementale non lo rilegge più);
+- è precedente alla fine dell'ultimo snapshot dell'utente (il replay
+  riparte da lì) e a ora - ARCHIVE_AFTER_DAYS.
+Il rollup giornaliero resta intatto: CI ed ES non leggono gli eventi.
+
+Chi ha bisogno dello storico completo (replay, export, rebuild) usa
+read_events / first_event_at, che leggono insieme tabella e segmenti;
+iter_events fa lo stesso in streaming (export NDJSON), a memoria costante.
+Il segmento viene riscritto (file temporaneo + rename) prima di cancellare
+le righe calde: se il job si interrompe in mezzo, gli eventi restano in
+entrambi i posti e il reader li deduplica; la run successiva completa lo
+spostamento.
+
+Run (job periodico, es. settimanale):
+    python -m app.services.archive
+    python -m app.services.archive --older-than-days 180 --vacuum
+"""
+import gzip
+import heapq
+import json
+import os
+import shutil
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Iterator, NamedTuple, Optional
+
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.orm import Session, object_session
+
+from app.models.models import Event, EventSegment, Fish, FishState, SeaSnapshot, User, as_utc, utcnow
+
+
+# ──────────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────────
+EVENT_ARCHIVE_DIR = os.getenv("EVENT_ARCHIVE_DIR", "./event_archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+SEGMENT_CACHE_SIZE = int(os.getenv("SEGMENT_CACHE_SIZE", "4"))  # segmenti decodificati in memoria
+EVENT_STREAM_BATCH = int(os.getenv("EVENT_STREAM_BATCH", "1000"))  # righe per fetch in iter_events
+
+DELETE_CHUNK = 500  # id per DELETE (resta sotto il limite di parametri SQLite)
+SEGMENT_FORMAT = 2
+
+
+class ArchivedEvent(NamedTuple):
+    """Evento letto da un segmento: stessi attributi delle righe di HOT_COLUMNS."""
+    id: str
+    user_id: str
+    event_type: str
+    metadata_json: Optional[dict[str, Any]]
+    created_at: datetime
+    fish_id: Optional[str]
+    anxiety_level: Optional[int]
+    dimension: Optional[str]
+
+
+HOT_COLUMNS = tuple(getattr(Event, name) for name in ArchivedEvent._fields)
+
+
+class ArchiveCutoff(NamedTuple):
+    """Limiti di archiviazione di un utente: created_at < before e seq <= max_seq."""
+    before: datetime
+    max_seq: int
+
+
+# ──────────────────────────────────────────────
+# UTILS
+# ──────────────────────────────────────────────
+def _naive_utc(value: datetime) -> datetime:
+    """Come li restituisce SQLite: UTC senza tzinfo."""
+    return as_utc(value).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _event_key(event) -> tuple[datetime, str]:
+    return (event.created_at, event.id)
+
+
+def month_of(value: datetime) -> str:
+    return f"{value.year:04d}-{value.month:02d}"
+
+
+def month_start(month: str) -> datetime:
+    year, mon = map(int, month.split("-"))
+    return datetime(year, mon, 1)
+
+
+def next_month(month: str) -> str:
+    start = month_start(month)
+    return month_of((start + timedelta(days=32)).replace(day=1))
+
+
+def user_segment_dir(user_id: str) -> str:
+    return os.path.join(EVENT_ARCHIVE_DIR, user_id)
+
+
+def segment_path(user_id: str, month: str) -> str:
+    return os.path.join(user_segment_dir(user_id), f"events-{month}.json.gz")
+
+
+# ──────────────────────────────────────────────
+# SEGMENT FILES
+# ──────────────────────────────────────────────
+def write_segment(user_id: str, month: str, events: list[ArchivedEvent]) -> None:
+    """Scrive (o sostituisce) il segmento dell'utente per il mese in modo atomico."""
+    events = sorted(events, key=_event_key)
+    columns = {name: [getattr(e, name) for e in events] for name in ArchivedEvent._fields if name != "user_id"}
+    columns["created_at"] = [value.isoformat() for value in columns["created_at"]]
+    document = {"format": SEGMENT_FORMAT, "user_id": user_id, "month": month, "columns": columns}
+
+    os.makedirs(user_segment_dir(user_id), exist_ok=True)
+    path = segment_path(user_id, month)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(document, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+@lru_cache(maxsize=SEGMENT_CACHE_SIZE)
+def _decode_segment(path: str, mtime_ns: int) -> dict:
+    """Segmento decodificato; la chiave include mtime, quindi una riscrittura invalida la cache."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        document = json.load(f)
+    columns = document["columns"]
+    columns["created_at"] = [datetime.fromisoformat(value) for value in columns["created_at"]]
+    return document
+
+
+def load_segment(user_id: str, month: str) -> dict | None:
+    path = segment_path(user_id, month)
+    try:
+        return _decode_segment(path, os.stat(path).st_mtime_ns)
+    except FileNotFoundError:
+        return None
+
+
+def segment_events(document: dict) -> list[ArchivedEvent]:
+    """Eventi del segmento, in ordine (created_at, id)."""
+    user_id = document["user_id"]
+    columns = document["columns"]
+    return [
+        ArchivedEvent(
+            columns["id"][i], user_id, columns["event_type"][i], columns["metadata_json"][i],
+            columns["created_at"][i], columns["fish_id"][i], columns["anxiety_level"][i],
+            columns["dimension"][i],
+        )
+        for i in range(len(columns["id"]))
+    ]
+
+
+# ──────────────────────────────────────────────
+# UNIFIED READER
+# ──────────────────────────────────────────────
+def iter_cold_events(
+    db: Session,
+    user_ids: list[str] | None = None,
+    after: datetime | None = None,
+    until: datetime | None = None,
+) -> Iterator[ArchivedEvent]:
+    """
+    Eventi archiviati degli utenti indicati (default: tutti) con
+    after < created_at <= until. Per ogni utente in ordine (created_at, id);
+    in memoria al più un segmento decodificato (più la cache).
+    """
+    query = select(EventSegment.user_id, EventSegment.month).order_by(EventSegment.user_id, EventSegment.month)
+    if user_ids is not None:
+        query = query.where(EventSegment.user_id.in_(user_ids))
+    if after is not None:
+        after = _naive_utc(after)
+        query = query.where(EventSegment.last_at > after)
+    if until is not None:
+        until = _naive_utc(until)
+        query = query.where(EventSegment.first_at <= until)
+
+    # I mesi sono pochi: la lista evita un cursore aperto mentre il chiamante consuma
+    for user_id, month in db.execute(query).tuples().all():
+        document = load_segment(user_id, month)
+        if document is None:
+            continue
+        for event in segment_events(document):
+            if (after is None or event.created_at > after) and (until is None or event.created_at <= until):
+                yield event
+
+
+def read_cold_events(
+    db: Session,
+    user_ids: list[str] | None = None,
+    after: datetime | None = None,
+    until: datetime | None = None,
+) -> list[ArchivedEvent]:
+    """Come iter_cold_events, in una lista."""
+    return list(iter_cold_events(db, user_ids, after, until))
+
+
+def read_events(
+    db: Session,
+    user_id: str,
+    after: datetime | None = None,
+    until: datetime | None = None,
+) -> list:
+    """
+    Storico di un utente con after < created_at <= until, da tabella e
+    segmenti insieme, in ordine (created_at, id). Le righe hanno gli
+    attributi di ArchivedEvent.
+    """
+    query = (
+        select(*HOT_COLUMNS)
+        .where(Event.user_id == user_id)
+        .order_by(Event.created_at.asc(), Event.id.asc())
+    )
+    if after is not None:
+        query = query.where(Event.created_at > after)
+    if until is not None:
+        query = query.where(Event.created_at <= until)
+    hot = db.execute(query).all()
+
+    cold = read_cold_events(db, [user_id], after, until)
+    if not cold:
+        return hot
+
+    # Un evento in entrambi i posti (archiviazione interrotta) compare una volta sola
+    events = []
+    for event in heapq.merge(cold, hot, key=_event_key):
+        if not events or _event_key(events[-1]) != _event_key(event):
+            events.append(event)
+    return events
+
+
+def iter_events(
+    db: Session,
+    user_id: str,
+    after: datetime | None = None,
+    until: datetime | None = None,
+    batch_size: int = EVENT_STREAM_BATCH,
+) -> Iterator:
+    """
+    Come read_events, ma un evento alla volta: le righe calde arrivano dal
+    cursore a blocchi di batch_size (yield_per), i segmenti un mese alla
+    volta. La memoria non cresce con lo storico dell'utente.
+    """
+    query = (
+        select(*HOT_COLUMNS)
+        .where(Event.user_id == user_id)
+        .order_by(Event.created_at.asc(), Event.id.asc())
+        .execution_options(yield_per=batch_size)
+    )
+    if after is not None:
+        query = query.where(Event.created_at > after)
+    if until is not None:
+        query = query.where(Event.created_at <= until)
+
+    cold = iter_cold_events(db, [user_id], after, until)
+    hot = db.execute(query)
+    try:
+        last_key = None
+        for event in heapq.merge(cold, hot, key=_event_key):
+            key = _event_key(event)
+            if key != last_key:
+                last_key = key
+                yield event
+    finally:
+        hot.close()
+
+
+def first_event_at(db: Session, user_id: str, until: datetime | None = None) -> datetime | None:
+    """Primo evento dell'utente (non successivo a until), archiviato o no."""
+    hot = select(func.min(Event.created_at)).where(Event.user_id == user_id)
+    cold = select(func.min(EventSegment.first_at)).where(EventSegment.user_id == user_id)
+    if until is not None:
+        hot = hot.where(Event.created_at <= until)
+        cold = cold.where(EventSegment.first_at <= _naive_utc(until))
+    values = [v for v in (db.execute(hot).scalar(), db.execute(cold).scalar()) if v is not None]
+    return min(values, default=None)
+
+
+def first_event_times(db: Session, user_ids: list[str]) -> dict[str, datetime]:
+    """first_event_at per più utenti in due query (utenti senza eventi assenti)."""
+    first: dict[str, datetime] = {}
+    for user_id, value in [
+        *db.execute(
+            select(Event.user_id, func.min(Event.created_at))
+            .where(Event.user_id.in_(user_ids))
+            .group_by(Event.user_id)
+        ).tuples(),
+        *db.execute(
+            select(EventSegment.user_id, func.min(EventSegment.first_at))
+            .where(EventSegment.user_id.in_(user_ids))
+            .group_by(EventSegment.user_id)
+        ).tuples(),
+    ]:
+        if user_id not in first or value < first[user_id]:
+            first[user_id] = value
+    return first
+
+
+# ──────────────────────────────────────────────
+# TIERING JOB
+# ──────────────────────────────────────────────
+def archive_cutoffs(db: Session, older_than: datetime) -> dict[str, ArchiveCutoff]:
+    """Per ogni utente archiviabile: i limiti entro cui gli eventi possono uscire dalla tabella."""
+    older_than = _naive_utc(older_than)
+
+    # Watermark più vecchio tra i pesci; un pesce senza watermark blocca l'utente
+    watermarks = {
+        user_id: oldest
+        for user_id, n_fish, n_watermarks, oldest in db.execute(
+            select(Fish.user_id, func.count(Fish.id), func.count(FishState.last_event_seq), func.min(FishState.last_event_seq))
+            .outerjoin(FishState, FishState.fish_id == Fish.id)
+            .group_by(Fish.user_id)
+        ).tuples()
+        if n_fish == n_watermarks
+    }
+    snapshot_days: dict[str, date] = dict(db.execute(
+        select(SeaSnapshot.user_id, func.max(SeaSnapshot.day)).group_by(SeaSnapshot.user_id)
+    ).tuples().all())
+
+    cutoffs = {}
+    for user_id, watermark in watermarks.items():
+        snapshot_day = snapshot_days.get(user_id)
+        if snapshot_day is None:
+            continue
+        after_snapshot = datetime.combine(snapshot_day + timedelta(days=1), time.min)
+        cutoffs[user_id] = ArchiveCutoff(min(older_than, after_snapshot), watermark)
+    return cutoffs
+
+
+def write_user_month(db: Session, user_id: str, month: str, events: list[ArchivedEvent]) -> None:
+    """Aggiunge events al segmento (utente, mese) e ne riscrive la riga di indice (senza commit)."""
+    existing = load_segment(user_id, month)
+    merged = {e.id: e for e in (segment_events(existing) if existing else [])}
+    merged.update((e.id, e) for e in events)
+    write_segment(user_id, month, list(merged.values()))
+
+    times = [e.created_at for e in merged.values()]
+    db.execute(delete(EventSegment).where(EventSegment.user_id == user_id, EventSegment.month == month))
+    db.execute(insert(EventSegment), [{
+        "user_id": user_id, "month": month, "event_count": len(times),
+        "first_at": min(times), "last_at": max(times),
+    }])
+
+
+def delete_user_segments(user_id: str) -> None:
+    """Cancella i file archiviati dell'utente (le righe di event_segments seguono l'utente)."""
+    shutil.rmtree(user_segment_dir(user_id), ignore_errors=True)
+
+
+# Utente cancellato: i suoi segmenti spariscono solo se la cancellazione arriva al commit
+@event.listens_for(User, "after_delete")
+def _remember_deleted_user(_mapper, _connection, target: User) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("archive_deleted_users", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _delete_archived_segments(session: Session) -> None:
+    for user_id in session.info.pop("archive_deleted_users", ()):
+        delete_user_segments(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_deleted_users(session: Session) -> None:
+    session.info.pop("archive_deleted_users", None)
+
+
+def archive_events(db: Session, older_than: datetime | None = None) -> dict:
+    """
+    Sposta nei segmenti gli eventi archiviabili, un mese alla volta
+    (un file riscritto per utente e un commit per mese).
+    Ritorna {"events": spostati, "users": utenti coinvolti, "months": mesi
+    toccati, "segments": file riscritti}.
+    """
+    if older_than is None:
+        older_than = utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    cutoffs = archive_cutoffs(db, older_than)
+    summary = {"events": 0, "users": 0, "months": 0, "segments": 0}
+    if not cutoffs:
+        return summary
+    horizon = max(cutoff.before for cutoff in cutoffs.values())
+
+    oldest = db.execute(select(func.min(Event.created_at)).where(Event.created_at < horizon)).scalar()
+    if oldest is None:
+        return summary
+
+    users: set[str] = set()
+    month = month_of(oldest)
+    while month_start(month) < horizon:
+        following = next_month(month)
+        moved = []
+        for *columns, seq in db.execute(
+            select(*HOT_COLUMNS, Event.seq)
+            .where(Event.created_at >= month_start(month))
+            .where(Event.created_at < min(month_start(following), horizon))
+        ).tuples():
+            archived = ArchivedEvent(*columns)
+            cutoff = cutoffs.get(archived.user_id)
+            if cutoff and archived.created_at < cutoff.before and seq <= cutoff.max_seq:
+                moved.append(archived)
+        if moved:
+            by_user: dict[str, list[ArchivedEvent]] = {}
+            for archived in moved:
+                by_user.setdefault(archived.user_id, []).append(archived)
+            for user_id, user_moved in by_user.items():
+                write_user_month(db, user_id, month, user_moved)
+                summary["segments"] += 1
+            ids = [e.id for e in moved]
+            for start in range(0, len(ids), DELETE_CHUNK):
+                db.execute(delete(Event).where(Event.id.in_(ids[start:start + DELETE_CHUNK])))
+            db.commit()
+
+            summary["events"] += len(moved)
+            summary["months"] += 1
+            users.update(e.user_id for e in moved)
+        month = following
+
+    summary["users"] = len(users)
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.db.database import SessionLocal, engine, init_db
+
+    parser = argparse.ArgumentParser(description="Sposta gli eventi freddi nei segmenti mensili compressi")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM finale per restituire lo spazio al filesystem")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    summary = archive_events(db, utcnow() - timedelta(days=args.older_than_days))
+    db.close()
+    if args.vacuum:
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+    print(
+        f"✅ Archiviati {summary['events']} eventi di {summary['users']} utenti "
+        f"in {summary['segments']} segmenti su {summary['months']} mesi ({EVENT_ARCHIVE_DIR})"
+    )
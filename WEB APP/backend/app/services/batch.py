@@ -0,0 +1,406 @@
+"""
+Ricalcolo batch — crescita pesci e stato del mare per tutti gli utenti.
+
+Per il ricalcolo notturno: invece di chiamare compute_fish_growth e
+compute_sea_state utente per utente (con più round trip ORM ciascuno),
+carica gli eventi di un blocco di utenti come array NumPy colonnari
+(indice utente, indice pesce, tipo evento, seq) e il rollup
+giornaliero degli ultimi giorni, e applica le stesse
+formule con operazioni raggruppate. I risultati vengono scritti con un
+upsert bulk e coincidono esattamente con quelli delle funzioni per utente.
+
+Run:
+    python -m app.services.batch
+"""
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import case, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models.models import Event, Fish, FishState, SeaState, User, UserDailyStats, as_utc
+from app.services import growth, sea_state
+from app.services.archive import first_event_times, read_cold_events
+
+
+# ──────────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────────
+CHUNK_SIZE: int = 500  # utenti per blocco (resta sotto il limite di parametri SQLite)
+
+US_PER_DAY = 86_400_000_000
+NO_WATERMARK = np.iinfo(np.int64).min
+SHARED = -1   # evento senza fish_id: conta per tutti i pesci
+IGNORED = -2  # fish_id che non appartiene all'utente
+
+
+# ──────────────────────────────────────────────
+# UTILS
+# ──────────────────────────────────────────────
+def _to_us(values: list[datetime]) -> np.ndarray:
+    """datetime naive (UTC, come li restituisce SQLite) → microsecondi, int64."""
+    return np.array(values, dtype="datetime64[us]").astype(np.int64)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    return as_utc(value).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _days_active(first_us: np.ndarray, reference_us: int) -> np.ndarray:
+    """Equivalente vettoriale di max((reference - first).days, 1)."""
+    return np.maximum((reference_us - first_us) // US_PER_DAY, 1)
+
+
+def _lookup(fn, keys: np.ndarray) -> np.ndarray:
+    """Applica una funzione scalare ai valori distinti (es. time_factor)."""
+    uniques, inverse = np.unique(keys, return_inverse=True)
+    return np.array([fn(int(k)) for k in uniques], dtype=np.float64)[inverse]
+
+
+def _sequential_group_sum(values: np.ndarray, group: np.ndarray, rank: np.ndarray, n_groups: int) -> np.ndarray:
+    """
+    Somma per gruppo nello stesso ordine di sum() in Python (rank crescente),
+    così il risultato in virgola mobile è identico bit per bit.
+    """
+    totals = np.zeros(n_groups, dtype=np.float64)
+    for r in range(int(rank.max()) + 1 if len(rank) else 0):
+        mask = rank == r
+        totals[group[mask]] += values[mask]
+    return totals
+
+
+def _rank_within(group: np.ndarray) -> np.ndarray:
+    """Posizione di ogni elemento nel suo gruppo (group già ordinato)."""
+    if len(group) == 0:
+        return np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    sizes = np.diff(np.r_[starts, len(group)])
+    return np.arange(len(group)) - np.repeat(starts, sizes)
+
+
+# ──────────────────────────────────────────────
+# GROWTH KERNEL
+# ──────────────────────────────────────────────
+def _grow_chunk(
+    db: Session,
+    user_ids: list[str],
+    reference_date: datetime,
+    full_rebuild: bool,
+) -> tuple[dict, list[dict], list[dict]]:
+    """
+    Crescita dei pesci di un blocco di utenti.
+
+    Ritorna (fish, righe da aggiornare, righe da inserire): fish sono gli
+    array per pesce ordinati per (utente, fish.id), usati poi dal mare.
+    """
+    n_users = len(user_ids)
+    user_index = {uid: i for i, uid in enumerate(user_ids)}
+    reference_us = int(_to_us([_naive_utc(reference_date)])[0])
+
+    # ── Pesci e stato corrente ──
+    fish_rows = db.execute(
+        select(
+            Fish.user_id, Fish.id, FishState.fish_id, FishState.growth_level,
+            FishState.last_event_seq,
+        )
+        .outerjoin(FishState, FishState.fish_id == Fish.id)
+        .where(Fish.user_id.in_(user_ids))
+    ).all()
+    fish_rows.sort(key=lambda r: (user_index[r.user_id], r.id))
+
+    n_fish = len(fish_rows)
+    fish_user = np.array([user_index[r.user_id] for r in fish_rows], dtype=np.int64)
+    fish_index = {(r.user_id, r.id): i for i, r in enumerate(fish_rows)}
+    had_state = np.array([r.fish_id is not None for r in fish_rows], dtype=bool)
+    prev = np.array(
+        [(r.growth_level or 0.0) if r.fish_id is not None else 0.0 for r in fish_rows],
+        dtype=np.float64,
+    )
+    wm_seq = [r.last_event_seq for r in fish_rows]
+    if full_rebuild:
+        prev[:] = 0.0
+        wm_seq = [None] * n_fish
+
+    # ── Primo evento per utente (giorni attivi), anche se archiviato ──
+    first_rows = list(first_event_times(db, user_ids).items())
+    first_us = np.zeros(n_users, dtype=np.int64)
+    has_events = np.zeros(n_users, dtype=bool)
+    if first_rows:
+        idx = np.array([user_index[r[0]] for r in first_rows], dtype=np.int64)
+        first_us[idx] = _to_us([r[1] for r in first_rows])
+        has_events[idx] = True
+    growth_tf = _lookup(growth.time_factor, _days_active(first_us, reference_us))
+
+    # ── Eventi oltre il watermark più vecchio di ogni utente ──
+    stmt = select(
+        Event.user_id, Event.id, Event.event_type, Event.fish_id, Event.seq
+    ).where(Event.user_id.in_(user_ids))
+    if not full_rebuild:
+        oldest = (
+            select(
+                Fish.user_id.label("user_id"),
+                case(
+                    (func.count(FishState.last_event_seq) < func.count(Fish.id), None),
+                    else_=func.min(FishState.last_event_seq),
+                ).label("since"),
+            )
+            .outerjoin(FishState, FishState.fish_id == Fish.id)
+            .where(Fish.user_id.in_(user_ids))
+            .group_by(Fish.user_id)
+            .subquery()
+        )
+        stmt = stmt.join(oldest, oldest.c.user_id == Event.user_id).where(
+            or_(oldest.c.since.is_(None), Event.seq > oldest.c.since)
+        )
+    event_rows = db.execute(stmt).all()
+    event_seqs = [r.seq for r in event_rows]
+    if full_rebuild:
+        # Gli eventi archiviati sono già assorbiti da ogni watermark: servono
+        # solo qui, con seq 0 come in compute_fish_growth
+        hot_ids = {r.id for r in event_rows}
+        cold_rows = [r for r in read_cold_events(db, user_ids) if r.id not in hot_ids]
+        event_rows += cold_rows
+        event_seqs += [0] * len(cold_rows)
+
+    event_types = sorted({r.event_type for r in event_rows})
+    type_index = {t: i for i, t in enumerate(event_types)}
+    n_types = len(event_types)
+
+    ev_user = np.array([user_index[r.user_id] for r in event_rows], dtype=np.int64)
+    ev_seq = np.array(event_seqs, dtype=np.int64)
+    ev_type = np.array([type_index[r.event_type] for r in event_rows], dtype=np.int64)
+    ev_target = np.empty(len(event_rows), dtype=np.int64)
+    for i, r in enumerate(event_rows):
+        if r.fish_id is None:
+            ev_target[i] = SHARED
+        else:
+            ev_target[i] = fish_index.get((r.user_id, r.fish_id), IGNORED)
+
+    # Ordine totale (utente, seq), come la scansione per utente
+    order = np.lexsort((ev_seq, ev_user))
+    ev_user, ev_seq = ev_user[order], ev_seq[order]
+    ev_type, ev_target = ev_type[order], ev_target[order]
+    n_events = len(ev_user)
+
+    # ── Inizio (primo evento oltre il watermark) e fine per ogni pesce ──
+    # I watermark vengono fusi con gli eventi come "sonde": a parità di chiave
+    # la sonda va dopo l'evento, quindi conta gli eventi <= watermark.
+    probe_seq = np.array(
+        [NO_WATERMARK if seq is None else seq for seq in wm_seq], dtype=np.int64
+    )
+
+    merged_user = np.concatenate([ev_user, fish_user])
+    merged_seq = np.concatenate([ev_seq, probe_seq])
+    is_probe = np.concatenate([np.zeros(n_events, dtype=np.int64), np.ones(n_fish, dtype=np.int64)])
+    merged_order = np.lexsort((is_probe, merged_seq, merged_user))
+    probes_before = np.cumsum(is_probe[merged_order]) - is_probe[merged_order]
+    position = np.empty(n_events + n_fish, dtype=np.int64)
+    position[merged_order] = np.arange(n_events + n_fish) - probes_before
+    fish_start = position[n_events:]
+    fish_end = np.searchsorted(ev_user, fish_user, side="right")
+
+    # ── Conteggi per (pesce, tipo) ──
+    # Eventi condivisi: differenza di somme prefisse fra inizio e fine.
+    counts = np.zeros((n_fish, n_types), dtype=np.int64)
+    shared = ev_target == SHARED
+    for t in range(n_types):
+        prefix = np.concatenate([[0], np.cumsum(shared & (ev_type == t))])
+        counts[:, t] += prefix[fish_end] - prefix[fish_start]
+    # Eventi con fish_id: contano solo dopo il watermark del loro pesce.
+    targeted = np.flatnonzero(ev_target >= 0)
+    targeted = targeted[targeted >= fish_start[ev_target[targeted]]]
+    if len(targeted):
+        flat = np.bincount(
+            ev_target[targeted] * n_types + ev_type[targeted], minlength=n_fish * n_types
+        )
+        counts += flat.reshape(n_fish, n_types)
+
+    # ── EMA + cumulativo, come growth.compute_fish_growth ──
+    weighted = np.zeros(n_fish, dtype=np.float64)
+    for t, event_type in enumerate(event_types):
+        weighted = weighted + growth.EVENT_WEIGHTS.get(event_type, 0.0) * counts[:, t]
+    daily_growth = weighted * growth_tf[fish_user]
+    grown = np.minimum(prev + growth.ema(prev, daily_growth), growth.MAX_GROWTH)
+
+    active = has_events[fish_user]
+    has_new = active & (counts.sum(axis=1) > 0)
+    advanced = active & (fish_end > fish_start)
+    level = np.where(has_new, grown, prev)
+
+    updates, inserts = [], []
+    for i in np.flatnonzero(active):
+        row = fish_rows[i]
+        values = {
+            "fish_id": row.id,
+            "growth_level": float(level[i]),
+            "last_computed": reference_date,
+            "last_event_seq": wm_seq[i],
+        }
+        if advanced[i]:
+            values["last_event_seq"] = int(ev_seq[fish_end[i] - 1])
+        if has_new[i]:
+            values["visual_stage"] = growth.discretize_visual_stage(float(level[i]))
+        if had_state[i]:
+            updates.append(values)
+        else:
+            values.setdefault("visual_stage", "small")
+            inserts.append(values)
+
+    fish = {
+        "user": fish_user,
+        "level": level,
+        "has_state": had_state | active,
+        "first_us": first_us,
+        "has_events": has_events,
+        "reference_us": reference_us,
+    }
+    return fish, updates, inserts
+
+
+# ──────────────────────────────────────────────
+# SEA STATE KERNEL
+# ──────────────────────────────────────────────
+def _sea_chunk(
+    db: Session,
+    user_ids: list[str],
+    fish: dict,
+    reference_date: datetime,
+) -> tuple[list[dict], list[dict]]:
+    """Stato del mare di un blocco di utenti, a crescita già aggiornata."""
+    n_users = len(user_ids)
+    user_index = {uid: i for i, uid in enumerate(user_ids)}
+    lookback = sea_state.LOOKBACK_DAYS
+
+    # ── Media crescita (somma in ordine di fish.id, come per utente) ──
+    with_state = np.flatnonzero(fish["has_state"])
+    state_user = fish["user"][with_state]
+    totals = _sequential_group_sum(
+        fish["level"][with_state], state_user, _rank_within(state_user), n_users
+    )
+    n_states = np.bincount(state_user, minlength=n_users)
+    avg_growth = np.divide(
+        totals, n_states, out=np.zeros(n_users, dtype=np.float64), where=n_states > 0
+    )
+
+    # ── CI ed ES dal rollup giornaliero ──
+    daily = db.execute(
+        select(
+            UserDailyStats.user_id, UserDailyStats.event_count,
+            UserDailyStats.anxiety_count, UserDailyStats.anxiety_sum,
+            UserDailyStats.anxiety_sq_sum,
+        )
+        .where(UserDailyStats.user_id.in_(user_ids))
+        .where(sea_state.in_lookback(reference_date))
+    ).all()
+    daily_user = np.array([user_index[r.user_id] for r in daily], dtype=np.int64)
+
+    def per_user(column: str) -> np.ndarray:
+        weights = np.array([getattr(r, column) for r in daily], dtype=np.int64)
+        return np.bincount(daily_user, weights=weights, minlength=n_users).astype(np.int64)
+
+    has_activity = np.array([r.event_count > 0 for r in daily], dtype=bool)
+    active_days = np.bincount(daily_user[has_activity], minlength=n_users)
+    ci = np.minimum(active_days / lookback, 1.0)
+
+    n_values = per_user("anxiety_count")
+    safe_n = np.maximum(n_values, 1)
+    mean = per_user("anxiety_sum") / safe_n
+    variance = np.maximum(per_user("anxiety_sq_sum") / safe_n - mean * mean, 0.0)
+    es = np.where(
+        n_values < 3,
+        sea_state.NEUTRAL_ES,
+        np.maximum(0.0, 1 - np.minimum(variance / 4, 1.0)),
+    )
+
+    # ── Time factor e punteggio ──
+    days = np.where(
+        fish["has_events"], _days_active(fish["first_us"], fish["reference_us"]), 1
+    )
+    sea_tf = _lookup(sea_state.time_factor, days)
+    raw_score = sea_state.sea_score(avg_growth, ci, es, sea_tf)
+
+    previous_rows = db.execute(
+        select(SeaState.user_id, SeaState.sea_state_score)
+        .where(SeaState.user_id.in_(user_ids))
+    ).all()
+    previous = np.zeros(n_users, dtype=np.float64)
+    has_sea = np.zeros(n_users, dtype=bool)
+    for user_id, score in previous_rows:
+        previous[user_index[user_id]] = score
+        has_sea[user_index[user_id]] = True
+
+    # Smoothing + non-regression rule
+    final_score = np.maximum(previous, sea_state.ema(previous, raw_score))
+
+    updates, inserts = [], []
+    for i, user_id in enumerate(user_ids):
+        score = float(final_score[i])
+        label = sea_state.discretize_sea_state(score)
+        values_row = {
+            "user_id": user_id,
+            "sea_state_score": score,
+            "sea_state_label": label,
+            "visual_params": sea_state.visual_params_from_state(label),
+            "last_computed": reference_date,
+        }
+        (updates if has_sea[i] else inserts).append(values_row)
+    return updates, inserts
+
+
+# ──────────────────────────────────────────────
+# CORE LOGIC
+# ──────────────────────────────────────────────
+def compute_state_batch(
+    db: Session,
+    user_ids: list[str] | None = None,
+    reference_date: datetime | None = None,
+    full_rebuild: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    """
+    Ricalcola crescita pesci + stato del mare per molti utenti.
+
+    Equivale a chiamare compute_fish_growth e poi compute_sea_state per
+    ogni utente, ma a blocchi di chunk_size utenti: poche query per blocco,
+    calcolo vettoriale e upsert bulk. Ritorna il numero di utenti elaborati.
+    """
+    if reference_date is None:
+        reference_date = datetime.now(timezone.utc)
+    reference_date = as_utc(reference_date)
+
+    if user_ids is None:
+        user_ids = db.execute(select(User.id).order_by(User.id)).scalars().all()
+    user_ids = list(user_ids)
+
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+
+        fish, fish_updates, fish_inserts = _grow_chunk(db, chunk, reference_date, full_rebuild)
+        if fish_updates:
+            db.execute(update(FishState), fish_updates)
+        if fish_inserts:
+            db.execute(insert(FishState), fish_inserts)
+
+        sea_updates, sea_inserts = _sea_chunk(db, chunk, fish, reference_date)
+        if sea_updates:
+            db.execute(update(SeaState), sea_updates)
+        if sea_inserts:
+            db.execute(insert(SeaState), sea_inserts)
+
+        db.commit()
+
+    return len(user_ids)
+
+
+if __name__ == "__main__":
+    from app.db.database import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    started = time.perf_counter()
+    processed = compute_state_batch(db)
+    elapsed = time.perf_counter() - started
+    db.close()
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"✅ Ricalcolo batch: {processed} utenti in {elapsed:.2f}s ({rate:.0f} utenti/s)")
@@ -0,0 +1,164 @@
+"""
+Rollup giornaliero dell'attività — alimenta gli indici dello stato del mare.
+
+Per ogni (utente, giorno UTC) tiene contatori additivi: eventi, check-in,
+somma e somma dei quadrati dei livelli d'ansia. Viene aggiornato nella
+stessa transazione in cui nasce l'evento, così lo stato del mare legge
+al massimo LOOKBACK_DAYS righe piccole invece dello storico eventi.
+
+Backfill per i dati già esistenti:
+    python -m app.services.daily_stats
+"""
+from datetime import date, datetime, timezone
+from sqlalchemy import Date, bindparam, case, delete, func, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from app.models.models import Event, UserDailyStats, as_utc
+from app.services.archive import read_cold_events
+
+
+COUNTERS = ("event_count", "checkin_count", "anxiety_count", "anxiety_sum", "anxiety_sq_sum")
+
+
+# ──────────────────────────────────────────────
+# UTILS
+# ──────────────────────────────────────────────
+def event_day(created_at: datetime) -> date:
+    """Giorno UTC a cui l'evento viene attribuito."""
+    return as_utc(created_at).astimezone(timezone.utc).date()
+
+
+def stats_delta(event_type: str, anxiety_level: int | None) -> dict[str, int]:
+    """Incremento dei contatori prodotto da un singolo evento."""
+    is_checkin = event_type == "check_in"
+    anxiety = anxiety_level if is_checkin else None
+    return {
+        "event_count": 1,
+        "checkin_count": 1 if is_checkin else 0,
+        "anxiety_count": 0 if anxiety is None else 1,
+        "anxiety_sum": anxiety or 0,
+        "anxiety_sq_sum": (anxiety or 0) ** 2,
+    }
+
+
+def merge_delta(total: dict[str, int], delta: dict[str, int]) -> None:
+    for key in COUNTERS:
+        total[key] = total.get(key, 0) + delta[key]
+
+
+# ──────────────────────────────────────────────
+# CORE LOGIC
+# ──────────────────────────────────────────────
+def add_to_daily_stats(db: Session, user_id: str, day: date, delta: dict[str, int]) -> None:
+    """
+    Somma delta alla riga (user_id, day), creandola se manca.
+
+    L'incremento avviene lato SQL (col = col + n) per non perdere
+    aggiornamenti concorrenti. Non fa commit: resta nella transazione
+    di chi scrive l'evento.
+    """
+    result = db.execute(
+        update(UserDailyStats)
+        .where(UserDailyStats.user_id == user_id)
+        .where(UserDailyStats.day == day)
+        .values({
+            key: getattr(UserDailyStats, key) + delta[key] for key in COUNTERS
+        })
+    )
+    if result.rowcount == 0:
+        db.add(UserDailyStats(user_id=user_id, day=day, **delta))
+        db.flush()  # visibile agli UPDATE successivi della stessa sessione
+
+
+def add_many_to_daily_stats(db: Session, deltas: dict[tuple[str, date], dict[str, int]]) -> None:
+    """
+    Come add_to_daily_stats per più righe (user_id, day) insieme: un SELECT
+    delle righe esistenti, un UPDATE executemany e un INSERT executemany.
+    """
+    if not deltas:
+        return
+    table = UserDailyStats.__table__
+    existing = set(db.execute(
+        select(table.c.user_id, table.c.day)
+        .where(tuple_(table.c.user_id, table.c.day).in_(list(deltas)))
+    ).tuples())
+
+    updates = [
+        {"b_user_id": user_id, "b_day": day, **{f"d_{key}": delta[key] for key in COUNTERS}}
+        for (user_id, day), delta in deltas.items() if (user_id, day) in existing
+    ]
+    if updates:
+        db.execute(
+            update(table)
+            .where(table.c.user_id == bindparam("b_user_id"))
+            .where(table.c.day == bindparam("b_day"))
+            .values({key: table.c[key] + bindparam(f"d_{key}") for key in COUNTERS}),
+            updates,
+        )
+    inserts = [
+        {"user_id": user_id, "day": day, **delta}
+        for (user_id, day), delta in deltas.items() if (user_id, day) not in existing
+    ]
+    if inserts:
+        db.execute(insert(table), inserts)
+
+
+def record_event_stats(
+    db: Session,
+    user_id: str,
+    event_type: str,
+    anxiety_level: int | None,
+    created_at: datetime,
+) -> None:
+    """Aggiorna il rollup per un nuovo evento (senza commit)."""
+    add_to_daily_stats(db, user_id, event_day(created_at), stats_delta(event_type, anxiety_level))
+
+
+def backfill_daily_stats(db: Session) -> int:
+    """
+    Ricostruisce da zero il rollup a partire dalla tabella events,
+    aggregando lato SQL sulle colonne tipizzate, più gli eventi archiviati.
+    Ritorna il numero di righe (utente, giorno) scritte.
+    """
+    is_checkin = Event.event_type == "check_in"
+    checkin_anxiety = case((is_checkin, Event.anxiety_level))
+    day = func.date(Event.created_at, type_=Date)
+
+    rows = db.execute(
+        select(
+            Event.user_id,
+            day,
+            func.count(),
+            func.sum(case((is_checkin, 1), else_=0)),
+            func.count(checkin_anxiety),
+            func.coalesce(func.sum(checkin_anxiety), 0),
+            func.coalesce(func.sum(checkin_anxiety * checkin_anxiety), 0),
+        )
+        .group_by(Event.user_id, day)
+    ).all()
+
+    totals = {(row[0], row[1]): dict(zip(COUNTERS, row[2:])) for row in rows}
+    for event in read_cold_events(db):
+        merge_delta(
+            totals.setdefault((event.user_id, event_day(event.created_at)), {}),
+            stats_delta(event.event_type, event.anxiety_level),
+        )
+
+    db.execute(delete(UserDailyStats))
+    if totals:
+        db.execute(insert(UserDailyStats), [
+            {"user_id": user_id, "day": day, **counters}
+            for (user_id, day), counters in totals.items()
+        ])
+    db.commit()
+    return len(totals)
+
+
+if __name__ == "__main__":
+    from app.db.database import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    written = backfill_daily_stats(db)
+    db.close()
+    print(f"✅ Rollup giornaliero ricostruito: {written} righe (utente, giorno)")
@@ -1,55 +1,130 @@
 """
 📊 Export & Analytics Module — Genera JSON e insights
 
-Esporta dati utente in formato JSON per analytics e backup.
+Esporta dati utente in formato JSON per analytics e backup, anche in
+streaming (JSON o NDJSON) per storici lunghi.
 Opzionalmente sincronizza con MongoDB.
 """
 import json
 from datetime import datetime, timezone
-from sqlalchemy.orm import Session
+from typing import Iterator
+from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy import select
 
-from app.models.models import Event, User, Fish, FishState, SeaState
+from app.models.models import Event, User, Fish
 from app.db.mongodb import upload_user_analytics, get_user_insights
+from app.services.archive import EVENT_STREAM_BATCH, iter_events, read_events
+from app.services.tracing import traced
 
+EXPORT_VERSION = "1.0"
+EXPORT_CHUNK_BYTES = 64 * 1024  # byte per pezzo della risposta in streaming
 
-def calculate_event_stats(events: list[Event]) -> dict:
-    """Calcola statistiche aggregate degli eventi."""
-    if not events:
+
+class EventStats:
+    """Statistiche aggregate calcolate un evento alla volta (export in streaming)."""
+
+    def __init__(self):
+        self.total = 0
+        self.anxiety_sum = 0
+        self.anxiety_count = 0
+        self.dimensions: dict[str, int] = {}
+
+    def add(self, event) -> None:
+        self.total += 1
+        # Ansia (colonna tipizzata, estratta da metadata in scrittura)
+        if event.anxiety_level is not None:
+            self.anxiety_sum += event.anxiety_level
+            self.anxiety_count += 1
+        # Dimensioni
+        dim = event.dimension
+        if dim:
+            self.dimensions[dim] = self.dimensions.get(dim, 0) + 1
+
+    def result(self) -> dict:
+        if not self.total:
+            return {
+                "total_events": 0,
+                "avg_anxiety": 0,
+                "dimensions_breakdown": {},
+            }
+        avg_anxiety = self.anxiety_sum / self.anxiety_count if self.anxiety_count else 0
         return {
-            "total_events": 0,
-            "avg_anxiety": 0,
-            "dimensions_breakdown": {},
+            "total_events": self.total,
+            "avg_anxiety": round(avg_anxiety, 2),
+            "dimensions_breakdown": self.dimensions,
+            "anxiety_samples": self.anxiety_count,
         }
-    
-    anxiety_values = []
-    dimensions = {}
-    
+
+
+def calculate_event_stats(events: list[Event]) -> dict:
+    """Calcola statistiche aggregate degli eventi."""
+    stats = EventStats()
     for event in events:
-        metadata = event.metadata_json or {}
-        
-        # Ansia
-        if "anxiety" in metadata:
-            anxiety_values.append(metadata["anxiety"])
-        
-        # Dimensioni
-        dim = metadata.get("dimension")
-        if dim:
-            dimensions[dim] = dimensions.get(dim, 0) + 1
-    
-    avg_anxiety = sum(anxiety_values) / len(anxiety_values) if anxiety_values else 0
-    
+        stats.add(event)
+    return stats.result()
+
+
+# ──────────────────────────────────────────────
+# RECORD DELL'EXPORT
+# ──────────────────────────────────────────────
+def event_record(event) -> dict:
+    return {
+        "id": event.id,
+        "type": event.event_type,
+        "timestamp": event.created_at.isoformat(),
+        "anxiety": event.anxiety_level,
+        "dimension": event.dimension,
+        "metadata": event.metadata_json or {},
+    }
+
+
+def export_header(db: Session, user_id: str) -> dict | None:
+    """
+    Utente e stato di gioco dell'export (pochi dati, letti prima degli
+    eventi); None se l'utente non esiste.
+    """
+    # Fetch user con pesci, stati e mare in un colpo solo
+    user = db.execute(
+        select(User)
+        .where(User.id == user_id)
+        .options(
+            selectinload(User.fish).joinedload(Fish.state),
+            joinedload(User.sea_state),
+        )
+    ).scalar_one_or_none()
+    if not user:
+        return None
+
+    sea_state = user.sea_state
     return {
-        "total_events": len(events),
-        "avg_anxiety": round(avg_anxiety, 2),
-        "dimensions_breakdown": dimensions,
-        "anxiety_samples": len(anxiety_values),
+        "user": {
+            "id": user.id,
+            "email": user.email,
+            "created_at": user.created_at.isoformat(),
+            "locale": user.locale,
+        },
+        "game_state": {
+            "fish": [
+                {
+                    "dimension": f.dimension,
+                    "growth_level": f.state.growth_level if f.state else 0.0,
+                    "visual_stage": f.state.visual_stage if f.state else "small",
+                }
+                for f in user.fish
+            ],
+            "sea_state": {
+                "label": sea_state.sea_state_label if sea_state else "neutro",
+                "score": sea_state.sea_state_score if sea_state else 0.0,
+            },
+        },
     }
 
 
+@traced
 def export_user_data(db: Session, user_id: str) -> dict:
     """
-    Esporta tutti i dati dell'utente in formato JSON.
+    Esporta tutti i dati dell'utente in formato JSON, in memoria (usato
+    dalla sync MongoDB; l'endpoint usa stream_user_export).
     
     Struttura:
     {
@@ -60,69 +135,93 @@ def export_user_data(db: Session, user_id: str) -> dict:
         "export_date": "...",
     }
     """
-    # Fetch user
-    user = db.get(User, user_id)
-    if not user:
+    header = export_header(db, user_id)
+    if header is None:
         return {"error": "User not found"}
     
-    # Fetch events
-    events = db.execute(
-        select(Event).where(Event.user_id == user_id).order_by(Event.created_at)
-    ).scalars().all()
-    
-    # Fetch fish state
-    fish = db.execute(
-        select(Fish).where(Fish.user_id == user_id)
-    ).scalars().all()
-    
-    # Fetch sea state
-    sea_state = db.get(SeaState, user_id)
-    
-    # Build events list
-    events_list = []
-    for event in events:
-        events_list.append({
-            "id": event.id,
-            "type": event.event_type,
-            "timestamp": event.created_at.isoformat(),
-            "metadata": event.metadata_json or {},
-        })
-    
-    # Build fish state
-    fish_state_list = []
-    for f in fish:
-        state = db.get(FishState, f.id)
-        fish_state_list.append({
-            "dimension": f.dimension,
-            "growth_level": state.growth_level if state else 0.0,
-            "visual_stage": state.visual_stage if state else "small",
-        })
-    
-    # Summary stats
-    stats = calculate_event_stats(events)
+    # Fetch events (tabella + segmenti archiviati)
+    events = read_events(db, user_id)
     
     # Export document
-    export_data = {
-        "user": {
-            "id": user.id,
-            "email": user.email,
-            "created_at": user.created_at.isoformat(),
-            "locale": user.locale,
-        },
-        "events": events_list,
-        "game_state": {
-            "fish": fish_state_list,
-            "sea_state": {
-                "label": sea_state.sea_state_label if sea_state else "neutro",
-                "score": sea_state.sea_state_score if sea_state else 0.0,
-            }
-        },
-        "summary": stats,
+    return {
+        "user": header["user"],
+        "events": [event_record(event) for event in events],
+        "game_state": header["game_state"],
+        "summary": calculate_event_stats(events),
         "export_date": datetime.now(timezone.utc).isoformat(),
-        "version": "1.0",
+        "version": EXPORT_VERSION,
     }
-    
-    return export_data
+
+
+# ──────────────────────────────────────────────
+# EXPORT IN STREAMING
+# ──────────────────────────────────────────────
+def _dumps(value) -> str:
+    # Come JSONResponse di Starlette: format=json è identico all'export in memoria
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"))
+
+
+def stream_user_export(
+    session_factory,
+    user_id: str,
+    header: dict,
+    fmt: str = "json",
+    batch_size: int = EVENT_STREAM_BATCH,
+) -> Iterator[bytes]:
+    """
+    L'export un blocco da ~EXPORT_CHUNK_BYTES alla volta, per StreamingResponse.
+
+    Gli eventi arrivano da iter_events (cursore a blocchi di batch_size) e
+    le statistiche si aggiornano man mano: la memoria resta costante
+    qualunque sia lo storico. La sessione è propria del generatore, perché
+    quella della dipendenza si chiude prima che parta la risposta.
+
+    - fmt="json": lo stesso documento di export_user_data, in pezzi;
+    - fmt="ndjson": un oggetto per riga, {"export": {...}}, {"user": {...}},
+      {"game_state": {...}}, un {"event": {...}} per evento e {"summary": {...}}
+      in fondo.
+
+    Fuori dal profilo production (senza WAL) il cursore aperto tiene il
+    lock di lettura finché il client non ha letto tutto.
+    """
+    ndjson = fmt == "ndjson"
+    export_date = datetime.now(timezone.utc).isoformat()
+    if ndjson:
+        parts = [
+            _dumps({"export": {"version": EXPORT_VERSION, "export_date": export_date}}), "\n",
+            _dumps({"user": header["user"]}), "\n",
+            _dumps({"game_state": header["game_state"]}), "\n",
+        ]
+    else:
+        parts = ['{"user":', _dumps(header["user"]), ',"events":[']
+    size = sum(map(len, parts))
+
+    stats = EventStats()
+    separator = ""
+    with session_factory() as db:
+        for event in iter_events(db, user_id, batch_size=batch_size):
+            stats.add(event)
+            if ndjson:
+                line = _dumps({"event": event_record(event)}) + "\n"
+            else:
+                line = separator + _dumps(event_record(event))
+                separator = ","
+            parts.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_BYTES:
+                yield "".join(parts).encode()
+                parts, size = [], 0
+
+    if ndjson:
+        parts += [_dumps({"summary": stats.result()}), "\n"]
+    else:
+        parts += [
+            '],"game_state":', _dumps(header["game_state"]),
+            ',"summary":', _dumps(stats.result()),
+            ',"export_date":', _dumps(export_date),
+            ',"version":', _dumps(EXPORT_VERSION), "}",
+        ]
+    yield "".join(parts).encode()
 
 
 def sync_to_mongodb(db: Session, user_id: str) -> dict:
@@ -8,9 +8,12 @@ rispetto all'intensità delle interazioni.
 from datetime import datetime, timezone
 from math import log
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import select, true
 
-from app.models.models import Event, Fish, FishState
+from app.models.models import Event, Fish, FishState, as_utc
+from app.services.archive import first_event_at, read_cold_events
+from app.services.metrics import timed
+from app.services.tracing import traced
 
 
 # ──────────────────────────────────────────────
@@ -54,90 +57,169 @@ def discretize_visual_stage(growth_level: float) -> str:
     return "adult"
 
 
+def apply_growth(previous_growth: float, type_counts: dict[str, int], tf: float) -> float:
+    """Un passo di crescita: EMA sui nuovi eventi + cumulativo. MAI diminuisce."""
+    # Contributo dei nuovi eventi
+    daily_growth = weighted_growth(type_counts) * tf
+
+    # Smoothing EMA
+    growth_today = ema(previous_growth, daily_growth)
+
+    # Crescita cumulativa
+    return min(previous_growth + growth_today, MAX_GROWTH)
+
+
 # ──────────────────────────────────────────────
 # CORE LOGIC
 # ──────────────────────────────────────────────
+def after_watermark(last_event_seq: int | None):
+    """Condizione SQL: eventi inseriti dopo il watermark."""
+    if last_event_seq is None:
+        return true()
+    return Event.seq > last_event_seq
+
+
+def watermark_key(fish_state: FishState) -> int:
+    """Chiave ordinabile del watermark; nessun watermark = prima di tutto."""
+    if fish_state.last_event_seq is None:
+        return -1
+    return fish_state.last_event_seq
+
+
+def weighted_growth(type_counts: dict[str, int]) -> float:
+    """Somma pesata degli eventi a partire dai conteggi per tipo."""
+    return sum(
+        EVENT_WEIGHTS.get(event_type, 0.0) * count
+        for event_type, count in sorted(type_counts.items())
+    )
+
+
+@traced
+@timed
 def compute_fish_growth(
     db: Session,
     user_id: str,
     reference_date: datetime | None = None,
+    full_rebuild: bool = False,
 ) -> None:
     """
-    Ricalcola lo stato di crescita di TUTTI i pesci dell'utente.
-
-    - Idempotente: può essere richiamato più volte.
-    - Deterministico: stesso input → stesso output.
+    Aggiorna lo stato di crescita di TUTTI i pesci dell'utente.
+
+    - Incrementale: per ogni pesce conta solo gli eventi inseriti dopo il
+      watermark last_event_seq e applica EMA + cumulativo solo a quelli.
+      Il costo scala con i nuovi eventi, non con lo storico. L'ordine è
+      quello di commit (Event.seq), non created_at: un evento retrodatato
+      o committato in ritardo non finisce mai dietro il watermark.
+    - Una sola scansione: gli eventi vengono letti una volta, a partire dal
+      watermark più vecchio, e smistati al pesce indicato da fish_id
+      (o a tutti i pesci se fish_id manca).
+    - Idempotente: senza nuovi eventi lo stato non cambia.
     - Non penalizza mai: growth_level non diminuisce.
+    - full_rebuild=True azzera crescita e watermark e riassorbe tutto lo storico.
     """
     if reference_date is None:
         reference_date = datetime.now(timezone.utc)
+    reference_date = as_utc(reference_date)
 
-    # Primo evento dell'utente (per calcolare giorni attivi)
-    first_event = db.execute(
-        select(Event.created_at)
-        .where(Event.user_id == user_id)
-        .order_by(Event.created_at.asc())
-        .limit(1)
-    ).scalar_one_or_none()
+    # Primo evento dell'utente (per calcolare giorni attivi), anche se archiviato
+    first_event = first_event_at(db, user_id)
 
     if not first_event:
         return  # nessun evento → nessun calcolo
 
-    days_active = max((reference_date - first_event).days, 1)
+    days_active = max((reference_date - as_utc(first_event)).days, 1)
     tf = time_factor(days_active)
 
-    # Tutti i pesci dell'utente
-    fish_list = db.execute(
-        select(Fish).where(Fish.user_id == user_id)
-    ).scalars().all()
-
-    for fish in fish_list:
-        # Eventi associati a questo pesce (via metadata)
-        all_events = db.execute(
-            select(Event)
+    # Tutti i pesci dell'utente con il loro stato, in una query
+    rows = db.execute(
+        select(Fish.id, FishState)
+        .outerjoin(FishState, FishState.fish_id == Fish.id)
+        .where(Fish.user_id == user_id)
+    ).all()
+
+    states: list[FishState] = []
+    for fish_id, fish_state in rows:
+        if fish_state is None:
+            fish_state = FishState(fish_id=fish_id, growth_level=0.0)
+            db.add(fish_state)
+        elif full_rebuild:
+            fish_state.growth_level = 0.0
+            fish_state.last_event_seq = None
+        states.append(fish_state)
+
+    if not states:
+        return
+
+    # Pesci in ordine di watermark: la scansione parte dal più vecchio
+    pending = sorted(states, key=watermark_key)
+    oldest = pending[0]
+
+    if oldest.last_event_seq is None:
+        hot = db.execute(
+            select(Event.id, Event.seq, Event.event_type, Event.fish_id)
+            .where(Event.user_id == user_id)
+            .order_by(Event.seq.asc())
+        ).all()
+        # Storico completo. Gli eventi archiviati sono già assorbiti da ogni
+        # watermark esistente (vedi archive_cutoffs): vengono prima, con seq 0.
+        # Un evento in entrambi i posti (archiviazione interrotta) conta una volta.
+        hot_ids = {e.id for e in hot}
+        events = [
+            (0, e.event_type, e.fish_id)
+            for e in read_cold_events(db, [user_id])
+            if e.id not in hot_ids
+        ]
+        events += [(e.seq, e.event_type, e.fish_id) for e in hot]
+    else:
+        events = db.execute(
+            select(Event.seq, Event.event_type, Event.fish_id)
             .where(Event.user_id == user_id)
-            .order_by(Event.created_at.asc())
-        ).scalars().all()
-
-        # Filtra eventi legati a questo pesce
-        fish_events = []
-        for event in all_events:
-            meta = event.metadata_json or {}
-            # Se l'evento non specifica un pesce, conta per tutti
-            event_fish_id = meta.get("fish_id")
-            if event_fish_id is None or event_fish_id == fish.id:
-                fish_events.append(event)
-
-        # Calcolo contributo giornaliero
-        daily_growth = 0.0
-        for event in fish_events:
-            daily_growth += EVENT_WEIGHTS.get(event.event_type, 0.0)
-
-        daily_growth *= tf
-
-        # Stato precedente
-        fish_state = db.get(FishState, fish.id)
-        previous_growth = fish_state.growth_level if fish_state else 0.0
-
-        # Smoothing EMA
-        growth_today = ema(previous_growth, daily_growth)
-
-        # Crescita cumulativa — MAI diminuisce
-        new_growth = min(previous_growth + growth_today, MAX_GROWTH)
-
-        # Upsert
-        if fish_state:
-            fish_state.growth_level = new_growth
-            fish_state.visual_stage = discretize_visual_stage(new_growth)
-            fish_state.last_computed = reference_date
-        else:
-            db.add(
-                FishState(
-                    fish_id=fish.id,
-                    growth_level=new_growth,
-                    visual_stage=discretize_visual_stage(new_growth),
-                    last_computed=reference_date,
-                )
-            )
+            .where(after_watermark(oldest.last_event_seq))
+            .order_by(Event.seq.asc())
+        ).all()
+
+    # Conteggi per tipo: per pesce (eventi con fish_id) e condivisi (senza fish_id).
+    # Un pesce riceve gli eventi condivisi arrivati dopo il suo watermark,
+    # cioè il totale finale meno quanto già accumulato alla sua attivazione.
+    fish_counts: dict[str, dict[str, int]] = {s.fish_id: {} for s in states}
+    shared_counts: dict[str, int] = {}
+    shared_at_activation: dict[str, dict[str, int]] = {}
+    next_pending = 0
+
+    for seq, event_type, event_fish_id in events:
+        while next_pending < len(pending) and watermark_key(pending[next_pending]) < seq:
+            shared_at_activation[pending[next_pending].fish_id] = dict(shared_counts)
+            next_pending += 1
+
+        # Se l'evento non specifica un pesce, conta per tutti
+        if event_fish_id is None:
+            shared_counts[event_type] = shared_counts.get(event_type, 0) + 1
+        elif event_fish_id in shared_at_activation:
+            counts = fish_counts[event_fish_id]
+            counts[event_type] = counts.get(event_type, 0) + 1
+
+    for fish_state in states:
+        fish_state.last_computed = reference_date
+        if fish_state.fish_id not in shared_at_activation:
+            continue  # nessun evento oltre il watermark
+
+        # Il watermark avanza su tutto ciò che è stato letto,
+        # anche sugli eventi destinati ad altri pesci
+        fish_state.last_event_seq = events[-1][0]
+
+        type_counts = dict(fish_counts[fish_state.fish_id])
+        baseline = shared_at_activation[fish_state.fish_id]
+        for event_type, count in shared_counts.items():
+            shared = count - baseline.get(event_type, 0)
+            if shared:
+                type_counts[event_type] = type_counts.get(event_type, 0) + shared
+
+        if not type_counts:
+            continue
+
+        new_growth = apply_growth(fish_state.growth_level or 0.0, type_counts, tf)
+
+        fish_state.growth_level = new_growth
+        fish_state.visual_stage = discretize_visual_stage(new_growth)
 
     db.commit()
@@ -0,0 +1,118 @@
+"""
+Ingestione eventi in blocco — diari offline e import dello storico.
+
+Tutti gli elementi sono validati prima di scrivere. Quelli validi entrano
+con un solo INSERT executemany e il rollup giornaliero riceve un delta per
+giorno, tutto nella transazione del chiamante (un solo commit, un fsync).
+"""
+import os
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.models.models import Event, as_utc, event_hot_columns, generate_uuid, next_event_seq, utcnow
+from app.schemas import EventBatchItem
+from app.services.daily_stats import add_many_to_daily_stats, event_day, merge_delta, stats_delta
+from app.services.replay import invalidate_snapshots
+
+
+MAX_BATCH_EVENTS = int(os.getenv("MAX_BATCH_EVENTS", "500"))
+MAX_CLOCK_SKEW = timedelta(minutes=5)  # tolleranza sugli orologi dei client
+EVENT_TYPE_MAX_LENGTH = Event.__table__.c.event_type.type.length
+
+
+# ──────────────────────────────────────────────
+# UTILS
+# ──────────────────────────────────────────────
+def event_row(user_id: str, event_type: str, metadata: dict | None, created_at: datetime) -> dict:
+    """Riga della tabella events pronta per un INSERT executemany."""
+    return {
+        "id": generate_uuid(),
+        "user_id": user_id,
+        "event_type": event_type,
+        "metadata_json": metadata,
+        "created_at": created_at,
+        **event_hot_columns(metadata),
+    }
+
+
+def daily_deltas(rows: list[dict]) -> dict[tuple[str, date], dict[str, int]]:
+    """Incrementi del rollup giornaliero prodotti da rows, per (utente, giorno)."""
+    deltas: dict[tuple[str, date], dict[str, int]] = {}
+    for row in rows:
+        merge_delta(
+            deltas.setdefault((row["user_id"], event_day(row["created_at"])), {}),
+            stats_delta(row["event_type"], row["anxiety_level"]),
+        )
+    return deltas
+
+
+def assign_event_seq(db: Session, rows: list[dict]) -> None:
+    """Assegna a rows valori consecutivi di Event.seq (prende il lock di scrittura)."""
+    first = next_event_seq(db.connection(), len(rows))
+    for offset, row in enumerate(rows):
+        row["seq"] = first + offset
+
+
+def insert_events(db: Session, rows: list[dict]) -> None:
+    """Scrive rows e il loro rollup giornaliero (senza commit)."""
+    # render_nulls: senza, l'ORM omette le colonne None e spezza l'executemany
+    # a ogni cambio di colonne presenti (es. check_in con ansia / micro_action senza)
+    deltas = daily_deltas(rows)  # prima dell'INSERT: fuori dal lock di scrittura
+    assign_event_seq(db, rows)
+    db.execute(insert(Event).execution_options(render_nulls=True), rows)
+    add_many_to_daily_stats(db, deltas)
+
+
+# ──────────────────────────────────────────────
+# VALIDATION
+# ──────────────────────────────────────────────
+def validate_event(item: EventBatchItem, user_id: str, now: datetime) -> str | None:
+    """Motivo per cui l'elemento è rifiutato, o None se è valido."""
+    if item.user_id != user_id:
+        return "user_id non corrisponde all'utente autenticato"
+    if not item.event_type or len(item.event_type) > EVENT_TYPE_MAX_LENGTH:
+        return "event_type mancante o troppo lungo"
+    if item.created_at is not None and as_utc(item.created_at) > now + MAX_CLOCK_SKEW:
+        return "created_at nel futuro"
+    return None
+
+
+# ──────────────────────────────────────────────
+# CORE LOGIC
+# ──────────────────────────────────────────────
+def ingest_events(
+    db: Session,
+    user_id: str,
+    items: list[EventBatchItem],
+    now: datetime | None = None,
+) -> list[dict]:
+    """
+    Inserisce gli elementi validi di items (senza commit) e ritorna gli
+    esiti per elemento. Anche gli eventi retrodatati hanno seq nuovo, quindi
+    la crescita incrementale li vede; gli snapshot dal giorno del primo
+    evento in poi non sono più validi e vengono cancellati.
+    """
+    now = now or utcnow()
+    results: list[dict] = []
+    rows: list[dict] = []
+
+    for index, item in enumerate(items):
+        error = validate_event(item, user_id, now)
+        if error:
+            results.append({"index": index, "status": "rejected", "detail": error})
+            continue
+
+        created_at = as_utc(item.created_at).astimezone(timezone.utc) if item.created_at else now
+        row = event_row(user_id, item.event_type, item.metadata, created_at)
+        rows.append(row)
+        results.append({"index": index, "status": "ok", "event_id": row["id"]})
+
+    if not rows:
+        return results
+
+    insert_events(db, rows)
+
+    earliest = min(row["created_at"] for row in rows)
+    invalidate_snapshots(db, user_id, event_day(earliest))
+    return results
@@ -0,0 +1,241 @@
+"""
+Metriche in formato Prometheus (testo 0.0.4) per GET /metrics.
+
+Nessuna dipendenza: contatori, gauge e istogrammi in memoria del processo
+(con più worker ognuno espone i suoi, Prometheus li somma per istanza).
+Ogni aggiornamento è qualche operazione su interi sotto un lock non
+conteso, quindi si può lasciare attivo in produzione (METRICS_ENABLED=0
+per spegnerlo).
+
+- MetricsMiddleware: latenza per metodo, route (il template, non il path
+  reale, per non moltiplicare le serie) e status; richieste in corso;
+  statement SQL e tempo DB per richiesta.
+- instrument_engine: eventi before/after_cursor_execute di SQLAlchemy; il
+  conteggio della richiesta corrente passa per un ContextVar, che il
+  threadpool di FastAPI copia nelle route e dipendenze sync.
+- timed: durata delle funzioni di servizio (compute_fish_growth, compute_sea_state).
+"""
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+# ──────────────────────────────────────────────
+# METRICHE
+# ──────────────────────────────────────────────
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _labels(self, values: tuple) -> str:
+        if not values:
+            return ""
+        pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, values))
+        return "{" + pairs + "}"
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, *labels) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._labels(labels)} {value}" for labels, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, *labels) -> None:
+        self.inc(-amount, *labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+        self._le = [f'le="{float(bound)!r}"' for bound in self.buckets] + ['le="+Inf"']
+        # labels → [conteggi per bucket (non cumulativi) + overflow, somma]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = []
+        for labels, counts, total in items:
+            pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels)]
+            cumulative = 0
+            for le, count in zip(self._le, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{{{','.join([*pairs, le])}}} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {total}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+registry: list[Metric] = []
+
+
+def render_metrics() -> str:
+    """Tutte le metriche nel formato di esposizione testuale di Prometheus."""
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Durata delle richieste HTTP", ("method", "route", "status")
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Richieste HTTP in corso")
+REQUEST_SQL_STATEMENTS = Histogram(
+    "http_request_sql_statements", "Statement SQL per richiesta", ("route",), buckets=COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "Tempo DB per richiesta", ("route",))
+DB_STATEMENTS = Counter("db_statements_total", "Statement SQL eseguiti", ("engine",))
+DB_SECONDS = Counter("db_seconds_total", "Tempo speso negli statement SQL", ("engine",))
+SERVICE_SECONDS = Histogram("service_duration_seconds", "Durata delle funzioni di servizio", ("function",))
+
+
+# ──────────────────────────────────────────────
+# SQL
+# ──────────────────────────────────────────────
+class RequestStats:
+    """Statement e tempo DB della richiesta corrente."""
+    __slots__ = ("statements", "db_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+_instrumented: set[int] = set()
+
+
+def instrument_engine(engine, label: str) -> None:
+    """Conta statement e tempo di ogni cursor execute dell'engine (una volta per engine)."""
+    if not METRICS_ENABLED or id(engine) in _instrumented:
+        return
+    _instrumented.add(id(engine))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        DB_STATEMENTS.inc(1, label)
+        DB_SECONDS.inc(elapsed, label)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_seconds += elapsed
+
+
+# ──────────────────────────────────────────────
+# SERVIZI
+# ──────────────────────────────────────────────
+def timed(fn):
+    """Decoratore: durata di fn in service_duration_seconds{function=...}."""
+    if not METRICS_ENABLED:
+        return fn
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            SERVICE_SECONDS.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
+
+# ──────────────────────────────────────────────
+# MIDDLEWARE HTTP
+# ──────────────────────────────────────────────
+class MetricsMiddleware:
+    """Middleware ASGI puro: nessun wrapping di request/response, solo tempi e status."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            _request_stats.reset(token)
+            # FastAPI mette la route trovata nello scope: il template tiene basse le serie
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            HTTP_REQUEST_SECONDS.observe(elapsed, scope["method"], path, str(status_code))
+            REQUEST_SQL_STATEMENTS.observe(stats.statements, path)
+            REQUEST_DB_SECONDS.observe(stats.db_seconds, path)
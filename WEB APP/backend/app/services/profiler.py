@@ -0,0 +1,203 @@
+"""
+Profiler a campionamento per il processo in esecuzione.
+
+Un thread legge gli stack di tutti gli altri thread (sys._current_frames)
+ogni `interval` secondi, senza hook su chiamate o righe: il costo dipende
+dalla frequenza e non dal codice profilato, quindi si può usare sul
+traffico reale (GET /debug/profile) o su un carico sintetico
+(python -m app.simulate --profile).
+
+Risultato:
+- stack collassati "thread;f1 (file:riga);f2 (file:riga) N", il formato
+  di flamegraph.pl, speedscope e inferno;
+- tabella delle funzioni più calde: campioni propri (foglia dello stack)
+  e totali (la funzione è nello stack);
+- opzionale, snapshot tracemalloc: righe che hanno allocato più memoria
+  durante il profilo.
+
+I thread fermi in attesa (select dell'event loop, Condition.wait, code dei
+listener) sono esclusi, altrimenti dominerebbero ogni profilo.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+DEBUG_PROFILE_MAX_SECONDS = float(os.getenv("DEBUG_PROFILE_MAX_SECONDS", "60"))
+DEFAULT_INTERVAL = 0.005  # 200 Hz
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (file, funzione) delle foglie di un thread inattivo
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("handlers.py", "dequeue"),
+    ("socket.py", "accept"),
+    ("connection.py", "wait"),
+    ("thread.py", "_worker"),
+}
+
+
+def frame_label(code) -> str:
+    """'funzione (percorso:riga della def)': una voce per funzione, non per riga."""
+    path = code.co_filename
+    if path.startswith(BACKEND_DIR):
+        path = os.path.relpath(path, BACKEND_DIR)
+    else:
+        parts = path.replace("\\", "/").split("/")
+        path = "/".join(parts[parts.index("site-packages") + 1:]) if "site-packages" in parts else parts[-1]
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class ProfileResult:
+    def __init__(self, stacks: Counter, samples: int, seconds: float, interval: float,
+                 allocations: Optional[list[dict]] = None):
+        self.stacks = stacks
+        self.samples = samples
+        self.seconds = seconds
+        self.interval = interval
+        self.allocations = allocations
+
+    def collapsed(self) -> str:
+        """Formato collassato: una riga per stack distinto, frame dalla radice alla foglia."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, n: int = 30) -> list[dict]:
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack[1:]):  # il primo frame è il nome del thread
+                total[label] += count
+        busy = sum(self.stacks.values()) or 1
+        return [
+            {
+                "function": label,
+                "own_samples": own[label],
+                "own_pct": round(100 * own[label] / busy, 1),
+                "total_samples": total[label],
+                "total_pct": round(100 * total[label] / busy, 1),
+            }
+            for label, _ in sorted(total.items(), key=lambda item: (own[item[0]], item[1]), reverse=True)[:n]
+        ]
+
+    def summary(self, top: int = 30) -> dict:
+        return {
+            "seconds": round(self.seconds, 3),
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "busy_stacks": sum(self.stacks.values()),
+            "top": self.top(top),
+            "allocations": self.allocations,
+        }
+
+
+class SamplingProfiler:
+    """Un profilo alla volta per processo: start(), poi stop() → ProfileResult."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float = DEFAULT_INTERVAL, allocations: bool = False) -> bool:
+        """Avvia il campionamento; False se un altro profilo è in corso."""
+        if not self._lock.acquire(blocking=False):
+            return False
+        self._stop.clear()
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._interval = interval
+        self._started_tracemalloc = allocations and not tracemalloc.is_tracing()
+        try:
+            if self._started_tracemalloc:
+                tracemalloc.start(16)
+            self._malloc_before = tracemalloc.take_snapshot() if allocations else None
+            self._started = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        except BaseException:
+            self._release()
+            raise
+        return True
+
+    def stop(self, top_allocations: int = 20) -> ProfileResult:
+        try:
+            self._stop.set()
+            self._thread.join()
+            seconds = time.perf_counter() - self._started
+            allocations = None
+            if self._malloc_before is not None:
+                # Le allocazioni del profiler stesso (etichette, stack) non interessano
+                ignore = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+                stats = tracemalloc.take_snapshot().filter_traces(ignore).compare_to(
+                    self._malloc_before.filter_traces(ignore), "lineno"
+                )
+                allocations = [
+                    {"line": str(stat.traceback[0]), "size_kib": round(stat.size_diff / 1024, 1), "count": stat.count_diff}
+                    for stat in stats[:top_allocations]
+                ]
+            return ProfileResult(self._stacks, self._samples, seconds, self._interval, allocations)
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        """
+        Rimette il profiler a riposo, anche dopo un errore (es. MemoryError
+        nello snapshot): senza, tracemalloc resterebbe acceso e ogni profilo
+        successivo risponderebbe 409 fino al riavvio.
+        """
+        self._thread = None
+        self._malloc_before = None
+        if self._started_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._lock.release()
+
+    def profile(self, seconds: float, interval: float = DEFAULT_INTERVAL, allocations: bool = False) -> Optional[ProfileResult]:
+        """Profilo bloccante di `seconds` secondi (None se un altro è in corso)."""
+        if not self.start(interval, allocations):
+            return None
+        threading.Event().wait(seconds)  # foglia threading.wait: il chiamante risulta inattivo
+        return self.stop()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        labels: dict = {}  # code object → etichetta, calcolata una volta
+        while not self._stop.wait(self._interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            self._samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = frame_label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                stack.reverse()
+                self._stacks[tuple(stack)] += 1
+
+
+profiler = SamplingProfiler()
+
+
+def format_top(rows: list[dict]) -> str:
+    """Tabella testuale delle funzioni più calde (per la CLI)."""
+    lines = [f"{'proprio %':>9} | {'totale %':>8} | funzione", "-" * 80]
+    lines += [f"{r['own_pct']:>9.1f} | {r['total_pct']:>8.1f} | {r['function']}" for r in rows]
+    return "\n".join(lines)
@@ -0,0 +1,302 @@
+"""
+Rate limiting a token bucket con stato condiviso tra i worker.
+
+Ogni policy è "N/secondi": un bucket da N gettoni per chiave (IP o utente)
+che si ricarica di N gettoni ogni `secondi`, quindi consente raffiche fino
+a N e in media N richieste per finestra. Lo stato vive in un backend
+condiviso, così con più worker uvicorn il limite resta quello configurato
+e non N volte tanto:
+
+- sqlite (default): file separato RATE_LIMIT_DB, una UPSERT atomica per
+  decisione, senza servizi esterni e senza toccare il writer di mare_calmo.db;
+- redis: stessa interfaccia, script Lua atomico (serve `pip install redis`,
+  altrimenti si resta su sqlite);
+- memory: per processo, utile per test e un solo worker.
+
+Policy (sovrascrivibili da env, es. RATE_LIMIT_LOGIN=10/60):
+    login, register, forgot_password per IP; events per utente;
+    events_batch per utente, un gettone per evento del batch.
+Se il backend non risponde la richiesta passa (fail open) e l'errore va nei log.
+Il backend nasce alla prima decisione: importare il modulo non crea file
+né apre connessioni.
+"""
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import NamedTuple
+
+from fastapi import Depends, HTTPException, Request, status
+
+from app.auth.auth_cache import Principal
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite")  # sqlite | redis | memory
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "./rate_limit.db")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_CLEANUP_EVERY = 10_000  # decisioni tra due pulizie dei bucket inattivi (sqlite)
+
+DEFAULT_POLICIES = {
+    "login": "5/60",
+    "register": "5/900",
+    "forgot_password": "3/600",
+    "events": "120/60",
+    "events_batch": "2000/3600",  # gettoni = eventi: almeno MAX_BATCH_EVENTS
+}
+
+
+@dataclass(frozen=True)
+class Policy:
+    """Bucket da `capacity` gettoni, ricaricato di `capacity` ogni `per_seconds`."""
+    capacity: int
+    per_seconds: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.per_seconds
+
+    @classmethod
+    def parse(cls, spec: str) -> "Policy":
+        """'5/60' → Policy(5, 60.0)"""
+        capacity, _, seconds = spec.partition("/")
+        return cls(int(capacity), float(seconds))
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    remaining: float
+    retry_after: float  # secondi prima che ci sia un gettone (0 se allowed)
+
+
+def decision(allowed: bool, tokens: float, cost: float, rate: float) -> Decision:
+    return Decision(allowed, tokens, 0.0 if allowed else (cost - tokens) / rate)
+
+
+# ──────────────────────────────────────────────
+# BACKENDS — take(key, capacity, rate, cost, now) → Decision
+# ──────────────────────────────────────────────
+class MemoryBackend:
+    """Bucket in un dict del processo."""
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, rate: float, cost: float, now: float) -> Decision:
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+        return decision(allowed, tokens, cost, rate)
+
+    def cleanup(self, idle_seconds: float, now: float) -> int:
+        with self._lock:
+            idle = [key for key, (_, updated_at) in self._buckets.items() if updated_at < now - idle_seconds]
+            for key in idle:
+                del self._buckets[key]
+        return len(idle)
+
+
+class SQLiteBackend:
+    """
+    Bucket in un file SQLite condiviso dai processi. Una sola UPSERT per
+    decisione: ricarica, confronto e consumo avvengono nella stessa
+    istruzione, quindi due worker non possono spendere lo stesso gettone.
+    """
+
+    # Nelle SET i riferimenti alle colonne sono i valori precedenti della riga
+    TAKE_SQL = """
+        INSERT INTO rate_buckets (key, tokens, updated_at, allowed)
+        VALUES (:key, :capacity - :cost, :now, :capacity >= :cost)
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = min(:capacity, tokens + max(0, :now - updated_at) * :rate)
+                - CASE WHEN min(:capacity, tokens + max(0, :now - updated_at) * :rate) >= :cost
+                       THEN :cost ELSE 0 END,
+            allowed = min(:capacity, tokens + max(0, :now - updated_at) * :rate) >= :cost,
+            updated_at = :now
+        RETURNING allowed, tokens
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, allowed INTEGER NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit: ogni UPSERT è la sua transazione. Lo stato è effimero:
+            # niente fsync, un crash al più restituisce qualche gettone
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, capacity: int, rate: float, cost: float, now: float) -> Decision:
+        params = {"key": key, "capacity": capacity, "rate": rate, "cost": cost, "now": now}
+        allowed, tokens = self._connect().execute(self.TAKE_SQL, params).fetchone()
+        return decision(bool(allowed), tokens, cost, rate)
+
+    def cleanup(self, idle_seconds: float, now: float) -> int:
+        """Un bucket fermo da idle_seconds è pieno: la riga equivale a nessuna riga."""
+        return self._connect().execute(
+            "DELETE FROM rate_buckets WHERE updated_at < ?", (now - idle_seconds,)
+        ).rowcount
+
+
+class RedisBackend:
+    """Stessa interfaccia su Redis (o compatibili): hash per chiave + script Lua atomico."""
+
+    TAKE_LUA = """
+        local capacity, rate, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+        local tokens = tonumber(bucket[1]) or capacity
+        local updated_at = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+        local allowed = 0
+        if tokens >= cost then
+            tokens = tokens - cost
+            allowed = 1
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+        redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+        return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL):
+        import redis  # opzionale: ImportError → fallback a sqlite in build_backend
+
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self.TAKE_LUA)
+
+    def take(self, key: str, capacity: int, rate: float, cost: float, now: float) -> Decision:
+        allowed, tokens = self._take(keys=[f"rate:{key}"], args=[capacity, rate, cost, now])
+        return decision(bool(allowed), float(tokens), cost, rate)
+
+    def cleanup(self, idle_seconds: float, now: float) -> int:
+        return 0  # le chiavi scadono da sole (PEXPIRE)
+
+
+def build_backend(name: str = RATE_LIMIT_BACKEND):
+    if name == "memory":
+        return MemoryBackend()
+    if name == "redis":
+        try:
+            return RedisBackend()
+        except ImportError:
+            print("RATE_LIMIT_BACKEND=redis ma il client non è installato (pip install redis). Uso sqlite.")
+    return SQLiteBackend()
+
+
+# ──────────────────────────────────────────────
+# LIMITER
+# ──────────────────────────────────────────────
+class RateLimiter:
+    """
+    Policy con nome su un backend; conta decisioni e il loro costo.
+    Con backend=None il backend viene creato da backend_factory alla prima
+    decisione.
+    """
+
+    def __init__(self, backend, policies: dict[str, Policy], enabled: bool = True, backend_factory=build_backend):
+        self._backend = backend
+        self._backend_factory = backend_factory
+        self._backend_lock = threading.Lock()
+        self.policies = policies
+        self.enabled = enabled
+        self._idle_seconds = max(p.per_seconds for p in policies.values())
+        self._decisions = 0
+        self._denied: dict[str, int] = {name: 0 for name in policies}
+        self._errors = 0
+        self._seconds = 0.0
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = self._backend_factory()
+        return self._backend
+
+    def check(self, policy_name: str, key: str, cost: float = 1) -> Decision:
+        policy = self.policies[policy_name]
+        if not self.enabled:
+            return Decision(True, policy.capacity, 0.0)
+        started = time.perf_counter()
+        now = time.time()  # orologio condiviso tra i processi
+        try:
+            result = self.backend.take(f"{policy_name}:{key}", policy.capacity, policy.rate, cost, now)
+            self._decisions += 1
+            if self._decisions % RATE_LIMIT_CLEANUP_EVERY == 0:
+                self.backend.cleanup(self._idle_seconds, now)
+        except Exception as e:
+            self._errors += 1
+            logger.error("Rate limit non disponibile (%s): richiesta consentita", e)
+            return Decision(True, policy.capacity, 0.0)
+        finally:
+            self._seconds += time.perf_counter() - started
+        if not result.allowed:
+            self._denied[policy_name] += 1
+        return result
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "backend": type(self._backend).__name__ if self._backend is not None else None,
+            "decisions": self._decisions,
+            "denied": dict(self._denied),
+            "errors": self._errors,
+            "avg_decision_us": round(self._seconds / self._decisions * 1e6, 1) if self._decisions else 0.0,
+        }
+
+
+def load_policies() -> dict[str, Policy]:
+    return {
+        name: Policy.parse(os.getenv(f"RATE_LIMIT_{name.upper()}", spec))
+        for name, spec in DEFAULT_POLICIES.items()
+    }
+
+
+rate_limiter = RateLimiter(None, load_policies(), enabled=RATE_LIMIT_ENABLED)
+
+
+# ──────────────────────────────────────────────
+# DIPENDENZE FASTAPI
+# ──────────────────────────────────────────────
+def enforce(policy_name: str, key: str, cost: float = 1) -> None:
+    """429 con Retry-After se il bucket della chiave non ha `cost` gettoni."""
+    result = rate_limiter.check(policy_name, key, cost)
+    if not result.allowed:
+        logger.warning("Rate limit %s superato per %s", policy_name, key)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Troppi tentativi. Riprova più tardi.",
+            headers={"Retry-After": str(math.ceil(result.retry_after))},
+        )
+
+
+def limit_by_ip(policy_name: str):
+    """Dipendenza: policy per indirizzo del client."""
+    def dependency(request: Request) -> None:
+        enforce(policy_name, request.client.host if request.client else "unknown")
+    return dependency
+
+
+def limit_by_user(policy_name: str, user_dependency):
+    """Dipendenza: policy per utente autenticato (user_dependency è risolta una volta per richiesta)."""
+    def dependency(current_user: Principal = Depends(user_dependency)) -> None:
+        enforce(policy_name, current_user.id)
+    return dependency
@@ -0,0 +1,200 @@
+"""
+Ricalcolo in background — crescita pesci + stato del mare fuori dalla request.
+
+POST /events accoda l'utente; una raffica di eventi ravvicinati produce un
+solo ricalcolo (debounce): il run parte RECOMPUTE_DEBOUNCE_SECONDS dopo
+l'ultimo evento, ma mai oltre RECOMPUTE_MAX_DELAY_SECONDS dal primo, così
+un flusso continuo non rimanda il ricalcolo all'infinito.
+
+Un pool limitato di RECOMPUTE_WORKERS thread esegue i ricalcoli; lo stesso
+utente non è mai in esecuzione su due worker insieme. Con RECOMPUTE_WORKERS=0
+lo scheduler è disattivato e resta solo POST /compute-state.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.db.database import SessionLocal
+from app.services.growth import compute_fish_growth
+from app.services.sea_state import compute_sea_state
+
+logger = logging.getLogger(__name__)
+
+RECOMPUTE_WORKERS = int(os.getenv("RECOMPUTE_WORKERS", "2"))
+RECOMPUTE_DEBOUNCE_SECONDS = float(os.getenv("RECOMPUTE_DEBOUNCE_SECONDS", "2.0"))
+RECOMPUTE_MAX_DELAY_SECONDS = float(os.getenv("RECOMPUTE_MAX_DELAY_SECONDS", "10.0"))
+
+
+# ──────────────────────────────────────────────
+# CORE LOGIC
+# ──────────────────────────────────────────────
+def recompute_user(user_id: str, full_rebuild: bool = False) -> None:
+    """Ricalcolo completo di un utente con una sessione propria."""
+    db = SessionLocal()
+    try:
+        compute_fish_growth(db, user_id, full_rebuild=full_rebuild)
+        compute_sea_state(db, user_id)
+    finally:
+        db.close()
+
+
+class RecomputeScheduler:
+    """
+    Coda per utente con debounce, servita da un pool di thread limitato.
+
+    _pending: user_id → (scadenza, primo accodamento, full_rebuild),
+    tempi monotonic.
+    _heap: (scadenza, user_id) in ordine di scadenza, con invalidazione
+    pigra: una voce vale solo se coincide con la scadenza in _pending;
+    quelle superate (nuovo accodamento, utente già partito) si scartano
+    quando arrivano in cima. Un utente in esecuzione esce dal heap e ci
+    rientra alla fine del suo run.
+    Un thread dispatcher consegna al pool gli utenti scaduti, al massimo
+    `workers` alla volta; il resto aspetta in _pending.
+    """
+
+    def __init__(
+        self,
+        workers: int = RECOMPUTE_WORKERS,
+        debounce: float = RECOMPUTE_DEBOUNCE_SECONDS,
+        max_delay: float = RECOMPUTE_MAX_DELAY_SECONDS,
+        task=recompute_user,
+    ):
+        self.workers = workers
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.task = task
+
+        self._cond = threading.Condition()
+        self._pending: dict[str, tuple[float, float, bool]] = {}
+        self._heap: list[tuple[float, str]] = []
+        self._running: set[str] = set()
+        self._executor: ThreadPoolExecutor | None = None
+        self._dispatcher: threading.Thread | None = None
+        self._stopping = False
+
+        self._enqueued = 0
+        self._runs = 0
+        self._failures = 0
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+        self._last_duration = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._dispatcher is not None
+
+    def start(self) -> None:
+        if self.enabled or self.workers <= 0:
+            return
+        self._stopping = False
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="recompute")
+        self._dispatcher = threading.Thread(target=self._dispatch, name="recompute-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def stop(self) -> None:
+        """Ferma il dispatcher e attende i ricalcoli in corso; i pendenti sono scartati."""
+        if not self.enabled:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+        self._dispatcher = None
+        self._executor = None
+
+    def enqueue(self, user_id: str, full_rebuild: bool = False) -> None:
+        """
+        Richiede un ricalcolo per user_id; gli eventi ravvicinati si fondono.
+        full_rebuild=True resta valido per il run fuso.
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._cond:
+            self._enqueued += 1
+            _, first, rebuild = self._pending.get(user_id, (None, now, False))
+            due = min(now + self.debounce, first + self.max_delay)
+            self._pending[user_id] = (due, first, rebuild or full_rebuild)
+            heapq.heappush(self._heap, (due, user_id))
+            if len(self._heap) > 2 * len(self._pending) + 64:
+                # Raffica dallo stesso utente: troppe voci superate
+                self._heap = [(due, uid) for uid, (due, _, _) in self._pending.items()]
+                heapq.heapify(self._heap)
+            self._cond.notify()
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        with self._cond:
+            oldest = min((first for _, first, _ in self._pending.values()), default=now)
+            return {
+                "enabled": self.enabled,
+                "queue_depth": len(self._pending),
+                "in_flight": len(self._running),
+                "lag_seconds": round(now - oldest, 3),
+                "last_run_lag_seconds": round(self._last_lag, 3),
+                "max_run_lag_seconds": round(self._max_lag, 3),
+                "last_run_seconds": round(self._last_duration, 3),
+                "enqueued": self._enqueued,
+                "runs": self._runs,
+                "coalesced": self._enqueued - self._runs - len(self._running) - len(self._pending),
+                "failures": self._failures,
+            }
+
+    # ── dispatcher / worker ──
+    def _next_ready(self, now: float) -> tuple[str | None, float | None]:
+        """Utente scaduto non già in esecuzione, e la prossima scadenza futura."""
+        heap = self._heap
+        while heap:
+            due, user_id = heap[0]
+            entry = self._pending.get(user_id)
+            if entry is None or entry[0] != due or user_id in self._running:
+                heapq.heappop(heap)  # superata, o rientra alla fine del run
+                continue
+            if due <= now:
+                heapq.heappop(heap)
+                return user_id, None
+            return None, due
+        return None, None
+
+    def _dispatch(self) -> None:
+        with self._cond:
+            while not self._stopping:
+                if len(self._running) >= self.workers:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                user_id, next_due = self._next_ready(now)
+                if user_id is None:
+                    self._cond.wait(None if next_due is None else next_due - now)
+                    continue
+                _, first, full_rebuild = self._pending.pop(user_id)
+                self._running.add(user_id)
+                self._executor.submit(self._run, user_id, full_rebuild, now - first)
+
+    def _run(self, user_id: str, full_rebuild: bool, lag: float) -> None:
+        start = time.monotonic()
+        failed = False
+        try:
+            self.task(user_id, full_rebuild)
+        except Exception:
+            failed = True
+            logger.exception("Ricalcolo in background fallito per %s", user_id)
+        with self._cond:
+            self._running.discard(user_id)
+            entry = self._pending.get(user_id)
+            if entry is not None:
+                heapq.heappush(self._heap, (entry[0], user_id))
+            self._runs += 1
+            self._failures += failed
+            self._last_lag = lag
+            self._max_lag = max(self._max_lag, lag)
+            self._last_duration = time.monotonic() - start
+            self._cond.notify()
+
+
+recompute_scheduler = RecomputeScheduler()
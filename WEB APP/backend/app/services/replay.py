@@ -0,0 +1,261 @@
+"""
+Replay dello stato — crescita pesci e stato del mare a una data qualsiasi.
+
+Lo stato derivato dipende da quando viene ricalcolato (un passo EMA a ogni
+ricalcolo), quindi il replay segue una cadenza canonica: un passo alla fine
+di ogni giorno UTC, come il job notturno, più un passo finale all'istante
+richiesto. Il replay parte dal primo evento dell'utente.
+
+I giorni completati vengono salvati come snapshot (fish_snapshots,
+sea_snapshots): il replay riparte dallo snapshot più vicino precedente alla
+data richiesta e applica solo gli eventi successivi, letti insieme dalla
+tabella e dai segmenti archiviati (services/archive.py). Gli indici CI ed ES
+leggono il rollup giornaliero, tranne il giorno finale parziale che viene
+ricostruito dagli eventi.
+
+Snapshot di tutti gli utenti fino a ieri (job notturno):
+    python -m app.services.replay
+"""
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from app.models.models import (
+    Fish, FishSnapshot, SeaSnapshot, User, UserDailyStats, as_utc, utcnow,
+)
+from app.services import growth, sea_state
+from app.services.archive import first_event_at, read_events
+from app.services.daily_stats import COUNTERS, event_day, merge_delta, stats_delta
+
+
+SNAPSHOT_INTERVAL_DAYS = int(os.getenv("SNAPSHOT_INTERVAL_DAYS", "1"))
+
+
+# ──────────────────────────────────────────────
+# UTILS
+# ──────────────────────────────────────────────
+def end_of_day(day: date) -> datetime:
+    """Istante del passo canonico del giorno (ultimo microsecondo, UTC)."""
+    return datetime.combine(day, time.max, tzinfo=timezone.utc)
+
+
+def last_complete_day(reference_date: datetime) -> date:
+    """Ultimo giorno il cui passo canonico non è successivo a reference_date."""
+    day = reference_date.date()
+    return day if reference_date >= end_of_day(day) else day - timedelta(days=1)
+
+
+def consistency_index(daily: dict[date, dict[str, int]], day: date) -> float:
+    """CI nella finestra che termina a day (stessa regola di sea_state)."""
+    start = day - timedelta(days=sea_state.LOOKBACK_DAYS)
+    active_days = sum(
+        1 for d, counters in daily.items()
+        if start <= d <= day and counters["event_count"] > 0
+    )
+    return min(active_days / sea_state.LOOKBACK_DAYS, 1.0)
+
+
+def stability_index(daily: dict[date, dict[str, int]], day: date) -> float:
+    """ES nella finestra che termina a day (stessa regola di sea_state)."""
+    start = day - timedelta(days=sea_state.LOOKBACK_DAYS)
+    window = [counters for d, counters in daily.items() if start <= d <= day]
+    return sea_state.emotional_stability(
+        sum(c["anxiety_count"] for c in window),
+        sum(c["anxiety_sum"] for c in window),
+        sum(c["anxiety_sq_sum"] for c in window),
+    )
+
+
+def latest_snapshot(db: Session, user_id: str, reference_date: datetime) -> tuple[date, dict[str, float], float] | None:
+    """Snapshot più recente non successivo a reference_date: (giorno, crescita per pesce, score mare)."""
+    sea = db.execute(
+        select(SeaSnapshot.day, SeaSnapshot.sea_state_score)
+        .where(SeaSnapshot.user_id == user_id)
+        .where(SeaSnapshot.day <= last_complete_day(reference_date))
+        .order_by(SeaSnapshot.day.desc())
+        .limit(1)
+    ).first()
+    if sea is None:
+        return None
+    fish_growth = dict(db.execute(
+        select(FishSnapshot.fish_id, FishSnapshot.growth_level)
+        .where(FishSnapshot.user_id == user_id)
+        .where(FishSnapshot.day == sea.day)
+    ).tuples().all())
+    return sea.day, fish_growth, sea.sea_state_score
+
+
+# ──────────────────────────────────────────────
+# CORE LOGIC
+# ──────────────────────────────────────────────
+def replay_state(
+    db: Session,
+    user_id: str,
+    reference_date: datetime | None = None,
+    on_day=None,
+) -> dict:
+    """
+    Stato dell'utente a reference_date (default: adesso), senza scrivere nulla.
+
+    on_day(day, growth_by_fish, sea_score) è chiamata dopo il passo di ogni
+    giorno completato: serve a take_snapshots per salvarli.
+
+    Ritorna {"fish": [{fish_id, dimension, growth_level}], "sea_state_score"},
+    con sea_state_score None se a quella data non c'erano ancora eventi.
+    """
+    reference_date = as_utc(reference_date or utcnow()).astimezone(timezone.utc)
+
+    fish = db.execute(
+        select(Fish.id, Fish.dimension)
+        .where(Fish.user_id == user_id)
+        .order_by(Fish.id)
+    ).all()
+    fish_ids = [f.id for f in fish]
+
+    def result(levels: dict[str, float], score: float | None) -> dict:
+        return {
+            "fish": [
+                {"fish_id": f.id, "dimension": f.dimension, "growth_level": levels[f.id]}
+                for f in fish
+            ],
+            "sea_state_score": score,
+        }
+
+    levels = {fish_id: 0.0 for fish_id in fish_ids}
+    score = None
+    replay_from = None
+
+    snapshot = latest_snapshot(db, user_id, reference_date)
+    if snapshot:
+        snapshot_day, snapshot_levels, score = snapshot
+        levels.update((f, g) for f, g in snapshot_levels.items() if f in levels)
+        replay_from = end_of_day(snapshot_day)
+        if replay_from == reference_date:
+            return result(levels, score)
+
+    first_event = first_event_at(db, user_id, reference_date)
+    if first_event is None:
+        return result(levels, score)
+    first_event = as_utc(first_event)
+
+    # Eventi da applicare: dopo lo snapshot, fino a reference_date (anche archiviati)
+    events = read_events(db, user_id, after=replay_from, until=reference_date)
+
+    first_day = snapshot[0] + timedelta(days=1) if snapshot else first_event.date()
+    target_day = reference_date.date()
+
+    # Rollup dei giorni completi nella finestra degli indici; il giorno
+    # finale (eventualmente parziale) è ricostruito dagli eventi letti.
+    daily = {
+        row.day: {key: getattr(row, key) for key in COUNTERS}
+        for row in db.execute(
+            select(UserDailyStats)
+            .where(UserDailyStats.user_id == user_id)
+            .where(UserDailyStats.day >= first_day - timedelta(days=sea_state.LOOKBACK_DAYS))
+            .where(UserDailyStats.day < target_day)
+        ).scalars()
+    }
+    target_counters: dict[str, int] = {}
+    for event in events:
+        if event_day(event.created_at) == target_day:
+            merge_delta(target_counters, stats_delta(event.event_type, event.anxiety_level))
+    if target_counters:
+        daily[target_day] = target_counters
+
+    next_event = 0
+    day = first_day
+    while day <= target_day:
+        cutoff = min(end_of_day(day), reference_date)
+
+        # ── Crescita: eventi del passo smistati per pesce (o condivisi) ──
+        fish_counts: dict[str, dict[str, int]] = {fish_id: {} for fish_id in fish_ids}
+        shared_counts: dict[str, int] = {}
+        while next_event < len(events) and as_utc(events[next_event].created_at) <= cutoff:
+            event = events[next_event]
+            next_event += 1
+            if event.fish_id is None:
+                shared_counts[event.event_type] = shared_counts.get(event.event_type, 0) + 1
+            elif event.fish_id in fish_counts:
+                counts = fish_counts[event.fish_id]
+                counts[event.event_type] = counts.get(event.event_type, 0) + 1
+
+        days_active = max((cutoff - first_event).days, 1)
+        growth_tf = growth.time_factor(days_active)
+        for fish_id in fish_ids:
+            type_counts = dict(fish_counts[fish_id])
+            for event_type, count in shared_counts.items():
+                type_counts[event_type] = type_counts.get(event_type, 0) + count
+            if type_counts:
+                levels[fish_id] = growth.apply_growth(levels[fish_id], type_counts, growth_tf)
+
+        # ── Mare ──
+        raw_score = sea_state.sea_score(
+            sea_state.average_growth([levels[fish_id] for fish_id in fish_ids]),
+            consistency_index(daily, day),
+            stability_index(daily, day),
+            sea_state.time_factor(days_active),
+        )
+        previous_score = score or 0.0
+        score = max(previous_score, sea_state.ema(previous_score, raw_score))
+
+        if on_day is not None and cutoff == end_of_day(day):
+            on_day(day, levels, score)
+        day += timedelta(days=1)
+
+    return result(levels, score)
+
+
+def take_snapshots(db: Session, user_id: str, through_day: date | None = None) -> int:
+    """
+    Salva gli snapshot dei giorni completati fino a through_day (default: ieri),
+    uno ogni SNAPSHOT_INTERVAL_DAYS. Ritorna il numero di giorni salvati.
+    """
+    if through_day is None:
+        through_day = utcnow().date() - timedelta(days=1)
+
+    fish_rows: list[dict] = []
+    sea_rows: list[dict] = []
+
+    def save(day: date, levels: dict[str, float], score: float) -> None:
+        if day.toordinal() % SNAPSHOT_INTERVAL_DAYS:
+            return
+        fish_rows.extend(
+            {"fish_id": fish_id, "day": day, "user_id": user_id, "growth_level": level}
+            for fish_id, level in levels.items()
+        )
+        sea_rows.append({"user_id": user_id, "day": day, "sea_state_score": score})
+
+    replay_state(db, user_id, end_of_day(through_day), on_day=save)
+    if sea_rows:
+        if fish_rows:
+            db.execute(insert(FishSnapshot), fish_rows)
+        db.execute(insert(SeaSnapshot), sea_rows)
+    db.commit()
+    return len(sea_rows)
+
+
+def invalidate_snapshots(db: Session, user_id: str, from_day: date) -> None:
+    """Cancella gli snapshot da from_day in poi (eventi retrodatati; senza commit)."""
+    db.execute(delete(FishSnapshot).where(FishSnapshot.user_id == user_id).where(FishSnapshot.day >= from_day))
+    db.execute(delete(SeaSnapshot).where(SeaSnapshot.user_id == user_id).where(SeaSnapshot.day >= from_day))
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.db.database import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Snapshot giornalieri dello stato fino a ieri")
+    parser.add_argument("--reset", action="store_true", help="ricalcola da zero (es. dopo una correzione delle formule)")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    if args.reset:
+        db.execute(delete(FishSnapshot))
+        db.execute(delete(SeaSnapshot))
+        db.commit()
+    user_ids = db.execute(select(User.id).order_by(User.id)).scalars().all()
+    days = sum(take_snapshots(db, user_id) for user_id in user_ids)
+    db.close()
+    print(f"✅ Snapshot salvati: {days} giorni per {len(user_ids)} utenti")
@@ -4,13 +4,19 @@ Servizio stato del mare — indicatore ambientale smussato.
 Lo stato del mare è calcolato come indicatore ambientale derivato,
 basato su segnali aggregati e smussati, con vincolo di non-regressione
 per evitare feedback ansiogeni.
+
+Gli indici CI ed ES leggono il rollup giornaliero (user_daily_stats):
+al più LOOKBACK_DAYS righe per utente, indipendentemente dagli eventi.
 """
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
 from math import log
 from sqlalchemy.orm import Session
 from sqlalchemy import func, select
 
-from app.models.models import Event, Fish, FishState, SeaState
+from app.models.models import Fish, FishState, SeaState, UserDailyStats, as_utc
+from app.services.archive import first_event_at
+from app.services.metrics import timed
+from app.services.tracing import traced
 
 
 # ──────────────────────────────────────────────
@@ -57,55 +63,80 @@ def visual_params_from_state(label: str) -> dict:
     return mapping.get(label, mapping["neutro"])
 
 
-# ──────────────────────────────────────────────
-# INTERMEDIATE INDICES
-# ──────────────────────────────────────────────
-def compute_consistency_index(db: Session, user_id: str) -> float:
-    """CI: Presence over last 14 days (0..1)."""
-    today = datetime.now(timezone.utc).date()
-    start = today - timedelta(days=LOOKBACK_DAYS)
-
-    events = db.execute(
-        select(Event.created_at)
-        .where(Event.user_id == user_id)
-        .where(Event.created_at >= datetime.combine(start, datetime.min.time()))
-    ).scalars().all()
-
-    active_days = {e.date() for e in events}
-    return min(len(active_days) / LOOKBACK_DAYS, 1.0)
+def average_growth(growth_levels: list[float]) -> float:
+    """Media dei growth_level, sommati nell'ordine dato (0.0 se vuota)."""
+    if not growth_levels:
+        return 0.0
+    return sum(growth_levels) / len(growth_levels)
 
 
-def compute_emotional_stability(db: Session, user_id: str) -> float:
-    """ES: 1 - normalized_variance of recent anxiety scores."""
-    events = db.execute(
-        select(Event)
-        .where(Event.user_id == user_id)
-        .where(Event.event_type == "check_in")
-        .order_by(Event.created_at.desc())
-        .limit(LOOKBACK_DAYS)
-    ).scalars().all()
-
-    values = []
-    for e in events:
-        meta = e.metadata_json or {}
-        al = meta.get("anxiety_level")
-        if al is not None:
-            values.append(int(al))
-
-    if len(values) < 3:
+def emotional_stability(n: int, total: int, total_sq: int) -> float:
+    """
+    1 - varianza normalizzata dei livelli d'ansia (scala 1-5),
+    a partire da conteggio, somma e somma dei quadrati.
+    """
+    if n < 3:
         return NEUTRAL_ES
 
-    mean = sum(values) / len(values)
-    variance = sum((v - mean) ** 2 for v in values) / len(values)
+    mean = total / n
+    variance = max(total_sq / n - mean * mean, 0.0)
 
     # Normalize on 1-5 scale → max variance = 4
     normalized_var = min(variance / 4, 1.0)
     return max(0.0, 1 - normalized_var)
 
 
+def sea_score(avg_growth: float, ci: float, es: float, tf: float) -> float:
+    """Formula: 0.4 * avg_growth + 0.3 * CI + 0.2 * ES + 0.1 * TF"""
+    return 0.4 * avg_growth + 0.3 * ci + 0.2 * es + 0.1 * tf
+
+
+# ──────────────────────────────────────────────
+# INTERMEDIATE INDICES
+# ──────────────────────────────────────────────
+def lookback_start(reference_date: datetime | None = None) -> date:
+    """Primo giorno della finestra degli indici (giorno di riferimento - LOOKBACK_DAYS)."""
+    reference_date = as_utc(reference_date or datetime.now(timezone.utc))
+    return reference_date.astimezone(timezone.utc).date() - timedelta(days=LOOKBACK_DAYS)
+
+
+def in_lookback(reference_date: datetime | None = None):
+    """Condizione SQL: righe del rollup nella finestra che termina al giorno di riferimento."""
+    start = lookback_start(reference_date)
+    return UserDailyStats.day.between(start, start + timedelta(days=LOOKBACK_DAYS))
+
+
+def compute_consistency_index(db: Session, user_id: str, reference_date: datetime | None = None) -> float:
+    """CI: Presence over last 14 days (0..1), dal rollup giornaliero."""
+    active_days = db.execute(
+        select(func.count())
+        .select_from(UserDailyStats)
+        .where(UserDailyStats.user_id == user_id)
+        .where(in_lookback(reference_date))
+        .where(UserDailyStats.event_count > 0)
+    ).scalar()
+    return min(active_days / LOOKBACK_DAYS, 1.0)
+
+
+def compute_emotional_stability(db: Session, user_id: str, reference_date: datetime | None = None) -> float:
+    """ES: 1 - normalized_variance dei livelli d'ansia dei check-in degli ultimi 14 giorni."""
+    n, total, total_sq = db.execute(
+        select(
+            func.coalesce(func.sum(UserDailyStats.anxiety_count), 0),
+            func.coalesce(func.sum(UserDailyStats.anxiety_sum), 0),
+            func.coalesce(func.sum(UserDailyStats.anxiety_sq_sum), 0),
+        )
+        .where(UserDailyStats.user_id == user_id)
+        .where(in_lookback(reference_date))
+    ).one()
+    return emotional_stability(n, total, total_sq)
+
+
 # ──────────────────────────────────────────────
 # CORE LOGIC
 # ──────────────────────────────────────────────
+@traced
+@timed
 def compute_sea_state(
     db: Session,
     user_id: str,
@@ -119,36 +150,29 @@ def compute_sea_state(
     """
     if reference_date is None:
         reference_date = datetime.now(timezone.utc)
-
-    # Media crescita pesci
-    fish_ids = db.execute(
-        select(Fish.id).where(Fish.user_id == user_id)
+    reference_date = as_utc(reference_date)
+
+    # Media crescita pesci (somma in ordine di fish.id: deterministica)
+    growth_levels = db.execute(
+        select(FishState.growth_level)
+        .join(Fish, Fish.id == FishState.fish_id)
+        .where(Fish.user_id == user_id)
+        .order_by(Fish.id)
     ).scalars().all()
-
-    if fish_ids:
-        avg_growth_result = db.execute(
-            select(func.avg(FishState.growth_level))
-            .where(FishState.fish_id.in_(fish_ids))
-        ).scalar()
-        avg_growth = avg_growth_result or 0.0
-    else:
-        avg_growth = 0.0
+    avg_growth = average_growth(growth_levels)
 
     # Indices
-    ci = compute_consistency_index(db, user_id)
-    es = compute_emotional_stability(db, user_id)
+    ci = compute_consistency_index(db, user_id, reference_date)
+    es = compute_emotional_stability(db, user_id, reference_date)
 
     # Time factor
-    first_event = db.execute(
-        select(func.min(Event.created_at))
-        .where(Event.user_id == user_id)
-    ).scalar()
+    first_event = first_event_at(db, user_id)
 
-    days_active = max((reference_date - first_event).days, 1) if first_event else 1
+    days_active = max((reference_date - as_utc(first_event)).days, 1) if first_event else 1
     tf = time_factor(days_active)
 
     # Raw score
-    raw_score = 0.4 * avg_growth + 0.3 * ci + 0.2 * es + 0.1 * tf
+    raw_score = sea_score(avg_growth, ci, es, tf)
 
     # Previous state
     sea_state = db.get(SeaState, user_id)
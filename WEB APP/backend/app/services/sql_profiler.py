@@ -0,0 +1,205 @@
+"""
+Profiler SQL per richiesta e rilevatore di N+1.
+
+Registra ogni statement che una richiesta esegue tramite SQLAlchemy
+(before/after_cursor_execute) con la sua durata, e li raggruppa per
+"forma": SQL con letterali e liste IN normalizzati. Una forma ripetuta
+almeno SQL_N_PLUS_ONE_THRESHOLD volte nella stessa richiesta è un
+sospetto N+1 (la query dentro un ciclo sugli oggetti del padre).
+
+- SQLProfilerMiddleware (opt-in, SQL_PROFILE=1): header X-SQL-Profile
+  con il riepilogo, warning nei log per sospetti N+1 e statement oltre
+  SQL_SLOW_MS. Spento, l'unico costo è un ContextVar.get per statement.
+- profile_sql / sql_budget: stessi dati attorno a un blocco di codice,
+  per fissare nei test il numero di statement di un endpoint:
+
+      with sql_budget(4):
+          client.get(f"/api/user/{user_id}/world", headers=headers)
+
+  Con httpx + ASGITransport il contesto arriva fino alle route sync; con
+  TestClient (altro thread) leggere l'header con parse_profile_header.
+"""
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import NamedTuple, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+SQL_PROFILE = os.getenv("SQL_PROFILE", "0") == "1"
+SQL_SLOW_MS = float(os.getenv("SQL_SLOW_MS", "100"))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+PROFILE_HEADER = "X-SQL-Profile"
+
+
+# ──────────────────────────────────────────────
+# FORMA DEGLI STATEMENT
+# ──────────────────────────────────────────────
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROWS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")  # VALUES (?), (?), ...
+_SPACES = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """SQL senza letterali né lunghezza delle liste: stessa forma = stessa query nel ciclo."""
+    shape = _STRING.sub("?", statement)
+    shape = _NUMBER.sub("?", shape)
+    shape = _IN_LIST.sub("(?)", shape)
+    shape = _ROWS.sub("(?)", shape)
+    return _SPACES.sub(" ", shape).strip()
+
+
+# ──────────────────────────────────────────────
+# PROFILO
+# ──────────────────────────────────────────────
+class QueryRecord(NamedTuple):
+    statement: str
+    seconds: float
+    executemany: bool
+
+
+class SQLProfile:
+    """Statement di una richiesta (o di un blocco profile_sql), propagati al profilo esterno."""
+
+    def __init__(self, parent: Optional["SQLProfile"] = None):
+        self.parent = parent
+        self.queries: list[QueryRecord] = []
+
+    def record(self, query: QueryRecord) -> None:
+        profile = self
+        while profile is not None:
+            profile.queries.append(query)
+            profile = profile.parent
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def seconds(self) -> float:
+        return sum(q.seconds for q in self.queries)
+
+    def shapes(self) -> Counter:
+        return Counter(statement_shape(q.statement) for q in self.queries)
+
+    def n_plus_one(self, threshold: int = SQL_N_PLUS_ONE_THRESHOLD) -> list[tuple[str, int]]:
+        """Forme ripetute almeno threshold volte, dalla più frequente."""
+        return [(shape, n) for shape, n in self.shapes().most_common() if n >= threshold]
+
+    def slow(self, threshold_ms: float = SQL_SLOW_MS) -> list[QueryRecord]:
+        return [q for q in self.queries if q.seconds * 1000 >= threshold_ms]
+
+    def summary(self) -> dict:
+        suspects = self.n_plus_one()
+        return {
+            "statements": self.count,
+            "db_ms": round(self.seconds * 1000, 2),
+            "slowest_ms": round(max((q.seconds for q in self.queries), default=0.0) * 1000, 2),
+            "slow": len(self.slow()),
+            "n_plus_one": len(suspects),
+            "top_repeat": suspects[0][1] if suspects else 0,
+        }
+
+    def header_value(self) -> str:
+        return ";".join(f"{key}={value}" for key, value in self.summary().items())
+
+
+def parse_profile_header(value: str) -> dict:
+    """'statements=3;db_ms=0.4;...' → {'statements': 3.0, 'db_ms': 0.4, ...}"""
+    return {key: float(number) for key, _, number in (item.partition("=") for item in value.split(";"))}
+
+
+_current_profile: ContextVar[Optional[SQLProfile]] = ContextVar("sql_profile", default=None)
+_instrumented: set[int] = set()
+
+
+def instrument_engine(engine) -> None:
+    """Registra i listener sull'engine (una volta per engine); fuori da un profilo non fanno nulla."""
+    if id(engine) in _instrumented:
+        return
+    _instrumented.add(id(engine))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and _current_profile.get() is not None:
+            context._profile_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_profile_started", None)
+        profile = _current_profile.get()
+        if started is None or profile is None:
+            return
+        profile.record(QueryRecord(statement, time.perf_counter() - started, executemany))
+
+
+# ──────────────────────────────────────────────
+# BLOCCHI DI CODICE E TEST
+# ──────────────────────────────────────────────
+class SQLBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def profile_sql():
+    """Profilo degli statement eseguiti nel blocco (e nelle route sync chiamate da qui)."""
+    profile = SQLProfile(parent=_current_profile.get())
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+@contextmanager
+def sql_budget(max_statements: int, allow_n_plus_one: bool = False):
+    """Come profile_sql, ma fallisce se il blocco supera max_statements o contiene un N+1."""
+    with profile_sql() as profile:
+        yield profile
+    if profile.count > max_statements:
+        shapes = "\n".join(f"  {n}× {shape}" for shape, n in profile.shapes().most_common(5))
+        raise SQLBudgetExceeded(f"{profile.count} statement SQL, budget {max_statements}:\n{shapes}")
+    suspects = profile.n_plus_one()
+    if suspects and not allow_n_plus_one:
+        shape, n = suspects[0]
+        raise SQLBudgetExceeded(f"Sospetto N+1: {n}× {shape}")
+
+
+# ──────────────────────────────────────────────
+# MIDDLEWARE HTTP
+# ──────────────────────────────────────────────
+class SQLProfilerMiddleware:
+    """Middleware ASGI: profilo SQL della richiesta in X-SQL-Profile, N+1 e query lente nei log."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not SQL_PROFILE:
+            await self.app(scope, receive, send)
+            return
+
+        with profile_sql() as profile:
+            async def send_wrapper(message):
+                # Gli header partono prima del corpo: il profilo è quello della route
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((PROFILE_HEADER.lower().encode(), profile.header_value().encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+        target = f"{scope['method']} {scope['path']}"
+        for shape, n in profile.n_plus_one():
+            logger.warning("Sospetto N+1 in %s: %d× %s", target, n, shape)
+        for query in profile.slow():
+            logger.warning("Query lenta in %s: %.1f ms %s", target, query.seconds * 1000, _SPACES.sub(" ", query.statement))
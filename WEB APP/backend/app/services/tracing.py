@@ -0,0 +1,337 @@
+"""
+Tracing distribuito con span compatibili OpenTelemetry, senza collector.
+
+Uno span per richiesta HTTP (TracingMiddleware), per le funzioni di
+servizio decorate con @traced (compute_fish_growth, compute_sea_state,
+export_user_data, upload_user_analytics), per ogni statement SQL
+(instrument_engine) e per ogni comando MongoDB (listener in db/mongodb.py).
+Lo span corrente passa per un ContextVar, come RequestStats in metrics.py,
+quindi i figli nelle route sync e nel threadpool trovano il padre.
+
+- Id e propagazione W3C: header `traceparent` in ingresso (la traccia ne
+  eredita l'id; il flag sampled del chiamante conta solo con
+  TRACE_TRUST_REMOTE_SAMPLED=1), X-Trace-Id nella risposta.
+- Campionamento alla radice: TRACE_SAMPLE_RATE (0..1). Le tracce scartate
+  non generano id né attributi; i figli ereditano la decisione.
+- Export: una riga JSON per span con i campi OTLP (traceId, spanId,
+  parentSpanId, startTimeUnixNano, ...) su file con rotazione
+  (TRACE_EXPORTER=file, TRACE_FILE) o su stderr (console); none spegne.
+  Serializzazione e I/O nel thread di un QueueListener, come auth.log.
+"""
+import atexit
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from app.auth.auth_logger import DeferredQueueHandler, stop_listener
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file")  # file | console | none
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(os.path.dirname(__file__), "../../logs/traces.jsonl"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "mare-calmo-api")
+# Solo dietro un gateway fidato: altrimenti chiunque forza il 100% con traceparent
+TRACE_TRUST_REMOTE_SAMPLED = os.getenv("TRACE_TRUST_REMOTE_SAMPLED", "0") == "1"
+TRACE_HEADER = "X-Trace-Id"
+MAX_STATEMENT_CHARS = 2000
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+# ──────────────────────────────────────────────
+# SPAN
+# ──────────────────────────────────────────────
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status")
+    sampled = True
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], attributes: Optional[dict]):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes or {}
+        self.status = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, exc: BaseException) -> None:
+        self.status = {"code": "STATUS_CODE_ERROR", "message": f"{type(exc).__name__}: {exc}"}
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": f"SPAN_KIND_{self.kind}",
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": self.status or {"code": "STATUS_CODE_UNSET"},
+            "resource": {"service.name": TRACE_SERVICE_NAME},
+        }
+
+
+class NonRecordingSpan:
+    """Traccia non campionata: segna il contesto perché i figli non ne aprano, costo nullo."""
+    sampled = False
+    trace_id = span_id = ""
+
+    def set_attribute(self, key: str, value) -> None:
+        pass
+
+    def set_error(self, exc: BaseException) -> None:
+        pass
+
+
+NON_RECORDING = NonRecordingSpan()
+_current_span: ContextVar[Optional[object]] = ContextVar("trace_span", default=None)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple[str, str, bool]]:
+    """'00-<trace>-<span>-<flags>' → (trace_id, parent_span_id, sampled); None se assente o non valido."""
+    match = _TRACEPARENT.match(value.strip().lower()) if value else None
+    if match is None:
+        return None
+    trace_id, span_id, flags = match.groups()
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+# ──────────────────────────────────────────────
+# TRACER
+# ──────────────────────────────────────────────
+class SpanFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg, default=str)
+
+
+def build_exporter(kind: str = TRACE_EXPORTER, path: str = TRACE_FILE):
+    """Logger dedicato con coda e listener; (None, None) se kind è none o sconosciuto."""
+    if kind == "file":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=20 * 1024 * 1024, backupCount=5)
+    elif kind == "console":
+        handler = logging.StreamHandler()
+    else:
+        if kind != "none":
+            print(f"TRACE_EXPORTER={kind} non supportato (file | console | none). Tracing disattivato.")
+        return None, None
+    handler.setFormatter(SpanFormatter())
+
+    span_logger = logging.getLogger("mare_calmo.traces")
+    span_logger.setLevel(logging.INFO)
+    span_logger.propagate = False
+    span_queue = queue.SimpleQueue()
+    span_logger.addHandler(DeferredQueueHandler(span_queue))
+    listener = logging.handlers.QueueListener(span_queue, handler)
+    listener.start()
+    atexit.register(stop_listener, listener)
+    return span_logger, listener
+
+
+class Tracer:
+    """Apre e chiude span; esporta quelli campionati su span_logger."""
+
+    def __init__(self, span_logger: Optional[logging.Logger], sample_rate: float = TRACE_SAMPLE_RATE,
+                 trust_remote_sampled: bool = TRACE_TRUST_REMOTE_SAMPLED):
+        self.span_logger = span_logger
+        self.enabled = span_logger is not None
+        self.sample_rate = sample_rate
+        self.trust_remote_sampled = trust_remote_sampled
+        self._exported = 0
+        self._started_traces = 0
+        self._sampled_traces = 0
+
+    def start_span(self, name: str, kind: str = "INTERNAL", attributes: Optional[dict] = None,
+                   remote_parent: Optional[tuple[str, str, bool]] = None, root: bool = True):
+        """
+        Figlio dello span corrente, oppure radice di una nuova traccia se root
+        (il campionamento si decide qui). Ritorna NON_RECORDING se la traccia
+        non è campionata, None se non c'è un padre e root è False.
+        """
+        parent = _current_span.get()
+        if parent is not None:
+            if not parent.sampled:
+                return NON_RECORDING
+            return Span(name, kind, parent.trace_id, parent.span_id, attributes)
+        if remote_parent is not None:
+            trace_id, parent_id, remote_sampled = remote_parent
+            sampled = remote_sampled if self.trust_remote_sampled else random.random() < self.sample_rate
+            self._started_traces += 1
+        elif root:
+            trace_id, parent_id = None, None
+            sampled = random.random() < self.sample_rate
+            self._started_traces += 1
+        else:
+            return None
+        if not sampled:
+            return NON_RECORDING
+        self._sampled_traces += 1
+        return Span(name, kind, trace_id or f"{random.getrandbits(128):032x}", parent_id, attributes)
+
+    def end_span(self, span) -> None:
+        if span is None or not span.sampled:
+            return
+        span.end_ns = time.time_ns()
+        self._exported += 1
+        self.span_logger.info(span.to_otlp())
+
+    @contextmanager
+    def span(self, name: str, kind: str = "INTERNAL", attributes: Optional[dict] = None,
+             remote_parent: Optional[tuple[str, str, bool]] = None):
+        """Span corrente per la durata del blocco; le eccezioni lo marcano come errore."""
+        if not self.enabled:
+            yield NON_RECORDING
+            return
+        span = self.start_span(name, kind, attributes, remote_parent)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def metrics(self) -> dict:
+        return {
+            "exporter": TRACE_EXPORTER if self.enabled else "none",
+            "sample_rate": self.sample_rate,
+            "trust_remote_sampled": self.trust_remote_sampled,
+            "traces": self._started_traces,
+            "sampled_traces": self._sampled_traces,
+            "exported_spans": self._exported,
+        }
+
+
+span_logger, span_listener = build_exporter()
+tracer = Tracer(span_logger)
+
+
+def traced(fn):
+    """Decoratore: span col nome della funzione (radice di una traccia se chiamata fuori da una richiesta)."""
+    if not tracer.enabled:
+        return fn
+    attributes = {"code.function": fn.__name__, "code.namespace": fn.__module__}
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with tracer.span(fn.__name__, attributes=dict(attributes)):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+# ──────────────────────────────────────────────
+# SQL
+# ──────────────────────────────────────────────
+_instrumented: set[int] = set()
+
+
+def instrument_engine(engine) -> None:
+    """Uno span CLIENT per statement, solo dentro una traccia campionata (una volta per engine)."""
+    if not tracer.enabled or id(engine) in _instrumented:
+        return
+    _instrumented.add(id(engine))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        parent = _current_span.get()
+        if context is None or parent is None or not parent.sampled:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "SQL"
+        context._trace_span = tracer.start_span(
+            f"SQL {operation}",
+            kind="CLIENT",
+            attributes={
+                "db.system": conn.dialect.name,
+                "db.operation": operation,
+                "db.statement": statement[:MAX_STATEMENT_CHARS],
+                "db.executemany": executemany,
+            },
+            root=False,
+        )
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            context._trace_span = None
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                span.set_attribute("db.rowcount", cursor.rowcount)
+            tracer.end_span(span)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        context = exception_context.execution_context
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            context._trace_span = None
+            span.set_error(exception_context.original_exception)
+            tracer.end_span(span)
+
+
+# ──────────────────────────────────────────────
+# MIDDLEWARE HTTP
+# ──────────────────────────────────────────────
+class TracingMiddleware:
+    """Middleware ASGI: span SERVER per richiesta, traceparent in ingresso, X-Trace-Id in uscita."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                traceparent = parse_traceparent(value.decode("latin-1"))
+                break
+        method = scope["method"]
+        attributes = {"http.method": method, "url.path": scope["path"]}
+
+        with tracer.span(method, kind="SERVER", attributes=attributes, remote_parent=traceparent) as span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if span.sampled:
+                        headers = list(message.get("headers", []))
+                        headers.append((TRACE_HEADER.lower().encode(), span.trace_id.encode()))
+                        message = {**message, "headers": headers}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                # Il template della route è noto solo dopo il routing
+                route = scope.get("route")
+                if span.sampled and route is not None:
+                    span.name = f"{method} {route.path}"
+                    span.set_attribute("http.route", route.path)
@@ -0,0 +1,202 @@
+"""
+Group commit per l'ingestione eventi — molti POST /events, un solo fsync.
+
+Con SQLite ogni commit prende il lock di scrittura e fa un fsync: un commit
+per richiesta limita gli inserimenti al secondo. Con EVENT_GROUP_COMMIT=1 le
+richieste consegnano la riga a un buffer in memoria; un unico thread writer
+la scrive insieme alle altre arrivate nel frattempo e fa commit ogni
+GROUP_COMMIT_MAX_EVENTS eventi o GROUP_COMMIT_MAX_WAIT_MS millisecondi.
+
+La richiesta risponde solo dopo il commit del suo gruppo: la durabilità è
+la stessa del commit per richiesta. Se il commit del gruppo fallisce, le
+righe vengono riprovate una alla volta: fallisce solo la richiesta con la
+riga che non entra.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from app.db.database import SessionLocal
+from app.services.ingest import insert_events
+
+logger = logging.getLogger(__name__)
+
+EVENT_GROUP_COMMIT = os.getenv("EVENT_GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_MAX_EVENTS = int(os.getenv("GROUP_COMMIT_MAX_EVENTS", "64"))
+GROUP_COMMIT_MAX_WAIT_MS = float(os.getenv("GROUP_COMMIT_MAX_WAIT_MS", "5"))
+GROUP_COMMIT_TIMEOUT_SECONDS = 30.0  # attesa massima di una richiesta
+
+
+class GroupCommitWriter:
+    """
+    Buffer di righe evento svuotato da un singolo thread writer.
+
+    write() accoda la riga e blocca finché il suo gruppo non è committato;
+    se il commit fallisce, il gruppo viene riscritto riga per riga e
+    l'eccezione arriva solo alle righe che falliscono da sole.
+    Il writer usa una sessione propria per tutta la sua vita, così non
+    compete per il pool con le richieste in attesa.
+    """
+
+    def __init__(
+        self,
+        max_events: int = GROUP_COMMIT_MAX_EVENTS,
+        max_wait_ms: float = GROUP_COMMIT_MAX_WAIT_MS,
+        session_factory=SessionLocal,
+    ):
+        self.max_events = max_events
+        self.max_wait = max_wait_ms / 1000
+        self.session_factory = session_factory
+
+        self._queue: queue.Queue[tuple[dict, Future] | None] = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._batches = 0
+        self._events = 0
+        self._retried_batches = 0
+        self._failed_events = 0
+        self._cancelled = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if self.enabled:
+            return
+        self._thread = threading.Thread(target=self._drain, name="event-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Scrive quanto già accodato, poi ferma il writer."""
+        if not self.enabled:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, row: dict) -> Future:
+        """Accoda una riga della tabella events; il Future si risolve al commit del gruppo."""
+        future: Future = Future()
+        self._queue.put((row, future))
+        return future
+
+    def write(self, row: dict, timeout: float = GROUP_COMMIT_TIMEOUT_SECONDS) -> None:
+        """
+        Accoda una riga e attende il commit del suo gruppo (blocca il thread).
+
+        Allo scadere di timeout la riga viene tolta dalla coda prima di
+        sollevare TimeoutError, così un client che riprova non la duplica;
+        se il writer l'ha già presa, si attende l'esito del suo commit.
+        """
+        future = self.submit(row)
+        try:
+            future.result(timeout=timeout)
+        except TimeoutError:
+            if not future.cancel():
+                future.result()  # già nel gruppo in scrittura: commit o errore a breve
+                return
+            self._cancelled += 1
+            raise
+
+    async def write_async(self, row: dict, timeout: float = GROUP_COMMIT_TIMEOUT_SECONDS) -> None:
+        """Come write(), senza bloccare l'event loop."""
+        future = self.submit(row)
+        try:
+            # shield: allo scadere decide cancel() qui sotto, non wait_for
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except TimeoutError:
+            if not future.cancel():
+                await asyncio.wrap_future(future)
+                return
+            self._cancelled += 1
+            raise
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queue_depth": self._queue.qsize(),
+            "batches": self._batches,
+            "events": self._events,
+            "avg_batch_size": round(self._events / self._batches, 2) if self._batches else 0.0,
+            "retried_batches": self._retried_batches,
+            "failed_events": self._failed_events,
+            "cancelled": self._cancelled,
+        }
+
+    # ── writer ──
+    def _collect(self, first: tuple[dict, Future]) -> tuple[list[tuple[dict, Future]], bool]:
+        """Gruppo che parte da first; il bool indica che è arrivato lo stop."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_events:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _drain(self) -> None:
+        db = self.session_factory()
+        try:
+            stopping = False
+            while not stopping:
+                first = self._queue.get()
+                if first is None:
+                    break
+                batch, stopping = self._collect(first)
+                self._commit(db, batch)
+        finally:
+            db.close()
+
+    def _commit(self, db, batch: list[tuple[dict, Future]]) -> None:
+        # Le righe cancellate da write() allo scadere del timeout non si scrivono;
+        # da qui in poi cancel() non ha più effetto
+        batch = [(row, future) for row, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            insert_events(db, [row for row, _ in batch])
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            if len(batch) == 1:
+                logger.exception("Scrittura evento fallita")
+                self._failed_events += 1
+                batch[0][1].set_exception(exc)
+                return
+            logger.warning("Group commit fallito (%d eventi): riprovo una riga alla volta", len(batch))
+            self._retried_batches += 1
+            for item in batch:
+                self._commit_one(db, item)
+            return
+
+        self._batches += 1
+        self._events += len(batch)
+        for _, future in batch:
+            future.set_result(None)
+
+    def _commit_one(self, db, item: tuple[dict, Future]) -> None:
+        row, future = item
+        try:
+            insert_events(db, [row])
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            logger.exception("Scrittura evento fallita")
+            self._failed_events += 1
+            future.set_exception(exc)
+            return
+        self._batches += 1
+        self._events += 1
+        future.set_result(None)
+
+
+event_writer = GroupCommitWriter()
@@ -1,152 +1,361 @@
 """
-Simulazione 30 giorni — genera dati realistici per demo e analisi.
+Generatore di carico sintetico — N utenti, profili di attività, più processi.
 
-Simula un utente ansioso che usa l'app con costanza variabile.
-Produce eventi, ricalcola crescita e stato del mare giorno per giorno.
+Crea un dataset di dimensioni realistiche per le analisi di performance:
+ogni utente ha 3 pesci e un profilo di attività estratto da una
+distribuzione configurabile (--mix), con eventi generati giorno per giorno
+sull'orizzonte scelto (--days). I blocchi di utenti sono generati e
+scritti in parallelo da processi worker, con INSERT executemany e rollup
+giornaliero (una transazione per blocco).
 
-Run:
-    python -m app.simulate
+Alla fine misura il ricalcolo per utente su un campione (compute_fish_growth
++ compute_sea_state) e il ricalcolo batch di tutti gli utenti, e riporta
+eventi/s, tempi di ricalcolo e dimensione del database.
+
+Gli utenti simulati hanno email <id>@sim.mare-calmo.local e una password
+non utilizzabile: non è possibile fare login come loro.
+
+Con --profile FILE il processo principale è campionato per tutta la
+durata (services/profiler.py): stack collassati in FILE per un flamegraph e
+tabella delle funzioni più calde a fine run.
+
+Run (dalla cartella backend):
+    python -m app.simulate --users 5000 --days 90 --workers 4
+    python -m app.simulate --users 1000 --mix costante=0.5,abbandono=0.5
+    python -m app.simulate --users 500 --workers 0 --reset --profile sim.collapsed
 """
+import argparse
+import math
+import multiprocessing
+import os
 import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
 
-from app.db.database import SessionLocal, init_db
+from sqlalchemy import create_engine, event, func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from app.db.database import Base
 from app.models.models import Event, Fish, FishState, SeaState, User
+from app.services.batch import compute_state_batch
 from app.services.growth import compute_fish_growth
+from app.services.ingest import event_row, insert_events
+from app.services.profiler import format_top, profiler
 from app.services.sea_state import compute_sea_state
 
 
-def simulate():
-    init_db()
-    db = SessionLocal()
-
-    # ── Create user ──
-    user = User(locale="it", onboarding_completed=True)
-    db.add(user)
-    db.flush()
-    print(f"👤 User created: {user.id}")
-
-    # ── Create fish ──
-    dimensions = ["studio", "lavoro", "benessere"]
-    fish_map = {}
-    for dim in dimensions:
-        f = Fish(user_id=user.id, dimension=dim)
-        db.add(f)
-        db.flush()
-        db.add(FishState(fish_id=f.id))
-        fish_map[dim] = f.id
-
-    # ── Init sea state ──
-    db.add(SeaState(
-        user_id=user.id,
-        visual_params={"light": 0.4, "wave_speed": 0.5, "particles": False},
-    ))
-    db.commit()
-
-    # ── Simulate 30 days ──
-    start_date = datetime.now(timezone.utc) - timedelta(days=30)
-
-    print("\n📅 Simulazione 30 giorni\n")
-    print(f"{'Giorno':>6} | {'Ansia':>5} | {'Energia':>7} | {'Eventi':>6} | {'Crescita media':>14} | {'Mare':>12}")
-    print("-" * 70)
-
-    for day in range(30):
-        current_date = start_date + timedelta(days=day)
-
-        # Probability of being active (increases over time with some variance)
-        base_prob = 0.5 + day * 0.01
-        active_today = random.random() < min(base_prob, 0.85)
-
-        if not active_today:
-            # Recompute with no new events
-            compute_fish_growth(db, user.id, current_date)
-            compute_sea_state(db, user.id, current_date)
-            sea = db.get(SeaState, user.id)
-            print(f"  {day+1:>4}  | {'—':>5} | {'—':>7} | {'0':>6} | {'—':>14} | {sea.sea_state_label:>12}")
-            continue
+# ──────────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────────
+DIMENSIONS = ["studio", "lavoro", "benessere"]
+CONTEXTS = ["studio", "lavoro", "studio", "studio"]
+UNUSABLE_PASSWORD = "!"  # nessun hash argon2 corrisponde: login impossibile
+
+# Profili di attività. Le probabilità e l'ansia vanno linearmente da
+# *_start a *_end sull'orizzonte; churn_at è la frazione dell'orizzonte
+# dopo cui l'utente smette di usare l'app (None = mai).
+PROFILES: dict[str, dict] = {
+    "costante":   {"p_active_start": 0.80, "p_active_end": 0.85, "anxiety_start": 3.0, "anxiety_end": 2.5, "extra_check_ins": 0.5, "churn_at": None},
+    "irregolare": {"p_active_start": 0.35, "p_active_end": 0.35, "anxiety_start": 3.5, "anxiety_end": 3.5, "extra_check_ins": 0.2, "churn_at": None},
+    "ansioso":    {"p_active_start": 0.50, "p_active_end": 0.85, "anxiety_start": 5.0, "anxiety_end": 2.5, "extra_check_ins": 1.0, "churn_at": None},
+    "abbandono":  {"p_active_start": 0.90, "p_active_end": 0.60, "anxiety_start": 4.0, "anxiety_end": 4.0, "extra_check_ins": 0.3, "churn_at": 0.2},
+}
+DEFAULT_MIX = "costante=0.3,irregolare=0.4,ansioso=0.2,abbandono=0.1"
+
+SHARD_USERS = 200       # utenti per blocco (una transazione per blocco)
+SQLITE_BUSY_TIMEOUT = 60  # secondi di attesa sul lock di scrittura tra worker
+LOAD_CACHE_KIB = 256 * 1024  # cache di pagine SQLite per connessione durante il caricamento
+
+
+# ──────────────────────────────────────────────
+# UTILS
+# ──────────────────────────────────────────────
+def parse_mix(text: str) -> dict[str, float]:
+    """'costante=0.3,irregolare=0.7' → pesi per profilo."""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in PROFILES:
+            raise ValueError(f"Profilo sconosciuto: {name!r} (disponibili: {', '.join(PROFILES)})")
+        mix[name] = float(weight or 1)
+    if sum(mix.values()) <= 0:
+        raise ValueError("La somma dei pesi deve essere positiva")
+    return mix
+
 
-        # Anxiety pattern: starts high, gradually improves with noise
-        base_anxiety = max(1, 5 - day * 0.08 + random.gauss(0, 0.8))
-        anxiety = max(1, min(5, round(base_anxiety)))
+def make_engine(db_path: str):
+    engine = create_engine(
+        f"sqlite:///{db_path}",
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT},
+    )
 
-        energy = random.choice([1, 2, 2, 3])
-        context = random.choice(["studio", "lavoro", "studio", "studio"])
-        events_today = 0
+    @event.listens_for(engine, "connect")
+    def _bulk_load_pragmas(dbapi_connection, _record):
+        # Dataset sintetico e rigenerabile: niente fsync, cache ampia per gli indici
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute(f"PRAGMA cache_size=-{LOAD_CACHE_KIB}")
+        cursor.close()
+
+    return engine
+
+
+def db_size_bytes(db_path: str) -> int:
+    return sum(
+        os.path.getsize(path)
+        for path in (db_path, f"{db_path}-wal", f"{db_path}-journal")
+        if os.path.exists(path)
+    )
+
+
+def random_id(rnd: random.Random) -> str:
+    """UUID4 riproducibile dal seed del blocco."""
+    return str(uuid.UUID(int=rnd.getrandbits(128), version=4))
+
+
+def poisson(rnd: random.Random, mean: float) -> int:
+    """Estrazione di Poisson (Knuth), adatta alle medie piccole dei profili."""
+    limit, k, p = math.exp(-mean), 0, rnd.random()
+    while p > limit:
+        k += 1
+        p *= rnd.random()
+    return k
+
+
+# ──────────────────────────────────────────────
+# GENERAZIONE
+# ──────────────────────────────────────────────
+def simulate_user(
+    rnd: random.Random,
+    user_id: str,
+    fish_map: dict[str, str],
+    profile: dict,
+    start: datetime,
+    days: int,
+) -> list[dict]:
+    """Righe evento di un utente su days giorni a partire da start."""
+    rows = []
+    end = start + timedelta(days=days)
+    churn_day = int(days * profile["churn_at"]) if profile["churn_at"] is not None else days
+    for day in range(min(days, churn_day)):
+        progress = day / max(days - 1, 1)
+        p_active = profile["p_active_start"] + (profile["p_active_end"] - profile["p_active_start"]) * progress
+        if rnd.random() >= p_active:
+            continue
 
-        # Check-in
-        db.add(Event(
-            user_id=user.id,
-            event_type="check_in",
-            metadata_json={
+        base_anxiety = profile["anxiety_start"] + (profile["anxiety_end"] - profile["anxiety_start"]) * progress
+        moment = start + timedelta(days=day, seconds=rnd.randrange(7 * 3600, 22 * 3600))
+
+        for _ in range(1 + poisson(rnd, profile["extra_check_ins"])):
+            if moment >= end:
+                break
+            anxiety = max(1, min(5, round(base_anxiety + rnd.gauss(0, 0.8))))
+            context = rnd.choice(CONTEXTS)
+            rows.append(event_row(user_id, "check_in", {
                 "anxiety_level": anxiety,
-                "energy": energy,
+                "energy": rnd.choice([1, 2, 2, 3]),
                 "context": context,
                 "fish_id": fish_map[context],
-            },
-            created_at=current_date,
-        ))
-        events_today += 1
-
-        # Maybe micro-action (more likely if anxiety is high)
-        if random.random() < (0.3 + anxiety * 0.1):
-            db.add(Event(
-                user_id=user.id,
-                event_type="micro_action",
-                metadata_json={
-                    "action_type": random.choice(["breathing", "grounding", "journaling"]),
-                    "fish_id": fish_map[random.choice(dimensions)],
-                },
-                created_at=current_date + timedelta(minutes=5),
-            ))
-            events_today += 1
-
-        # Maybe reflection
-        if random.random() < 0.25:
-            db.add(Event(
-                user_id=user.id,
-                event_type="reflection",
-                metadata_json={
+            }, moment))
+
+            # Micro-azione più probabile con ansia alta
+            if rnd.random() < 0.3 + anxiety * 0.1:
+                rows.append(event_row(user_id, "micro_action", {
+                    "action_type": rnd.choice(["breathing", "grounding", "journaling"]),
+                    "fish_id": fish_map[rnd.choice(DIMENSIONS)],
+                }, moment + timedelta(minutes=5)))
+
+            if rnd.random() < 0.25:
+                rows.append(event_row(user_id, "reflection", {
                     "fish_id": fish_map["benessere"],
-                },
-                created_at=current_date + timedelta(minutes=10),
-            ))
-            events_today += 1
+                }, moment + timedelta(minutes=10)))
+
+            moment += timedelta(minutes=rnd.randrange(30, 180))
+    return rows
+
+
+_session_factory = None
+_write_lock = None
+
+
+def _init_worker(db_path: str, write_lock) -> None:
+    global _session_factory, _write_lock
+    _session_factory = sessionmaker(bind=make_engine(db_path), autoflush=False)
+    _write_lock = write_lock
+
+
+def load_shard(offset: int, n_users: int, days: int, mix: dict[str, float], seed: int, now: datetime) -> tuple[list[str], int]:
+    """
+    Genera e scrive un blocco di utenti in una transazione. Ritorna (user_ids, eventi).
+    offset (utenti già presenti + posizione del blocco) rende il blocco
+    riproducibile e diverso da quelli di una generazione precedente.
+    """
+    rnd = random.Random(seed * 1_000_003 + offset)
+    start = now - timedelta(days=days)
+    names, weights = list(mix), list(mix.values())
 
+    users, fish, fish_states, seas, events = [], [], [], [], []
+    for _ in range(n_users):
+        user_id = random_id(rnd)
+        users.append({
+            "id": user_id,
+            "email": f"{user_id}@sim.mare-calmo.local",
+            "hashed_password": UNUSABLE_PASSWORD,
+            "locale": "it",
+            "onboarding_completed": True,
+            "created_at": start,
+        })
+        fish_map = {dim: random_id(rnd) for dim in DIMENSIONS}
+        fish += [{"id": fid, "user_id": user_id, "dimension": dim, "created_at": start} for dim, fid in fish_map.items()]
+        fish_states += [{"fish_id": fid} for fid in fish_map.values()]
+        seas.append({
+            "user_id": user_id,
+            "visual_params": {"light": 0.4, "wave_speed": 0.5, "particles": False},
+        })
+        profile = PROFILES[rnd.choices(names, weights)[0]]
+        events += simulate_user(rnd, user_id, fish_map, profile, start, days)
+
+    # SQLite ha un solo writer: i worker generano in parallelo e si passano
+    # il lock per scrivere, senza i tentativi a vuoto del busy timeout
+    with _write_lock, _session_factory() as db:
+        db.execute(insert(User), users)
+        db.execute(insert(Fish), fish)
+        db.execute(insert(FishState), fish_states)
+        db.execute(insert(SeaState), seas)
+        if events:
+            insert_events(db, events)
         db.commit()
+    return [u["id"] for u in users], len(events)
+
+
+# ──────────────────────────────────────────────
+# CORE LOGIC
+# ──────────────────────────────────────────────
+def generate(
+    db_path: str,
+    n_users: int,
+    days: int,
+    mix: dict[str, float],
+    workers: int,
+    seed: int,
+    now: datetime,
+    existing_users: int = 0,
+) -> tuple[list[str], int]:
+    """Aggiunge n_users utenti a db_path; workers=0 genera nel processo corrente."""
+    shards = [
+        (existing_users + offset, min(SHARD_USERS, n_users - offset), days, mix, seed, now)
+        for offset in range(0, n_users, SHARD_USERS)
+    ]
+    if workers == 0:
+        _init_worker(db_path, threading.Lock())
+        results = [load_shard(*args) for args in shards]
+    else:
+        initargs = (db_path, multiprocessing.Lock())
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as pool:
+            results = list(pool.map(load_shard, *zip(*shards)))
+
+    user_ids = [user_id for ids, _ in results for user_id in ids]
+    return user_ids, sum(n for _, n in results)
+
+
+def measure_recompute(session_factory, user_ids: list[str], now: datetime) -> list[float]:
+    """Secondi di compute_fish_growth + compute_sea_state per ciascun utente."""
+    timings = []
+    with session_factory() as db:
+        for user_id in user_ids:
+            started = time.perf_counter()
+            compute_fish_growth(db, user_id, now)
+            compute_sea_state(db, user_id, now)
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generatore di carico sintetico (utenti, eventi, ricalcolo)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=30, help="orizzonte simulato, fino a oggi")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"pesi dei profili ({', '.join(PROFILES)})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processi worker (0 = nessun worker)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default="mare_calmo_workload.db", help="file SQLite di destinazione")
+    parser.add_argument("--reset", action="store_true", help="cancella il database prima di generare")
+    parser.add_argument("--sample", type=int, default=100, help="utenti ricalcolati uno alla volta")
+    parser.add_argument("--no-batch", action="store_true", help="salta il ricalcolo batch di tutti gli utenti")
+    parser.add_argument("--profile", metavar="FILE", help="profilo a campionamento del processo principale, stack collassati in FILE "
+                        "(i processi worker non sono inclusi: --workers 0 per profilare anche la generazione)")
+    parser.add_argument("--profile-allocations", action="store_true", help="con --profile, anche le allocazioni (tracemalloc)")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as exc:
+        parser.error(str(exc))
 
-        # Recompute
-        compute_fish_growth(db, user.id, current_date)
-        compute_sea_state(db, user.id, current_date)
+    if args.reset:
+        for suffix in ("", "-wal", "-journal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
 
-        # Report
-        fish_states = [db.get(FishState, fid) for fid in fish_map.values()]
-        avg_growth = sum(fs.growth_level for fs in fish_states if fs) / len(fish_states)
-        sea = db.get(SeaState, user.id)
+    engine = make_engine(args.db)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine, autoflush=False)
+    now = datetime.now(timezone.utc)
+    with session_factory() as db:
+        existing_users = db.scalar(select(func.count()).select_from(User))
 
-        print(
-            f"  {day+1:>4}  | {anxiety:>5} | {energy:>7} | "
-            f"{events_today:>6} | {avg_growth:>13.3f} | {sea.sea_state_label:>12}"
-        )
+    print(f"\n🌊 {args.users} utenti × {args.days} giorni, {args.workers} worker → {args.db}")
+    print(f"   Profili: {', '.join(f'{k}={v:g}' for k, v in mix.items())}\n")
+    if args.profile:
+        profiler.start(allocations=args.profile_allocations)
 
-    # ── Final report ──
-    print("\n" + "=" * 70)
-    print("📊 REPORT FINALE\n")
+    load_s = time.perf_counter()
+    user_ids, n_events = generate(
+        args.db, args.users, args.days, mix, args.workers, args.seed, now, existing_users,
+    )
+    load_s = time.perf_counter() - load_s
 
-    sea = db.get(SeaState, user.id)
-    print(f"  Stato del mare: {sea.sea_state_label} (score: {sea.sea_state_score:.3f})")
-    print(f"  Visual params: {sea.visual_params}\n")
+    sample = random.Random(args.seed).sample(user_ids, min(args.sample, len(user_ids)))
+    timings = measure_recompute(session_factory, sample, now)
 
-    for dim, fid in fish_map.items():
-        fs = db.get(FishState, fid)
-        print(f"  🐟 {dim}: growth={fs.growth_level:.3f}, stage={fs.visual_stage}")
+    batch_s = None
+    if not args.no_batch:
+        with session_factory() as db:
+            batch_s = time.perf_counter()
+            compute_state_batch(db, reference_date=now)
+            batch_s = time.perf_counter() - batch_s
 
-    total_events = db.query(Event).filter(Event.user_id == user.id).count()
-    print(f"\n  Totale eventi: {total_events}")
-    print(f"  User ID: {user.id}")
+    with session_factory() as db:
+        total_users = db.scalar(select(func.count()).select_from(User))
+        total_events = db.scalar(select(func.count()).select_from(Event))
+    engine.dispose()
+    size = db_size_bytes(args.db)
+    profile = profiler.stop() if args.profile else None
 
-    db.close()
-    print("\n✅ Simulazione completata!")
+    print(f"{'Caricamento':<26} {n_events} eventi in {load_s:.2f}s ({n_events / load_s:.0f} eventi/s)")
+    if timings:
+        ms = sorted(t * 1000 for t in timings)
+        p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+        print(f"{'Ricalcolo per utente':<26} media {statistics.mean(ms):.1f} ms, p95 {p95:.1f} ms ({len(ms)} utenti)")
+    if batch_s is not None:
+        print(f"{'Ricalcolo batch':<26} {total_users} utenti in {batch_s:.2f}s ({total_users / batch_s:.0f} utenti/s)")
+    per_event = size / total_events if total_events else 0
+    print(f"{'Database':<26} {size / 1e6:.1f} MB ({total_users} utenti, {total_events} eventi, {per_event:.0f} B/evento)")
+    if profile is not None:
+        with open(args.profile, "w", encoding="utf-8") as f:
+            f.write(profile.collapsed())
+        print(f"\n🔥 Profilo: {profile.samples} campioni in {profile.seconds:.1f}s → {args.profile} (flamegraph.pl, speedscope)\n")
+        print(format_top(profile.top(20)))
+        for row in profile.allocations or []:
+            print(f"{row['size_kib']:>10.1f} KiB  {row['count']:>8} blocchi  {row['line']}")
+    print("\n✅ Dataset pronto")
+    return 0
 
 
 if __name__ == "__main__":
-    simulate()
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Benchmark — archivio freddo: dimensione della tabella events e letture unificate.
+
+Popola --users utenti con --days giorni di eventi, porta stato e snapshot
+fino a ieri, poi sposta nei segmenti mensili gli eventi più vecchi di
+--older-than-days. Verifica che export e replay a metà periodo diano gli
+stessi risultati prima e dopo, e riporta righe calde, dimensione del
+database (dopo VACUUM) e dei segmenti, e i tempi delle letture unificate.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_archive --users 50 --days 365 --events-per-day 6
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import timedelta
+
+from sqlalchemy import func, insert, select
+
+from app.models.models import Event, Fish, User, utcnow
+from app.services import archive
+from app.services.export import export_user_data
+from app.services.growth import EVENT_WEIGHTS, compute_fish_growth
+from app.services.ingest import event_row, insert_events
+from app.services.replay import take_snapshots, replay_state
+from app.services.sea_state import compute_sea_state
+from benchmarks.common import temp_sessionmaker, timed
+
+DIMENSIONS = ["studio", "lavoro", "benessere"]
+
+
+def seed(db, n_users: int, days: int, events_per_day: int) -> list[str]:
+    rnd = random.Random(15)
+    now = utcnow()
+    user_ids = [f"{u:08d}-archive-bench" for u in range(n_users)]
+    db.execute(insert(User), [{"id": uid, "email": f"{uid}@example.com", "hashed_password": "x"} for uid in user_ids])
+    db.execute(insert(Fish), [
+        {"id": f"{uid}-{dim}", "user_id": uid, "dimension": dim} for uid in user_ids for dim in DIMENSIONS
+    ])
+    for uid in user_ids:
+        rows = []
+        for _ in range(days * events_per_day):
+            dimension = rnd.choice(DIMENSIONS)
+            metadata = {"anxiety_level": rnd.randint(1, 5), "context": dimension}
+            if rnd.random() < 0.7:
+                metadata["fish_id"] = f"{uid}-{dimension}"
+            rows.append(event_row(uid, rnd.choice(list(EVENT_WEIGHTS)), metadata, now - timedelta(seconds=rnd.randrange(days * 86400))))
+        insert_events(db, rows)
+    db.commit()
+    return user_ids
+
+
+def db_bytes(engine) -> int:
+    with engine.connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+    return os.path.getsize(engine.url.database)
+
+
+def observe(db, user_ids: list[str], reference_date) -> tuple[list, list, float, float]:
+    """Export (senza export_date) e replay di ogni utente, con i tempi totali."""
+    exports, replays = [], []
+    export_s = replay_s = 0.0
+    for uid in user_ids:
+        elapsed, data = timed(export_user_data, db, uid)
+        export_s += elapsed
+        data.pop("export_date")
+        exports.append(data)
+        elapsed, state = timed(replay_state, db, uid, reference_date)
+        replay_s += elapsed
+        replays.append(state)
+    return exports, replays, export_s, replay_s
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--events-per-day", type=int, default=6)
+    parser.add_argument("--older-than-days", type=int, default=90)
+    args = parser.parse_args(argv)
+
+    with temp_sessionmaker() as session_factory, tempfile.TemporaryDirectory(prefix="mare_calmo_archive_") as archive_dir:
+        archive.EVENT_ARCHIVE_DIR = archive_dir
+        engine = session_factory.kw["bind"]
+        with session_factory() as db:
+            seed_s, user_ids = timed(seed, db, args.users, args.days, args.events_per_day)
+            for uid in user_ids:
+                compute_fish_growth(db, uid)
+                compute_sea_state(db, uid)
+                take_snapshots(db, uid)
+            reference_date = utcnow() - timedelta(days=args.days // 2)
+
+            before = observe(db, user_ids, reference_date)
+            hot_before = db.execute(select(func.count()).select_from(Event)).scalar()
+        size_before = db_bytes(engine)
+
+        with session_factory() as db:
+            archive_s, summary = timed(archive.archive_events, db, utcnow() - timedelta(days=args.older_than_days))
+        size_after = db_bytes(engine)
+        segment_bytes = sum(
+            os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(archive_dir) for name in names
+        )
+
+        with session_factory() as db:
+            after = observe(db, user_ids, reference_date)
+            hot_after = db.execute(select(func.count()).select_from(Event)).scalar()
+
+    print(f"\n🧊 {args.users} utenti × {args.days} giorni, archivio oltre {args.older_than_days} giorni (seed {seed_s:.1f}s)\n")
+    print(f"{'':<22} | {'Prima':>12} | {'Dopo':>12}")
+    print("-" * 52)
+    print(f"{'Righe in events':<22} | {hot_before:>12} | {hot_after:>12}")
+    print(f"{'Database (KiB)':<22} | {size_before / 1024:>12.0f} | {size_after / 1024:>12.0f}")
+    print(f"{'Segmenti (KiB)':<22} | {'':>12} | {segment_bytes / 1024:>12.0f}")
+    print(f"{'Export totale (ms)':<22} | {before[2] * 1000:>12.1f} | {after[2] * 1000:>12.1f}")
+    print(f"{'Replay totale (ms)':<22} | {before[3] * 1000:>12.1f} | {after[3] * 1000:>12.1f}")
+    print(f"\nArchiviati {summary['events']} eventi in {summary['segments']} segmenti su {summary['months']} mesi ({archive_s:.2f}s)")
+
+    if before[0] != after[0] or before[1] != after[1]:
+        print("❌ Export o replay cambiano dopo l'archiviazione")
+        return 1
+    print("✅ Export e replay identici")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Benchmark — latenza sotto concorrenza: percorso DB sync vs async.
+
+Per ogni modalità avvia un processo separato (DB_ASYNC=0 / DB_ASYNC=1,
+letto all'import dell'app) in una cartella temporanea, così mare_calmo.db
+è un database nuovo. Il processo popola gli utenti, poi --concurrency
+client concorrenti inviano --requests richieste autenticate all'app
+(httpx + ASGITransport, stesso event loop): POST /events con probabilità
+--writes (default 0.2), altrimenti 3 su 4 GET /world e 1 su 4 GET /fish.
+Riporta p50/p95/p99, richieste/s, errori e il ritardo massimo dell'event
+loop (una sonda che dorme 5 ms e misura lo sforamento). Client e app
+condividono processo e loop: i valori assoluti includono il client, il
+confronto tra modalità resta valido.
+
+Il ricalcolo in background è disattivato (RECOMPUTE_WORKERS=0) per non
+mescolare al carico HTTP le scritture dei worker. La modalità async
+richiede aiosqlite.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_async --users 200 --concurrency 64 --requests 4000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import secrets
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ["sync", "async"]
+LOOP_PROBE_SECONDS = 0.005
+
+
+# ──────────────────────────────────────────────
+# PROCESSO FIGLIO (una modalità)
+# ──────────────────────────────────────────────
+def seed(n_users: int, events_per_user: int) -> list[tuple[str, str]]:
+    """Utenti con pesci, stato e storico eventi. Ritorna (user_id, token)."""
+    from datetime import timedelta
+
+    from sqlalchemy import insert
+
+    from app.auth import create_access_token
+    from app.db.database import SessionLocal
+    from app.models.models import Fish, FishState, SeaState, User, utcnow
+    from app.services.ingest import event_row, insert_events
+
+    rnd = random.Random(3)
+    now = utcnow()
+    users, fish, events = [], [], []
+    for u in range(n_users):
+        user_id = f"{u:08d}-async-bench"
+        users.append({"id": user_id, "email": f"{user_id}@example.com", "hashed_password": "x"})
+        fish += [{"id": f"{user_id}-{dim}", "user_id": user_id, "dimension": dim} for dim in ("studio", "lavoro", "benessere")]
+        events += [
+            event_row(user_id, "check_in", {"anxiety_level": rnd.randint(1, 5)}, now - timedelta(minutes=rnd.randrange(43200)))
+            for _ in range(events_per_user)
+        ]
+    with SessionLocal() as db:
+        db.execute(insert(User), users)
+        db.execute(insert(Fish), fish)
+        db.execute(insert(FishState), [{"fish_id": f["id"]} for f in fish])
+        db.execute(insert(SeaState), [{"user_id": u["id"], "visual_params": {}} for u in users])
+        insert_events(db, events)
+        db.commit()
+    return [(u["id"], create_access_token({"email": u["email"]})) for u in users]
+
+
+async def probe_loop(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_PROBE_SECONDS)
+        lags.append(time.perf_counter() - started - LOOP_PROBE_SECONDS)
+
+
+async def run_mode(mode: str, args) -> dict:
+    import httpx
+
+    from app.db.database import ASYNC_DB_ENABLED
+    from app.main import app
+
+    if (mode == "async") != ASYNC_DB_ENABLED:
+        raise SystemExit(f"Modalità {mode} non disponibile (aiosqlite installato?)")
+
+    await app.router.startup()
+    users = seed(args.users, args.events_per_user)
+
+    latencies: list[float] = []
+    errors = 0
+    remaining = args.requests
+
+    async def client_loop(client: httpx.AsyncClient, worker: int) -> None:
+        nonlocal errors, remaining
+        rnd = random.Random(worker)
+        while remaining > 0:
+            remaining -= 1
+            user_id, token = rnd.choice(users)
+            headers = {"Authorization": f"Bearer {token}"}
+            write, world = rnd.random() < args.writes, rnd.random() < 0.75
+            started = time.perf_counter()
+            if write:
+                response = await client.post("/api/events", headers=headers, json={
+                    "user_id": user_id, "event_type": "check_in", "metadata": {"anxiety_level": rnd.randint(1, 5)},
+                })
+            elif world:
+                response = await client.get(f"/api/user/{user_id}/world", headers=headers)
+            else:
+                response = await client.get(f"/api/user/{user_id}/fish", headers=headers)
+            latencies.append(time.perf_counter() - started)
+            errors += response.status_code != 200
+
+    lags: list[float] = []
+    stop = asyncio.Event()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        probe = asyncio.create_task(probe_loop(lags, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, w) for w in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await probe
+
+    await app.router.shutdown()
+
+    ms = sorted(t * 1000 for t in latencies)
+    percentile = lambda q: ms[min(len(ms) - 1, int(len(ms) * q))]
+    return {
+        "mode": mode,
+        "requests": len(ms),
+        "errors": errors,
+        "rps": round(len(ms) / elapsed, 1),
+        "p50_ms": round(statistics.median(ms), 2),
+        "p95_ms": round(percentile(0.95), 2),
+        "p99_ms": round(percentile(0.99), 2),
+        "max_loop_lag_ms": round(max(lags, default=0.0) * 1000, 2),
+    }
+
+
+# ──────────────────────────────────────────────
+# PROCESSO PRINCIPALE
+# ──────────────────────────────────────────────
+def spawn(mode: str, args) -> dict:
+    env = {
+        **os.environ,
+        "DB_ASYNC": "1" if mode == "async" else "0",
+        "RECOMPUTE_WORKERS": "0",
+        "SECRET_KEY": os.environ.get("SECRET_KEY") or secrets.token_urlsafe(48),
+        "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])),
+    }
+    argv = [
+        sys.executable, "-m", "benchmarks.bench_async", "--mode", mode,
+        "--users", str(args.users), "--events-per-user", str(args.events_per_user),
+        "--concurrency", str(args.concurrency), "--requests", str(args.requests),
+        "--writes", str(args.writes),
+    ]
+    with tempfile.TemporaryDirectory(prefix="mare_calmo_bench_") as cwd:
+        out = subprocess.run(argv, cwd=cwd, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"Modalità {mode} fallita:\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--events-per-user", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--writes", type=float, default=0.2, help="frazione di POST /events")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)  # processo figlio
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        print(json.dumps(asyncio.run(run_mode(args.mode, args))))
+        return 0
+
+    results = [spawn(mode, args) for mode in MODES]
+
+    print(f"\n⚡ {args.requests} richieste ({args.writes:.0%} scritture), {args.concurrency} client concorrenti, {args.users} utenti\n")
+    print(f"{'Modalità':<8} | {'Req/s':>7} | {'p50 (ms)':>8} | {'p95 (ms)':>8} | {'p99 (ms)':>8} | {'Lag loop (ms)':>13} | {'Errori':>6}")
+    print("-" * 78)
+    for r in results:
+        print(
+            f"{r['mode']:<8} | {r['rps']:>7.0f} | {r['p50_ms']:>8.1f} | {r['p95_ms']:>8.1f} | "
+            f"{r['p99_ms']:>8.1f} | {r['max_loop_lag_ms']:>13.1f} | {r['errors']:>6}"
+        )
+
+    if any(r["errors"] for r in results):
+        print("❌ Alcune richieste sono fallite")
+        return 1
+    print("✅ Nessun errore")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Benchmark — costo dell'autenticazione per richiesta: con e senza cache dei principal.
+
+Chiama get_current_user come farebbe FastAPI (header Authorization e una
+sessione nuova per richiesta) su un database temporaneo con --users utenti
+e un token ciascuno. Senza cache ogni chiamata decodifica il JWT e legge
+l'utente; con cache, dopo il primo giro, è un lookup in memoria.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_auth --users 200 --requests 20000
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from sqlalchemy import insert
+
+from app.auth.auth_cache import PrincipalCache
+from app.auth import auth_dependencies
+from app.auth.auth_revocation import revocation_store
+from app.auth.auth_tokens import create_access_token
+from app.models.models import User
+from benchmarks.common import temp_sessionmaker
+
+
+def run(session_factory, headers: list[str], n_requests: int, cache: PrincipalCache) -> list[float]:
+    """Latenze (µs) di get_current_user con la cache indicata."""
+    auth_dependencies.principal_cache = cache
+    rnd = random.Random(16)
+    samples = []
+    for _ in range(n_requests):
+        authorization = rnd.choice(headers)
+        started = time.perf_counter()
+        auth_dependencies.get_current_user(authorization=authorization, db=session_factory())
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    with temp_sessionmaker() as session_factory:
+        with session_factory() as db:
+            users = [{"id": f"{u:08d}-auth-bench", "email": f"{u:08d}@example.com", "hashed_password": "x"} for u in range(args.users)]
+            db.execute(insert(User), users)
+            db.commit()
+        revocation_store.session_factory = revocation_store.read_session_factory = session_factory
+        headers = [f"Bearer {create_access_token({'email': u['email']})}" for u in users]
+
+        original = auth_dependencies.principal_cache
+        try:
+            results = {
+                "senza cache": (run(session_factory, headers, args.requests, PrincipalCache(0, 0)), None),
+            }
+            cache = PrincipalCache(max_entries=10_000, ttl_seconds=600)
+            results["con cache"] = (run(session_factory, headers, args.requests, cache), cache.metrics())
+        finally:
+            auth_dependencies.principal_cache = original
+
+    print(f"\n🔑 get_current_user: {args.requests} richieste, {args.users} utenti\n")
+    print(f"{'Modalità':<12} | {'p50 (µs)':>9} | {'p99 (µs)':>9} | {'Hit ratio':>9}")
+    print("-" * 48)
+    for name, (samples, metrics) in results.items():
+        ordered = sorted(samples)
+        hit_ratio = f"{metrics['hit_ratio']:.1%}" if metrics else "-"
+        print(
+            f"{name:<12} | {statistics.median(ordered):>9.1f} | "
+            f"{ordered[int(len(ordered) * 0.99)]:>9.1f} | {hit_ratio:>9}"
+        )
+    cold = statistics.median(results["senza cache"][0])
+    warm = statistics.median(results["con cache"][0])
+    print(f"\nSpeedup p50: {cold / warm:.0f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Benchmark — ricalcolo notturno per utente vs kernel batch vettoriale.
+
+Popola due database identici, ricalcola tutti gli utenti con
+compute_fish_growth + compute_sea_state (uno alla volta) e con
+compute_state_batch, verifica che i risultati coincidano esattamente
+e riporta il throughput in utenti al secondo.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_batch --users 2000 --events-per-user 50
+"""
+import argparse
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, select
+
+from app.models.models import Event, Fish, FishState, SeaState, User, event_hot_columns
+from app.services.batch import compute_state_batch
+from app.services.daily_stats import backfill_daily_stats
+from app.services.growth import EVENT_WEIGHTS, compute_fish_growth
+from app.services.ingest import assign_event_seq
+from app.services.sea_state import compute_sea_state
+from benchmarks.common import temp_session, timed
+
+DIMENSIONS = ["studio", "lavoro", "benessere"]
+
+
+def seed(db, n_users: int, events_per_user: int, seed_value: int, now: datetime) -> None:
+    """Utenti con 3 pesci ciascuno ed eventi negli ultimi 60 giorni (deterministico)."""
+    rnd = random.Random(seed_value)
+    event_types = list(EVENT_WEIGHTS)
+    users, fish, events = [], [], []
+    for u in range(n_users):
+        user_id = f"{u:08d}-bench"
+        users.append({"id": user_id, "email": f"{user_id}@example.com", "hashed_password": "x"})
+        fish_ids = [f"{user_id}-{dim}" for dim in DIMENSIONS]
+        fish += [{"id": fid, "user_id": user_id, "dimension": dim} for fid, dim in zip(fish_ids, DIMENSIONS)]
+        for i in range(rnd.randint(0, 2 * events_per_user)):
+            metadata = {"anxiety_level": rnd.randint(1, 5)}
+            if rnd.random() < 0.7:
+                metadata["fish_id"] = rnd.choice(fish_ids)
+            events.append({
+                "id": f"{user_id}-{i:06d}",
+                "user_id": user_id,
+                "event_type": rnd.choice(event_types),
+                "metadata_json": metadata,
+                **event_hot_columns(metadata),
+                "created_at": now - timedelta(minutes=rnd.randint(0, 60 * 24 * 60)),
+            })
+    db.execute(insert(User), users)
+    db.execute(insert(Fish), fish)
+    assign_event_seq(db, events)
+    db.execute(insert(Event), events)
+    db.commit()
+    backfill_daily_stats(db)
+
+
+def snapshot(db) -> tuple[list, list]:
+    fish = db.execute(
+        select(FishState.fish_id, FishState.growth_level, FishState.visual_stage,
+               FishState.last_event_seq)
+        .order_by(FishState.fish_id)
+    ).all()
+    sea = db.execute(
+        select(SeaState.user_id, SeaState.sea_state_score, SeaState.sea_state_label)
+        .order_by(SeaState.user_id)
+    ).all()
+    return fish, sea
+
+
+def per_user(db, user_ids: list[str], reference_date: datetime) -> None:
+    for user_id in user_ids:
+        compute_fish_growth(db, user_id, reference_date)
+        compute_sea_state(db, user_id, reference_date)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--events-per-user", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    reference_date = datetime.now(timezone.utc)
+    with temp_session() as db_loop, temp_session() as db_batch:
+        seed(db_loop, args.users, args.events_per_user, args.seed, reference_date)
+        seed(db_batch, args.users, args.events_per_user, args.seed, reference_date)
+        user_ids = db_loop.execute(select(User.id).order_by(User.id)).scalars().all()
+
+        loop_s, _ = timed(per_user, db_loop, user_ids, reference_date)
+        batch_s, _ = timed(compute_state_batch, db_batch, user_ids, reference_date)
+
+        print(f"\n🌊 Ricalcolo di {len(user_ids)} utenti\n")
+        print(f"{'Modalità':<10} | {'Tempo (s)':>9} | {'Utenti/s':>9}")
+        print("-" * 36)
+        print(f"{'per utente':<10} | {loop_s:>9.2f} | {len(user_ids) / loop_s:>9.0f}")
+        print(f"{'batch':<10} | {batch_s:>9.2f} | {len(user_ids) / batch_s:>9.0f}")
+        print(f"\nSpeedup: {loop_s / batch_s:.1f}x")
+
+        if snapshot(db_loop) != snapshot(db_batch):
+            print("❌ I risultati batch non coincidono con quelli per utente")
+            return 1
+        print("✅ Risultati identici")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
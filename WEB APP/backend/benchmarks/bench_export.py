@@ -0,0 +1,126 @@
+"""
+Benchmark — export-data: documento in memoria contro streaming.
+
+Per ogni dimensione in --events popola un utente con quel numero di
+eventi (i più vecchi di --older-than-days spostati nei segmenti, come in
+produzione), poi confronta:
+- in memoria: export_user_data + serializzazione di JSONResponse, cioè il
+  corpo intero prima del primo byte;
+- streaming: stream_user_export (json e ndjson) consumato pezzo per pezzo,
+  come farebbe un client.
+
+Riporta tempo totale, tempo al primo byte e picco di memoria allocata
+(tracemalloc, che rallenta tutto allo stesso modo: i tempi valgono solo
+per il confronto), e verifica che il JSON in streaming sia lo stesso documento.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_export --events 10000,100000
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import insert
+
+from app.models.models import Fish, User, utcnow
+from app.services import archive
+from app.services.export import export_header, export_user_data, stream_user_export
+from app.services.growth import EVENT_WEIGHTS
+from app.services.ingest import event_row, insert_events
+from benchmarks.common import temp_sessionmaker
+
+DIMENSIONS = ["studio", "lavoro", "benessere"]
+USER_ID = "00000000-export-bench"
+
+
+def seed(db, n_events: int, days: int = 730) -> None:
+    rnd = random.Random(25)
+    now = utcnow()
+    db.execute(insert(User), [{"id": USER_ID, "email": "export@bench.example.com", "hashed_password": "x"}])
+    db.execute(insert(Fish), [{"id": f"{USER_ID}-{dim}", "user_id": USER_ID, "dimension": dim} for dim in DIMENSIONS])
+    rows = []
+    for _ in range(n_events):
+        dimension = rnd.choice(DIMENSIONS)
+        metadata = {"anxiety_level": rnd.randint(1, 5), "context": dimension, "fish_id": f"{USER_ID}-{dimension}"}
+        rows.append(event_row(USER_ID, rnd.choice(list(EVENT_WEIGHTS)), metadata, now - timedelta(seconds=rnd.randrange(days * 86400))))
+    insert_events(db, rows)
+    db.commit()
+
+
+def measure(fn) -> tuple[float, float, float]:
+    """(secondi totali, secondi al primo byte, picco MiB) di fn, un generatore di bytes."""
+    archive._decode_segment.cache_clear()  # ogni variante decodifica i segmenti da capo
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    for _ in fn():
+        if first is None:
+            first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return total, first, peak / (1024 * 1024)
+
+
+def run(n_events: int, older_than_days: int) -> tuple[dict, bool]:
+    with temp_sessionmaker() as session_factory, tempfile.TemporaryDirectory(prefix="mare_calmo_export_") as archive_dir:
+        archive.EVENT_ARCHIVE_DIR = archive_dir
+        with session_factory() as db:
+            seed(db, n_events)
+            archive.archive_events(db, utcnow() - timedelta(days=older_than_days))
+
+        def in_memory():
+            with session_factory() as db:
+                yield JSONResponse(export_user_data(db, USER_ID)).body
+
+        def streaming(fmt):
+            def body():
+                with session_factory() as db:
+                    header = export_header(db, USER_ID)
+                yield from stream_user_export(session_factory, USER_ID, header, fmt)
+            return body
+
+        results = {
+            "in memoria": measure(in_memory),
+            "stream json": measure(streaming("json")),
+            "stream ndjson": measure(streaming("ndjson")),
+        }
+
+        reference = json.loads(next(in_memory()))
+        streamed = json.loads(b"".join(streaming("json")()))
+        reference.pop("export_date")
+        streamed.pop("export_date")
+    return results, reference == streamed
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", default="10000,100000", help="dimensioni, separate da virgola")
+    parser.add_argument("--older-than-days", type=int, default=90)
+    args = parser.parse_args(argv)
+
+    identical = True
+    print(f"\n📦 Export di un utente, eventi oltre {args.older_than_days} giorni nei segmenti\n")
+    print(f"{'Eventi':>8} | {'Variante':<14} | {'Totale (ms)':>11} | {'1° byte (ms)':>12} | {'Picco (MiB)':>11}")
+    print("-" * 69)
+    for n_events in (int(n) for n in args.events.split(",")):
+        results, same = run(n_events, args.older_than_days)
+        identical &= same
+        for name, (total, first, peak) in results.items():
+            print(f"{n_events:>8} | {name:<14} | {total * 1000:>11.1f} | {first * 1000:>12.1f} | {peak:>11.1f}")
+
+    if not identical:
+        print("\n❌ Il JSON in streaming differisce dall'export in memoria")
+        return 1
+    print("\n✅ JSON in streaming identico all'export in memoria")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Benchmark — un commit per evento vs group commit.
+
+Più thread scrivono eventi come farebbe POST /events: prima con un commit
+(e un fsync) per evento, poi attraverso GroupCommitWriter. Verifica che il
+rollup giornaliero coincida con un backfill da zero e riporta gli eventi
+scritti al secondo.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_group_commit --events 2000 --threads 16
+"""
+import argparse
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import insert, select
+
+from app.models.models import Event, User, UserDailyStats, utcnow
+from app.services.daily_stats import backfill_daily_stats, record_event_stats
+from app.services.growth import EVENT_WEIGHTS
+from app.services.ingest import event_row
+from app.services.write_buffer import GroupCommitWriter
+from benchmarks.common import temp_sessionmaker, timed
+
+
+def make_rows(n_events: int, n_users: int) -> list[dict]:
+    rnd = random.Random(7)
+    event_types = list(EVENT_WEIGHTS)
+    return [
+        event_row(
+            f"{rnd.randrange(n_users):04d}-bench",
+            rnd.choice(event_types),
+            {"anxiety_level": rnd.randint(1, 5)},
+            utcnow(),
+        )
+        for _ in range(n_events)
+    ]
+
+
+def seed_users(session_factory, n_users: int) -> None:
+    with session_factory() as db:
+        db.execute(insert(User), [
+            {"id": f"{u:04d}-bench", "email": f"{u:04d}@example.com", "hashed_password": "x"}
+            for u in range(n_users)
+        ])
+        db.commit()
+
+
+def commit_per_event(session_factory, row: dict) -> None:
+    """Il percorso di POST /events senza buffer."""
+    with session_factory() as db:
+        db.add(Event(**row))
+        record_event_stats(db, row["user_id"], row["event_type"], row["anxiety_level"], row["created_at"])
+        db.commit()
+
+
+def run(rows: list[dict], threads: int, write) -> None:
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(write, rows))
+
+
+def rollup_matches_backfill(session_factory) -> bool:
+    with session_factory() as db:
+        snapshot = lambda: db.execute(select(UserDailyStats.__table__).order_by("user_id", "day")).all()
+        live = snapshot()
+        backfill_daily_stats(db)
+        return live == snapshot()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    rows = make_rows(args.events, args.users)
+    ok = True
+
+    with temp_sessionmaker() as session_factory:
+        seed_users(session_factory, args.users)
+        single_s, _ = timed(run, rows, args.threads, lambda row: commit_per_event(session_factory, row))
+        ok &= rollup_matches_backfill(session_factory)
+
+    with temp_sessionmaker() as session_factory:
+        seed_users(session_factory, args.users)
+        writer = GroupCommitWriter(session_factory=session_factory)
+        writer.start()
+        group_s, _ = timed(run, rows, args.threads, writer.write)
+        writer.stop()
+        metrics = writer.metrics()
+        ok &= rollup_matches_backfill(session_factory)
+
+    print(f"\n📝 {args.events} eventi, {args.threads} thread\n")
+    print(f"{'Modalità':<14} | {'Tempo (s)':>9} | {'Eventi/s':>9} | {'Commit':>7}")
+    print("-" * 50)
+    print(f"{'commit/evento':<14} | {single_s:>9.2f} | {args.events / single_s:>9.0f} | {args.events:>7}")
+    print(f"{'group commit':<14} | {group_s:>9.2f} | {args.events / group_s:>9.0f} | {metrics['batches']:>7}")
+    print(f"\nSpeedup: {single_s / group_s:.1f}x (gruppo medio: {metrics['avg_batch_size']} eventi)")
+
+    if not ok:
+        print("❌ Il rollup giornaliero non coincide con il backfill")
+        return 1
+    print("✅ Rollup coerente")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
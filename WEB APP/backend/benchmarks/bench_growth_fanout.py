@@ -0,0 +1,93 @@
+"""
+Benchmark di regressione — crescita pesci al crescere delle dimensioni.
+
+Stesso numero di eventi, numero di pesci crescente: con la scansione
+unica il costo di compute_fish_growth deve restare piatto, sia in tempo
+sia in statement SQL emessi.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_growth_fanout --events 20000
+"""
+import argparse
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert
+
+from app.models.models import Event, Fish, User, event_hot_columns, generate_uuid
+from app.services.growth import EVENT_WEIGHTS, compute_fish_growth
+from app.services.ingest import assign_event_seq
+from benchmarks.common import StatementCounter, temp_session, timed
+
+FISH_COUNTS = [3, 10, 30, 100]
+
+
+def seed_user(db, n_fish: int, n_events: int) -> str:
+    """Un utente con n_fish pesci e n_events eventi, metà senza fish_id."""
+    user = User(email=f"bench_{n_fish}@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+
+    fish_ids = [generate_uuid() for _ in range(n_fish)]
+    db.execute(insert(Fish), [
+        {"id": fid, "user_id": user.id, "dimension": f"dim_{i}"}
+        for i, fid in enumerate(fish_ids)
+    ])
+
+    start = datetime.now(timezone.utc) - timedelta(days=365)
+    event_types = list(EVENT_WEIGHTS)
+    rows = []
+    for i in range(n_events):
+        metadata = {"anxiety_level": random.randint(1, 5)}
+        if random.random() < 0.5:
+            metadata["fish_id"] = random.choice(fish_ids)
+        rows.append({
+            "id": generate_uuid(),
+            "user_id": user.id,
+            "event_type": random.choice(event_types),
+            "metadata_json": metadata,
+            **event_hot_columns(metadata),
+            "created_at": start + timedelta(minutes=i),
+        })
+    assign_event_seq(db, rows)
+    db.execute(insert(Event), rows)
+    db.commit()
+    return user.id
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--max-ratio", type=float, default=3.0,
+        help="rapporto massimo tempo(pesci max)/tempo(pesci min) prima di segnalare regressione",
+    )
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+
+    print(f"\n🐟 compute_fish_growth — {args.events} eventi, pesci variabili\n")
+    print(f"{'Pesci':>6} | {'Tempo (ms)':>10} | {'Statement SQL':>13}")
+    print("-" * 36)
+
+    timings = []
+    for n_fish in FISH_COUNTS:
+        with temp_session() as db:
+            user_id = seed_user(db, n_fish, args.events)
+            with StatementCounter(db.get_bind()) as counter:
+                elapsed, _ = timed(compute_fish_growth, db, user_id, full_rebuild=True)
+            timings.append(elapsed)
+            print(f"{n_fish:>6} | {elapsed * 1000:>10.1f} | {counter.count:>13}")
+
+    ratio = timings[-1] / timings[0]
+    print(f"\nRapporto {FISH_COUNTS[-1]}/{FISH_COUNTS[0]} pesci: {ratio:.2f}x")
+    if ratio > args.max_ratio:
+        print(f"❌ Regressione: il costo cresce con il numero di pesci (> {args.max_ratio}x)")
+        return 1
+    print("✅ Costo piatto rispetto al numero di pesci")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
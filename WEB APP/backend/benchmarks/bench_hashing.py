@@ -0,0 +1,155 @@
+"""
+Benchmark — raffica di login: hashing inline vs executor di processi limitato.
+
+Per ogni modalità avvia un processo separato (HASH_WORKERS=0 inline, oppure
+--workers processi con coda --max-pending) in una cartella temporanea. Il
+processo registra --users utenti, poi --logins client fanno login in
+continuo mentre --readers client chiamano GET /fish (endpoint economico),
+per --seconds secondi (httpx + ASGITransport, route sync nel threadpool).
+Riporta login riusciti/s, 503 con Retry-After e latenza p50/p99 di /fish:
+con l'executor i login in eccesso vengono respinti subito invece di
+occupare il threadpool, e /fish resta veloce.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_hashing --logins 64 --readers 8 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ["inline", "executor"]
+PASSWORD = "bench-password-123"
+
+
+# ──────────────────────────────────────────────
+# PROCESSO FIGLIO (una modalità)
+# ──────────────────────────────────────────────
+async def run_mode(mode: str, args) -> dict:
+    import httpx
+
+    from app.main import app
+
+    await app.router.startup()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        users = []
+        for u in range(args.users):
+            response = await client.post("/api/auth/register", json={"email": f"{u:04d}@hashing.example.com", "password": PASSWORD})
+            response.raise_for_status()
+            body = response.json()
+            users.append((body["email"], body["user_id"], body["access_token"]))
+
+        logins = {"ok": 0, "busy": 0, "other": 0}
+        fish_ms: list[float] = []
+        deadline = time.perf_counter() + args.seconds
+
+        async def login_loop(worker: int) -> None:
+            email = users[worker % len(users)][0]
+            while time.perf_counter() < deadline:
+                response = await client.post("/api/auth/login", json={"email": email, "password": PASSWORD})
+                if response.status_code == 200:
+                    logins["ok"] += 1
+                elif response.status_code == 503 and "retry-after" in response.headers:
+                    logins["busy"] += 1
+                    await asyncio.sleep(float(response.headers["retry-after"]) / 10)
+                else:
+                    logins["other"] += 1
+
+        async def reader_loop(worker: int) -> None:
+            _, user_id, token = users[worker % len(users)]
+            headers = {"Authorization": f"Bearer {token}"}
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await client.get(f"/api/user/{user_id}/fish", headers=headers)
+                response.raise_for_status()
+                fish_ms.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(login_loop(w) for w in range(args.logins)),
+            *(reader_loop(w) for w in range(args.readers)),
+        )
+        elapsed = time.perf_counter() - started
+
+    await app.router.shutdown()
+    fish_ms.sort()
+    return {
+        "mode": mode,
+        "logins_per_s": round(logins["ok"] / elapsed, 1),
+        "busy": logins["busy"],
+        "errors": logins["other"],
+        "fish_requests": len(fish_ms),
+        "fish_p50_ms": round(statistics.median(fish_ms), 2) if fish_ms else None,
+        "fish_p99_ms": round(fish_ms[min(len(fish_ms) - 1, int(len(fish_ms) * 0.99))], 2) if fish_ms else None,
+    }
+
+
+# ──────────────────────────────────────────────
+# PROCESSO PRINCIPALE
+# ──────────────────────────────────────────────
+def spawn(mode: str, args) -> dict:
+    env = {
+        **os.environ,
+        "HASH_WORKERS": "0" if mode == "inline" else str(args.workers),
+        "HASH_MAX_PENDING": str(args.max_pending),
+        "RECOMPUTE_WORKERS": "0",
+        "PRINCIPAL_CACHE_TTL_SECONDS": "0",
+        "SECRET_KEY": os.environ.get("SECRET_KEY") or secrets.token_urlsafe(48),
+        "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])),
+    }
+    argv = [
+        sys.executable, "-m", "benchmarks.bench_hashing", "--mode", mode,
+        "--users", str(args.users), "--logins", str(args.logins), "--readers", str(args.readers),
+        "--seconds", str(args.seconds),
+    ]
+    with tempfile.TemporaryDirectory(prefix="mare_calmo_bench_") as cwd:
+        out = subprocess.run(argv, cwd=cwd, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"Modalità {mode} fallita:\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--logins", type=int, default=64, help="client che fanno login in continuo")
+    parser.add_argument("--readers", type=int, default=8, help="client su GET /fish")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--max-pending", type=int, default=8)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)  # processo figlio
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        print(json.dumps(asyncio.run(run_mode(args.mode, args))))
+        return 0
+
+    results = [spawn(mode, args) for mode in MODES]
+
+    print(f"\n🔐 {args.logins} client di login + {args.readers} su /fish per {args.seconds:.0f}s "
+          f"(executor: {args.workers} processi, max {args.max_pending} in attesa)\n")
+    print(f"{'Modalità':<9} | {'Login/s':>7} | {'503':>5} | {'/fish req':>9} | {'/fish p50 (ms)':>14} | {'/fish p99 (ms)':>14}")
+    print("-" * 75)
+    for r in results:
+        print(
+            f"{r['mode']:<9} | {r['logins_per_s']:>7.1f} | {r['busy']:>5} | {r['fish_requests']:>9} | "
+            f"{r['fish_p50_ms']:>14.1f} | {r['fish_p99_ms']:>14.1f}"
+        )
+
+    if any(r["errors"] for r in results):
+        print("❌ Login falliti con errori diversi da 503")
+        return 1
+    print("✅ Nessun errore")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Benchmark — costo del logging per richiesta autenticata.
+
+Chiama get_current_user senza cache dei principal (verifica JWT + lettura
+utente, le righe di log di ogni richiesta protetta) su un database
+temporaneo, con il logger mare_calmo.auth configurato in modi diversi:
+- sincrono DEBUG: RotatingFileHandler nel thread della richiesta, testo
+  (la configurazione precedente);
+- coda DEBUG / campionato / INFO: QueueHandler → QueueListener, JSON, con
+  e senza campionamento dei DEBUG, e al livello di default.
+Riporta µs per richiesta, costo del logging rispetto a log disattivato e
+righe scritte; il tempo di svuotamento della coda è a parte. Con un solo
+core il listener compete con le richieste: la coda sposta il lavoro ma non
+lo elimina, e il guadagno viene da livello e campionamento.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_logging --users 200 --requests 20000
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import insert
+
+from app.auth import auth_dependencies
+from app.auth.auth_cache import PrincipalCache
+from app.auth.auth_logger import log_listener, setup_auth_logger, stop_listener
+from app.auth.auth_revocation import revocation_store
+from app.auth.auth_tokens import create_access_token
+from app.models.models import User
+from benchmarks.common import temp_sessionmaker
+
+AUTH_LOGGER = "mare_calmo.auth"
+
+
+def reset_logger() -> logging.Logger:
+    logger = logging.getLogger(AUTH_LOGGER)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    return logger
+
+
+def configure(mode: str, logs_dir: str):
+    """Configura il logger per la modalità; ritorna il listener (se c'è)."""
+    logger = reset_logger()
+    if mode == "disattivato":
+        logger.setLevel(logging.CRITICAL + 1)
+        return None
+    if mode == "sincrono DEBUG":
+        handler = logging.handlers.RotatingFileHandler(os.path.join(logs_dir, "auth.log"), maxBytes=10 * 1024 * 1024, backupCount=5)
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s", "%Y-%m-%d %H:%M:%S"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        return None
+    level, rates = {
+        "coda DEBUG": ("DEBUG", ""),
+        "coda DEBUG 1%": ("DEBUG", f"{AUTH_LOGGER}=0.01"),
+        "coda INFO": ("INFO", ""),
+    }[mode]
+    _, listener = setup_auth_logger(AUTH_LOGGER, level=level, sample_rates=rates, logs_dir=logs_dir)
+    return listener
+
+
+def run(session_factory, headers: list[str], n_requests: int) -> float:
+    """Secondi totali per n_requests chiamate a get_current_user."""
+    rnd = random.Random(19)
+    started = time.perf_counter()
+    for _ in range(n_requests):
+        auth_dependencies.get_current_user(authorization=rnd.choice(headers), db=session_factory())
+    return time.perf_counter() - started
+
+
+def count_lines(logs_dir: str) -> int:
+    return sum(
+        sum(1 for _ in open(entry.path, encoding="utf-8"))
+        for entry in os.scandir(logs_dir) if entry.name.startswith("auth.log")
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    modes = ["disattivato", "sincrono DEBUG", "coda DEBUG", "coda DEBUG 1%", "coda INFO"]
+    results = {}
+    original_cache = auth_dependencies.principal_cache
+    auth_dependencies.principal_cache = PrincipalCache(0, 0)
+    if log_listener is not None:
+        stop_listener(log_listener)
+    try:
+        with temp_sessionmaker() as session_factory:
+            with session_factory() as db:
+                users = [{"id": f"{u:08d}-log-bench", "email": f"{u:08d}@example.com", "hashed_password": "x"} for u in range(args.users)]
+                db.execute(insert(User), users)
+                db.commit()
+            revocation_store.session_factory = revocation_store.read_session_factory = session_factory
+            headers = [f"Bearer {create_access_token({'email': u['email']})}" for u in users]
+
+            for mode in modes:
+                with tempfile.TemporaryDirectory(prefix="mare_calmo_logs_") as logs_dir:
+                    listener = configure(mode, logs_dir)
+                    run(session_factory, headers, min(500, args.requests))  # riscaldamento
+                    elapsed = run(session_factory, headers, args.requests)
+                    started = time.perf_counter()
+                    if listener is not None:
+                        stop_listener(listener)
+                    drain = time.perf_counter() - started
+                    reset_logger()
+                    results[mode] = (elapsed, drain, count_lines(logs_dir))
+    finally:
+        auth_dependencies.principal_cache = original_cache
+
+    baseline = results["disattivato"][0] / args.requests * 1e6
+    print(f"\n📝 {args.requests} richieste autenticate (senza cache dei principal)\n")
+    print(f"{'Logging':<15} | {'µs/richiesta':>12} | {'costo log (µs)':>14} | {'svuotamento (ms)':>16} | {'righe':>7}")
+    print("-" * 78)
+    for mode, (elapsed, drain, lines) in results.items():
+        per_request = elapsed / args.requests * 1e6
+        print(f"{mode:<15} | {per_request:>12.1f} | {per_request - baseline:>14.1f} | {drain * 1000:>16.1f} | {lines:>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
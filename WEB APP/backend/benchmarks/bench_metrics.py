@@ -0,0 +1,127 @@
+"""
+Benchmark — costo delle metriche: richieste con METRICS_ENABLED=0 e =1.
+
+Per ogni modalità avvia un processo separato (METRICS_ENABLED è letto
+all'import) in una cartella temporanea: registra --users utenti, poi
+esegue --requests GET /fish e GET /world in sequenza (httpx +
+ASGITransport) e riporta µs per richiesta. Misura anche il costo di una
+singola observe() su un istogramma con etichette.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_metrics --users 20 --requests 4000
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ["off", "on"]
+
+
+# ──────────────────────────────────────────────
+# PROCESSO FIGLIO (una modalità)
+# ──────────────────────────────────────────────
+async def run_mode(mode: str, args) -> dict:
+    import httpx
+
+    from app.main import app
+    from app.services.metrics import HTTP_REQUEST_SECONDS
+
+    await app.router.startup()
+    transport = httpx.ASGITransport(app=app)
+    samples = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        users = []
+        for u in range(args.users):
+            response = await client.post("/api/auth/register", json={"email": f"{u:04d}@metrics.example.com", "password": "bench-password"})
+            response.raise_for_status()
+            body = response.json()
+            users.append((body["user_id"], {"Authorization": f"Bearer {body['access_token']}"}))
+
+        for n in range(args.requests):
+            user_id, headers = users[n % len(users)]
+            path = f"/api/user/{user_id}/fish" if n % 2 else f"/api/user/{user_id}/world"
+            started = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            samples.append((time.perf_counter() - started) * 1e6)
+            response.raise_for_status()
+        metrics_bytes = len((await client.get("/metrics")).content)
+    await app.router.shutdown()
+
+    # Costo di una observe() (il lavoro per richiesta è qualche observe e inc)
+    loops = 100_000
+    started = time.perf_counter()
+    for _ in range(loops):
+        HTTP_REQUEST_SECONDS.observe(0.003, "GET", "/bench", "200")
+    observe_ns = (time.perf_counter() - started) / loops * 1e9
+
+    samples.sort()
+    return {
+        "mode": mode,
+        "mean_us": round(statistics.fmean(samples), 1),
+        "p50_us": round(statistics.median(samples), 1),
+        "p99_us": round(samples[int(len(samples) * 0.99)], 1),
+        "observe_ns": round(observe_ns),
+        "metrics_bytes": metrics_bytes,
+    }
+
+
+# ──────────────────────────────────────────────
+# PROCESSO PRINCIPALE
+# ──────────────────────────────────────────────
+def spawn(mode: str, args) -> dict:
+    env = {
+        **os.environ,
+        "METRICS_ENABLED": "1" if mode == "on" else "0",
+        "RECOMPUTE_WORKERS": "0",
+        "HASH_WORKERS": "0",
+        "RATE_LIMIT_ENABLED": "0",
+        "SECRET_KEY": os.environ.get("SECRET_KEY") or secrets.token_urlsafe(48),
+        "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])),
+    }
+    argv = [
+        sys.executable, "-m", "benchmarks.bench_metrics", "--mode", mode,
+        "--users", str(args.users), "--requests", str(args.requests),
+    ]
+    with tempfile.TemporaryDirectory(prefix="mare_calmo_bench_") as cwd:
+        out = subprocess.run(argv, cwd=cwd, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"Modalità {mode} fallita:\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)  # processo figlio
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        print(json.dumps(asyncio.run(run_mode(args.mode, args))))
+        return 0
+
+    results = {mode: spawn(mode, args) for mode in MODES}
+
+    print(f"\n📈 {args.requests} richieste GET /fish e /world, {args.users} utenti\n")
+    print(f"{'Metriche':<9} | {'media (µs)':>10} | {'p50 (µs)':>9} | {'p99 (µs)':>9}")
+    print("-" * 47)
+    for mode, r in results.items():
+        print(f"{mode:<9} | {r['mean_us']:>10.1f} | {r['p50_us']:>9.1f} | {r['p99_us']:>9.1f}")
+    overhead = results["on"]["mean_us"] - results["off"]["mean_us"]
+    print(
+        f"\nCosto per richiesta: {overhead:+.1f} µs ({overhead / results['off']['mean_us']:+.1%}); "
+        f"observe(): {results['on']['observe_ns']} ns; /metrics: {results['on']['metrics_bytes']} byte"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
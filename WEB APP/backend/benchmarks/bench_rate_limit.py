@@ -0,0 +1,86 @@
+"""
+Benchmark — rate limiter: costo di una decisione e limite tra più processi.
+
+1. --decisions decisioni su --keys chiavi per ogni backend (memory, sqlite
+   su un file temporaneo): latenza p50/p99 in µs.
+2. --workers processi (come i worker uvicorn) provano --attempts volte
+   ciascuno sulla stessa chiave con una policy da --capacity gettoni in
+   un'ora: con sqlite passano --capacity richieste in totale, con memory
+   ogni processo ha il suo bucket e ne passano --workers volte tanto.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_rate_limit --decisions 20000 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from app.services.rate_limit import MemoryBackend, Policy, RateLimiter, SQLiteBackend
+
+
+def make_backend(name: str, path: str):
+    return MemoryBackend() if name == "memory" else SQLiteBackend(path)
+
+
+def decision_latencies(backend, n_decisions: int, n_keys: int) -> list[float]:
+    limiter = RateLimiter(backend, {"bench": Policy(100, 60)})
+    rnd = random.Random(20)
+    samples = []
+    for _ in range(n_decisions):
+        key = str(rnd.randrange(n_keys))
+        started = time.perf_counter()
+        limiter.check("bench", key)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+def worker(args: tuple) -> int:
+    """Processo figlio: richieste consentite su una chiave condivisa."""
+    backend_name, path, capacity, attempts = args
+    limiter = RateLimiter(make_backend(backend_name, path), {"bench": Policy(capacity, 3600)})
+    return sum(limiter.check("bench", "ip-condiviso").allowed for _ in range(attempts))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--decisions", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--attempts", type=int, default=500)
+    parser.add_argument("--capacity", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    latencies, allowed = {}, {}
+    with tempfile.TemporaryDirectory(prefix="mare_calmo_rate_") as tmp:
+        for name in ("memory", "sqlite"):
+            path = os.path.join(tmp, f"{name}.db")
+            latencies[name] = sorted(decision_latencies(make_backend(name, path), args.decisions, args.keys))
+
+            shared = os.path.join(tmp, f"{name}-shared.db")
+            with multiprocessing.get_context("spawn").Pool(args.workers) as pool:
+                allowed[name] = sum(pool.map(worker, [(name, shared, args.capacity, args.attempts)] * args.workers))
+
+    print(f"\n🚦 {args.decisions} decisioni su {args.keys} chiavi; {args.workers} processi × {args.attempts} tentativi, "
+          f"policy {args.capacity}/ora\n")
+    print(f"{'Backend':<8} | {'p50 (µs)':>9} | {'p99 (µs)':>9} | {'Consentite (tutti i processi)':>29}")
+    print("-" * 65)
+    for name, samples in latencies.items():
+        print(
+            f"{name:<8} | {statistics.median(samples):>9.1f} | "
+            f"{samples[min(len(samples) - 1, int(len(samples) * 0.99))]:>9.1f} | {allowed[name]:>29}"
+        )
+
+    if allowed["sqlite"] != args.capacity:
+        print(f"❌ sqlite: consentite {allowed['sqlite']} invece di {args.capacity}")
+        return 1
+    print(f"✅ sqlite rispetta il limite tra processi (memory: {allowed['memory']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
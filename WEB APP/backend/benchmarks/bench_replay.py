@@ -0,0 +1,89 @@
+"""
+Benchmark — stato a una data: replay dal primo evento vs da snapshot.
+
+Popola un utente con un anno di eventi, ricostruisce lo stato a metà
+dell'ultimo giorno senza snapshot e poi partendo dagli snapshot
+giornalieri, verifica che i due risultati coincidano e riporta i tempi.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_replay --days 365 --events-per-day 8
+"""
+import argparse
+import random
+import sys
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import insert
+
+from app.models.models import Fish, User
+from app.services.growth import EVENT_WEIGHTS
+from app.services.ingest import event_row, insert_events
+from app.services.replay import end_of_day, replay_state, take_snapshots
+from benchmarks.common import StatementCounter, temp_session, timed
+
+DIMENSIONS = ["studio", "lavoro", "benessere"]
+
+
+def seed(db, days: int, events_per_day: int, start: date) -> str:
+    rnd = random.Random(11)
+    user_id = "replay-bench"
+    db.execute(insert(User), [{"id": user_id, "email": "replay@example.com", "hashed_password": "x"}])
+    fish_ids = [f"{user_id}-{dim}" for dim in DIMENSIONS]
+    db.execute(insert(Fish), [
+        {"id": fid, "user_id": user_id, "dimension": dim} for fid, dim in zip(fish_ids, DIMENSIONS)
+    ])
+    rows = []
+    for d in range(days):
+        midnight = datetime.combine(start + timedelta(days=d), time.min, tzinfo=timezone.utc)
+        for _ in range(rnd.randint(0, 2 * events_per_day)):
+            metadata = {"anxiety_level": rnd.randint(1, 5)}
+            if rnd.random() < 0.7:
+                metadata["fish_id"] = rnd.choice(fish_ids)
+            rows.append(event_row(
+                user_id, rnd.choice(list(EVENT_WEIGHTS)), metadata,
+                midnight + timedelta(seconds=rnd.randrange(86400)),
+            ))
+    insert_events(db, rows)
+    db.commit()
+    return user_id
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--events-per-day", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    start = date(2025, 1, 1)
+    last_day = start + timedelta(days=args.days - 1)
+    reference_date = end_of_day(last_day) - timedelta(hours=12)
+
+    with temp_session() as db:
+        user_id = seed(db, args.days, args.events_per_day, start)
+        engine = db.get_bind()
+
+        with StatementCounter(engine) as full_sql:
+            full_s, full = timed(replay_state, db, user_id, reference_date)
+
+        snap_s, saved = timed(take_snapshots, db, user_id, last_day - timedelta(days=1))
+
+        with StatementCounter(engine) as snap_sql:
+            from_snap_s, from_snap = timed(replay_state, db, user_id, reference_date)
+
+    print(f"\n🕰️  Stato a {reference_date:%Y-%m-%d %H:%M} dopo {args.days} giorni\n")
+    print(f"{'Replay':<16} | {'Tempo (ms)':>10} | {'SQL':>4}")
+    print("-" * 38)
+    print(f"{'dal primo evento':<16} | {full_s * 1000:>10.1f} | {full_sql.count:>4}")
+    print(f"{'da snapshot':<16} | {from_snap_s * 1000:>10.1f} | {snap_sql.count:>4}")
+    print(f"\nSnapshot iniziali: {saved} giorni in {snap_s:.2f}s")
+    print(f"Speedup: {full_s / from_snap_s:.0f}x")
+
+    if full != from_snap:
+        print("❌ Lo stato ricostruito da snapshot non coincide")
+        return 1
+    print("✅ Stati identici")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
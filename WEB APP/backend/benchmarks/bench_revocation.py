@@ -0,0 +1,94 @@
+"""
+Benchmark — controllo di revoca per richiesta: Bloom filter vs tabella.
+
+Popola revoked_tokens con --revoked jti su un database temporaneo, poi
+controlla --checks jti di token validi (mai revocati): con la sola tabella
+ogni controllo è una lettura, con RevocationStore una lookup in memoria e
+la tabella solo sui falsi positivi. Verifica che tutti i jti revocati
+vengano riconosciuti e riporta µs per controllo, letture della tabella e
+tasso di falsi positivi misurato.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_revocation --revoked 50000 --checks 20000
+"""
+import argparse
+import secrets
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+from sqlalchemy import insert
+
+from app.auth.auth_revocation import RevocationStore
+from app.models.models import RevokedToken, utcnow
+from benchmarks.common import temp_sessionmaker
+
+
+def table_lookup(session_factory, jti: str) -> bool:
+    with session_factory() as db:
+        return db.get(RevokedToken, jti) is not None
+
+
+def timed_checks(check, jtis: list[str]) -> list[float]:
+    samples = []
+    for jti in jtis:
+        started = time.perf_counter()
+        check(jti)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--revoked", type=int, default=50_000)
+    parser.add_argument("--checks", type=int, default=20_000)
+    parser.add_argument("--capacity", type=int, default=100_000)
+    parser.add_argument("--error-rate", type=float, default=0.001)
+    args = parser.parse_args(argv)
+
+    revoked = [secrets.token_urlsafe(16) for _ in range(args.revoked)]
+    live = [secrets.token_urlsafe(16) for _ in range(args.checks)]
+    expires_at = utcnow() + timedelta(days=1)
+
+    with temp_sessionmaker() as session_factory:
+        with session_factory() as db:
+            db.execute(insert(RevokedToken), [{"jti": jti, "expires_at": expires_at} for jti in revoked])
+            db.commit()
+
+        store = RevocationStore(
+            capacity=args.capacity, error_rate=args.error_rate, sync_seconds=0,
+            session_factory=session_factory, read_session_factory=session_factory,
+        )
+        started = time.perf_counter()
+        store.start()
+        load_ms = (time.perf_counter() - started) * 1000
+
+        table = timed_checks(lambda jti: table_lookup(session_factory, jti), live)
+        bloom = timed_checks(store.is_revoked, live)
+        metrics = store.metrics()
+        missed = sum(not store.is_revoked(jti) for jti in revoked[: args.checks])
+
+    print(f"\n🚫 {args.revoked} token revocati, {args.checks} controlli su token validi\n")
+    print(f"{'Controllo':<12} | {'p50 (µs)':>9} | {'p99 (µs)':>9} | {'Letture tabella':>15}")
+    print("-" * 55)
+    for name, samples, reads in (("tabella", table, len(live)), ("bloom", bloom, metrics["table_checks"])):
+        samples.sort()
+        print(
+            f"{name:<12} | {statistics.median(samples):>9.1f} | "
+            f"{samples[min(len(samples) - 1, int(len(samples) * 0.99))]:>9.1f} | {reads:>15}"
+        )
+    print(
+        f"\nFiltro: {metrics['filter_bytes'] / 1024:.0f} KiB, caricato in {load_ms:.0f} ms; "
+        f"falsi positivi {metrics['false_positives'] / len(live):.4%} (atteso {args.error_rate:.2%})"
+    )
+
+    if missed:
+        print(f"❌ {missed} token revocati non riconosciuti")
+        return 1
+    print("✅ Tutti i token revocati riconosciuti")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Benchmark — funzioni calde di crescita, stato del mare ed export.
+
+Per ogni taglia (eventi di un singolo utente, default 1k, 10k, 100k, 1M)
+popola un database temporaneo e misura compute_fish_growth,
+compute_sea_state, compute_consistency_index, compute_emotional_stability,
+export_user_data e calculate_event_stats: tempo (minimo su --repeat
+esecuzioni, ognuna con una sessione nuova), statement SQL emessi e picco
+di memoria Python (tracemalloc, in un'esecuzione separata per non falsare
+i tempi).
+
+I risultati vanno in un file JSON con commit git e ambiente; con
+--compare si confrontano con quelli di un'esecuzione precedente.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_services --output before.json
+    python -m benchmarks.bench_services --compare before.json --output after.json
+    python -m benchmarks.bench_services --sizes 1000,10000 --repeat 5
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, select
+
+from app.models.models import Event, Fish, FishState, SeaState, User
+from app.services.export import calculate_event_stats, export_user_data
+from app.services.growth import EVENT_WEIGHTS, compute_fish_growth
+from app.services.ingest import event_row, insert_events
+from app.services.sea_state import compute_consistency_index, compute_emotional_stability, compute_sea_state
+from benchmarks.common import StatementCounter, temp_sessionmaker, timed
+
+DEFAULT_SIZES = "1000,10000,100000,1000000"
+DIMENSIONS = ["studio", "lavoro", "benessere"]
+SEED_CHUNK = 50_000  # eventi per INSERT durante il seed (memoria limitata a 1M)
+HORIZON_DAYS = 365
+
+
+def seed(session_factory, n_events: int, now: datetime) -> str:
+    """Un utente con 3 pesci e n_events eventi nell'ultimo anno (deterministico)."""
+    rnd = random.Random(n_events)
+    user_id = "services-bench"
+    fish_ids = [f"{user_id}-{dim}" for dim in DIMENSIONS]
+    event_types = list(EVENT_WEIGHTS)
+    start = now - timedelta(days=HORIZON_DAYS)
+    step = timedelta(days=HORIZON_DAYS) / n_events
+
+    with session_factory() as db:
+        db.execute(insert(User), [{"id": user_id, "email": "services@example.com", "hashed_password": "x"}])
+        db.execute(insert(Fish), [
+            {"id": fid, "user_id": user_id, "dimension": dim} for fid, dim in zip(fish_ids, DIMENSIONS)
+        ])
+        db.execute(insert(FishState), [{"fish_id": fid} for fid in fish_ids])
+        db.execute(insert(SeaState), [{"user_id": user_id, "visual_params": {}}])
+
+        for offset in range(0, n_events, SEED_CHUNK):
+            rows = []
+            for i in range(offset, min(offset + SEED_CHUNK, n_events)):
+                dimension = rnd.choice(DIMENSIONS)
+                metadata = {"anxiety_level": rnd.randint(1, 5), "context": dimension}
+                if rnd.random() < 0.7:
+                    metadata["fish_id"] = f"{user_id}-{dimension}"
+                rows.append(event_row(user_id, rnd.choice(event_types), metadata, start + step * i))
+            insert_events(db, rows)
+        db.commit()
+    return user_id
+
+
+def cases(user_id: str) -> dict:
+    """Funzioni misurate: nome → fn(db)."""
+    def event_stats(db):
+        events = db.execute(select(Event).where(Event.user_id == user_id)).scalars().all()
+        return lambda: calculate_event_stats(events)
+
+    return {
+        "compute_fish_growth": lambda db: lambda: compute_fish_growth(db, user_id, full_rebuild=True),
+        "compute_sea_state": lambda db: lambda: compute_sea_state(db, user_id),
+        "compute_consistency_index": lambda db: lambda: compute_consistency_index(db, user_id),
+        "compute_emotional_stability": lambda db: lambda: compute_emotional_stability(db, user_id),
+        "export_user_data": lambda db: lambda: export_user_data(db, user_id),
+        # Gli eventi sono caricati prima della misura: conta solo l'aggregazione
+        "calculate_event_stats": event_stats,
+    }
+
+
+def measure(session_factory, prepare, repeat: int) -> dict:
+    """Tempo minimo, statement SQL e picco di memoria Python di una funzione."""
+    engine = session_factory.kw["bind"]
+    best = float("inf")
+    statements = 0
+    for _ in range(repeat):
+        with session_factory() as db:
+            fn = prepare(db)
+            with StatementCounter(engine) as counter:
+                elapsed, _ = timed(fn)
+            best = min(best, elapsed)
+            statements = counter.count
+
+    with session_factory() as db:
+        fn = prepare(db)
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {"time_ms": round(best * 1000, 3), "statements": statements, "peak_kib": round(peak / 1024, 1)}
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list[dict], baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    before = {(r["function"], r["events"]): r for r in baseline["results"]}
+
+    print(f"\n📈 Confronto con {baseline_path} (commit {baseline.get('commit') or '?'})\n")
+    print(f"{'Funzione':<28} | {'Eventi':>8} | {'Prima (ms)':>10} | {'Dopo (ms)':>10} | {'Δ tempo':>8} | {'Δ SQL':>6}")
+    print("-" * 86)
+    for r in results:
+        old = before.get((r["function"], r["events"]))
+        if old is None:
+            continue
+        ratio = r["time_ms"] / old["time_ms"] if old["time_ms"] else float("inf")
+        print(
+            f"{r['function']:<28} | {r['events']:>8} | {old['time_ms']:>10.1f} | {r['time_ms']:>10.1f} | "
+            f"{ratio:>7.2f}x | {r['statements'] - old['statements']:>+6}"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="numeri di eventi separati da virgola")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="file JSON (default: bench_services-<commit>.json)")
+    parser.add_argument("--compare", default=None, help="JSON di un'esecuzione precedente")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    commit = git_commit()
+    now = datetime.now(timezone.utc)
+    results = []
+
+    print(f"\n⏱️  Servizi — taglie {', '.join(map(str, sizes))}, minimo su {args.repeat} esecuzioni\n")
+    print(f"{'Funzione':<28} | {'Eventi':>8} | {'Tempo (ms)':>10} | {'SQL':>4} | {'Picco (KiB)':>11}")
+    print("-" * 74)
+
+    for n_events in sizes:
+        with temp_sessionmaker() as session_factory:
+            seed_s, user_id = timed(seed, session_factory, n_events, now)
+            for name, prepare in cases(user_id).items():
+                result = {"function": name, "events": n_events, **measure(session_factory, prepare, args.repeat)}
+                results.append(result)
+                print(
+                    f"{name:<28} | {n_events:>8} | {result['time_ms']:>10.1f} | "
+                    f"{result['statements']:>4} | {result['peak_kib']:>11.1f}"
+                )
+        print(f"{'(seed)':<28} | {n_events:>8} | {seed_s * 1000:>10.1f} |")
+
+    output = args.output or f"bench_services-{commit or 'nogit'}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "created_at": now.isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "results": results,
+        }, f, indent=2)
+    print(f"\n💾 Risultati salvati in {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Benchmark — statement SQL per endpoint, contro un budget fisso.
+
+Su un database temporaneo registra un utente, poi chiama gli endpoint
+principali dentro sql_budget (httpx + ASGITransport, principal già in
+cache): stampa statement, tempo DB e sospetti N+1 per endpoint ed esce
+con 1 se un endpoint supera il suo budget. Gli endpoint con N elementi
+(batch, export) sono misurati a due dimensioni: il conteggio non deve
+crescere con N.
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_sql_profile --events 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+# Budget per endpoint (richiesta autenticata, principal in cache)
+BUDGETS = {
+    "GET /api/auth/me": 1,
+    "POST /api/events": 4,
+    "POST /api/events/batch": 7,
+    "GET /api/user/{id}/fish": 1,
+    "GET /api/user/{id}/sea-state": 1,
+    "GET /api/user/{id}/world": 2,
+    "POST /api/user/{id}/compute-state": 13,
+    "GET /api/user/{id}/export-data": 4,
+}
+
+
+def batch(user_id: str, n: int) -> list[dict]:
+    start = datetime.now(timezone.utc) - timedelta(days=30)
+    return [
+        {
+            "user_id": user_id,
+            "event_type": "check_in",
+            "metadata": {"anxiety_level": 1 + i % 5},
+            "created_at": (start + timedelta(minutes=7 * i)).isoformat(),
+        }
+        for i in range(n)
+    ]
+
+
+async def measure(events: int) -> list[tuple[str, int, object]]:
+    import httpx
+
+    from app.main import app
+    from app.services.sql_profiler import SQLBudgetExceeded, sql_budget
+
+    await app.router.startup()
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/api/auth/register", json={"email": "sql@profile.example.com", "password": "bench-password"})
+        response.raise_for_status()
+        body = response.json()
+        user_id, headers = body["user_id"], {"Authorization": f"Bearer {body['access_token']}"}
+        await client.get("/api/auth/me", headers=headers)  # principal in cache
+
+        calls = [
+            ("GET /api/auth/me", 1, lambda: client.get("/api/auth/me", headers=headers)),
+            ("POST /api/events", 1, lambda: client.post("/api/events", headers=headers, json={"user_id": user_id, "event_type": "check_in", "metadata": {"anxiety_level": 3}})),
+        ]
+        for n in (max(1, events // 10), events):
+            calls += [
+                ("POST /api/events/batch", n, lambda n=n: client.post("/api/events/batch", headers=headers, json=batch(user_id, n))),
+                ("POST /api/user/{id}/compute-state", n, lambda: client.post(f"/api/user/{user_id}/compute-state", headers=headers)),
+                ("GET /api/user/{id}/export-data", n, lambda: client.get(f"/api/user/{user_id}/export-data", headers=headers)),
+            ]
+        calls += [
+            ("GET /api/user/{id}/fish", 1, lambda: client.get(f"/api/user/{user_id}/fish", headers=headers)),
+            ("GET /api/user/{id}/sea-state", 1, lambda: client.get(f"/api/user/{user_id}/sea-state", headers=headers)),
+            ("GET /api/user/{id}/world", 1, lambda: client.get(f"/api/user/{user_id}/world", headers=headers)),
+        ]
+
+        for name, n, call in calls:
+            error = None
+            try:
+                with sql_budget(BUDGETS[name]) as profile:
+                    response = await call()
+            except SQLBudgetExceeded as e:
+                error = e
+            response.raise_for_status()
+            results.append((name, n, profile, error))
+    await app.router.shutdown()
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=200, help="eventi nel batch grande (il piccolo è un decimo)")
+    args = parser.parse_args(argv)
+
+    # Database e stato del rate limit temporanei (percorsi relativi alla cartella corrente)
+    for name, value in {"RECOMPUTE_WORKERS": "0", "HASH_WORKERS": "0", "RATE_LIMIT_ENABLED": "0"}.items():
+        os.environ.setdefault(name, value)
+    with tempfile.TemporaryDirectory(prefix="mare_calmo_sql_") as cwd:
+        previous = os.getcwd()
+        os.chdir(cwd)
+        try:
+            results = asyncio.run(measure(args.events))
+        finally:
+            os.chdir(previous)
+
+    print(f"\n🔎 Statement SQL per endpoint (N = elementi nel batch / eventi dell'utente)\n")
+    print(f"{'Endpoint':<36} | {'N':>5} | {'statement':>9} | {'budget':>6} | {'DB (ms)':>8} | {'N+1':>3}")
+    print("-" * 83)
+    failures = []
+    for name, n, profile, error in results:
+        summary = profile.summary()
+        mark = "❌" if error else ""
+        print(
+            f"{name:<36} | {n:>5} | {summary['statements']:>9} | {BUDGETS[name]:>6} | "
+            f"{summary['db_ms']:>8.2f} | {summary['n_plus_one']:>3} {mark}"
+        )
+        if error:
+            failures.append(f"{name} (N={n}): {error}")
+
+    if failures:
+        print("\n" + "\n\n".join(failures))
+        return 1
+    print("\n✅ Tutti gli endpoint nel budget, nessun sospetto N+1")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Benchmark — carico misto letture/scritture: profilo SQLite default vs production.
+
+Per ogni profilo avvia un processo separato (SQLITE_PROFILE letto
+all'import di app.db.database) in una cartella temporanea, così
+mare_calmo.db è un database nuovo. Il processo popola gli utenti, poi
+--threads thread eseguono --ops operazioni: con probabilità --writes
+(default 0.2) una scrittura come POST /events (Event + rollup giornaliero
++ commit su SessionLocal), altrimenti una lettura come GET /world (utente
+con pesci, stati e mare su ReadSessionLocal). Riporta operazioni/s, p99 di
+letture e scritture ed errori (es. "database is locked").
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_sqlite --users 200 --threads 12 --ops 6000
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROFILES = ["default", "production"]
+
+
+# ──────────────────────────────────────────────
+# PROCESSO FIGLIO (un profilo)
+# ──────────────────────────────────────────────
+def seed(n_users: int, events_per_user: int) -> list[str]:
+    """Utenti con pesci, stato e storico eventi. Ritorna gli user_id."""
+    from datetime import timedelta
+
+    from sqlalchemy import insert
+
+    from app.db.database import SessionLocal
+    from app.models.models import Fish, FishState, SeaState, User, utcnow
+    from app.services.ingest import event_row, insert_events
+
+    rnd = random.Random(5)
+    now = utcnow()
+    users, fish, events = [], [], []
+    for u in range(n_users):
+        user_id = f"{u:08d}-sqlite-bench"
+        users.append({"id": user_id, "email": f"{user_id}@example.com", "hashed_password": "x"})
+        fish += [{"id": f"{user_id}-{dim}", "user_id": user_id, "dimension": dim} for dim in ("studio", "lavoro", "benessere")]
+        events += [
+            event_row(user_id, "check_in", {"anxiety_level": rnd.randint(1, 5)}, now - timedelta(minutes=rnd.randrange(43200)))
+            for _ in range(events_per_user)
+        ]
+    with SessionLocal() as db:
+        db.execute(insert(User), users)
+        db.execute(insert(Fish), fish)
+        db.execute(insert(FishState), [{"fish_id": f["id"]} for f in fish])
+        db.execute(insert(SeaState), [{"user_id": u["id"], "visual_params": {}} for u in users])
+        insert_events(db, events)
+        db.commit()
+    return [u["id"] for u in users]
+
+
+def write_op(user_id: str, rnd: random.Random) -> None:
+    from app.db.database import SessionLocal
+    from app.models.models import Event, event_hot_columns, utcnow
+    from app.services.daily_stats import record_event_stats
+
+    metadata = {"anxiety_level": rnd.randint(1, 5)}
+    created_at = utcnow()
+    with SessionLocal() as db:
+        db.add(Event(
+            user_id=user_id, event_type="check_in", metadata_json=metadata,
+            created_at=created_at, **event_hot_columns(metadata),
+        ))
+        record_event_stats(db, user_id, "check_in", metadata["anxiety_level"], created_at)
+        db.commit()
+
+
+def read_op(user_id: str) -> None:
+    from sqlalchemy import select
+    from sqlalchemy.orm import joinedload, selectinload
+
+    from app.db.database import ReadSessionLocal
+    from app.models.models import Fish, User
+
+    with ReadSessionLocal() as db:
+        db.execute(
+            select(User)
+            .where(User.id == user_id)
+            .options(selectinload(User.fish).joinedload(Fish.state), joinedload(User.sea_state))
+        ).scalar_one()
+
+
+def run_profile(profile: str, args) -> dict:
+    import app.models.models  # noqa: F401 — registra le tabelle per init_db
+    from app.db.database import SQLITE_PRODUCTION, init_db
+
+    if (profile == "production") != SQLITE_PRODUCTION:
+        raise SystemExit(f"Profilo {profile} non attivo nel processo figlio")
+
+    init_db()
+    users = seed(args.users, args.events_per_user)
+
+    reads: list[float] = []
+    writes: list[float] = []
+    errors = 0
+    remaining = args.ops
+    lock = threading.Lock()
+
+    def worker(n: int) -> None:
+        nonlocal errors, remaining
+        rnd = random.Random(n)
+        while True:
+            with lock:
+                if remaining <= 0:
+                    return
+                remaining -= 1
+            user_id = rnd.choice(users)
+            write = rnd.random() < args.writes
+            started = time.perf_counter()
+            try:
+                write_op(user_id, rnd) if write else read_op(user_id)
+            except Exception:
+                with lock:
+                    errors += 1
+                continue
+            (writes if write else reads).append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    def p99(samples: list[float]) -> float:
+        ms = sorted(t * 1000 for t in samples)
+        return round(ms[min(len(ms) - 1, int(len(ms) * 0.99))], 2) if ms else 0.0
+
+    return {
+        "profile": profile,
+        "ops": len(reads) + len(writes),
+        "errors": errors,
+        "ops_per_s": round((len(reads) + len(writes)) / elapsed, 1),
+        "read_p99_ms": p99(reads),
+        "write_p99_ms": p99(writes),
+    }
+
+
+# ──────────────────────────────────────────────
+# PROCESSO PRINCIPALE
+# ──────────────────────────────────────────────
+def spawn(profile: str, args) -> dict:
+    env = {
+        **os.environ,
+        "SQLITE_PROFILE": profile,
+        "SECRET_KEY": os.environ.get("SECRET_KEY") or "x" * 48,
+        "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])),
+    }
+    argv = [
+        sys.executable, "-m", "benchmarks.bench_sqlite", "--profile", profile,
+        "--users", str(args.users), "--events-per-user", str(args.events_per_user),
+        "--threads", str(args.threads), "--ops", str(args.ops), "--writes", str(args.writes),
+    ]
+    with tempfile.TemporaryDirectory(prefix="mare_calmo_bench_") as cwd:
+        out = subprocess.run(argv, cwd=cwd, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"Profilo {profile} fallito:\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--events-per-user", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=12)
+    parser.add_argument("--ops", type=int, default=6000)
+    parser.add_argument("--writes", type=float, default=0.2, help="frazione di scritture")
+    parser.add_argument("--profile", choices=PROFILES, help=argparse.SUPPRESS)  # processo figlio
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        print(json.dumps(run_profile(args.profile, args)))
+        return 0
+
+    results = [spawn(profile, args) for profile in PROFILES]
+
+    print(f"\n🗄️  {args.ops} operazioni ({args.writes:.0%} scritture), {args.threads} thread, {args.users} utenti\n")
+    print(f"{'Profilo':<10} | {'Op/s':>7} | {'p99 letture (ms)':>16} | {'p99 scritture (ms)':>18} | {'Errori':>6}")
+    print("-" * 70)
+    for r in results:
+        print(
+            f"{r['profile']:<10} | {r['ops_per_s']:>7.0f} | {r['read_p99_ms']:>16.1f} | "
+            f"{r['write_p99_ms']:>18.1f} | {r['errors']:>6}"
+        )
+    default, production = results
+    if default["ops_per_s"]:
+        print(f"\nSpeedup production: {production['ops_per_s'] / default['ops_per_s']:.1f}x")
+
+    if any(r["errors"] for r in results):
+        print("❌ Alcune operazioni sono fallite")
+        return 1
+    print("✅ Nessun errore")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
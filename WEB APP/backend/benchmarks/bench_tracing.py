@@ -0,0 +1,177 @@
+"""
+Benchmark — tracing: costo per richiesta e dove va il tempo di compute-state.
+
+Per ogni modalità (TRACE_EXPORTER=none, campionamento 10%, 100%) avvia un
+processo separato (la configurazione è letta all'import) in una cartella
+temporanea: registra un utente con --events eventi, poi chiama --requests
+volte compute-state ed export-data (httpx + ASGITransport) e riporta µs
+per richiesta. Con il 100% legge le tracce esportate e divide la durata di
+ogni richiesta tra SQL, funzioni di servizio (al netto del loro SQL) e il
+resto (route, serializzazione JSON, middleware).
+
+Run (dalla cartella backend):
+    python -m benchmarks.bench_tracing --events 500 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = {
+    "off": {"TRACE_EXPORTER": "none"},
+    "10%": {"TRACE_EXPORTER": "file", "TRACE_SAMPLE_RATE": "0.1"},
+    "100%": {"TRACE_EXPORTER": "file", "TRACE_SAMPLE_RATE": "1"},
+}
+ROUTES = ["POST /api/user/{user_id}/compute-state", "GET /api/user/{user_id}/export-data"]
+
+
+# ──────────────────────────────────────────────
+# PROCESSO FIGLIO (una modalità)
+# ──────────────────────────────────────────────
+async def run_mode(args) -> dict:
+    import httpx
+
+    from app.main import app
+    from app.services.tracing import span_listener, stop_listener
+
+    await app.router.startup()
+    samples = defaultdict(list)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/api/auth/register", json={"email": "trace@bench.example.com", "password": "bench-password"})
+        response.raise_for_status()
+        body = response.json()
+        user_id, headers = body["user_id"], {"Authorization": f"Bearer {body['access_token']}"}
+        start = datetime.now(timezone.utc) - timedelta(days=60)
+        items = [
+            {"user_id": user_id, "event_type": ("check_in", "micro_action", "reflection")[i % 3],
+             "metadata": {"anxiety_level": 1 + i % 5}, "created_at": (start + timedelta(hours=2 * i)).isoformat()}
+            for i in range(args.events)
+        ]
+        for offset in range(0, len(items), 100):
+            (await client.post("/api/events/batch", headers=headers, json=items[offset:offset + 100])).raise_for_status()
+
+        calls = {
+            ROUTES[0]: lambda: client.post(f"/api/user/{user_id}/compute-state", headers=headers),
+            ROUTES[1]: lambda: client.get(f"/api/user/{user_id}/export-data", headers=headers),
+        }
+        for _ in range(args.requests):
+            for route, call in calls.items():
+                started = time.perf_counter()
+                response = await call()
+                samples[route].append((time.perf_counter() - started) * 1e6)
+                response.raise_for_status()
+    await app.router.shutdown()
+    if span_listener is not None:
+        stop_listener(span_listener)  # tutte le righe su file prima di leggerle
+
+    return {
+        "mean_us": {route: round(statistics.fmean(values), 1) for route, values in samples.items()},
+        "breakdown": breakdown(os.environ.get("TRACE_FILE", "")),
+    }
+
+
+def breakdown(path: str) -> dict:
+    """Per route: ms medi di richiesta, SQL, servizi (al netto del SQL) e resto."""
+    if not os.path.exists(path):
+        return {}
+    spans = [json.loads(line) for line in open(path, encoding="utf-8")]
+    by_id = {s["spanId"]: s for s in spans}
+    duration = {s["spanId"]: (s["endTimeUnixNano"] - s["startTimeUnixNano"]) / 1e6 for s in spans}
+
+    def root_of(span):
+        while span["parentSpanId"] in by_id:
+            span = by_id[span["parentSpanId"]]
+        return span
+
+    totals = defaultdict(lambda: defaultdict(float))
+    requests = defaultdict(set)
+    for span in spans:
+        root = root_of(span)
+        if root["name"] not in ROUTES:
+            continue
+        route = root["name"]
+        parent = by_id.get(span["parentSpanId"])
+        if span is root:
+            requests[route].add(span["spanId"])
+            totals[route]["request"] += duration[span["spanId"]]
+        elif span["name"].startswith("SQL "):
+            totals[route]["sql"] += duration[span["spanId"]]
+            if parent is not None and parent is not root:
+                totals[route]["service"] -= duration[span["spanId"]]
+        else:
+            totals[route]["service"] += duration[span["spanId"]]
+    result = {}
+    for route, parts in totals.items():
+        n = len(requests[route])
+        other = parts["request"] - parts["sql"] - parts["service"]
+        result[route] = {k: round(v / n, 3) for k, v in {**parts, "other": other}.items()}
+    return result
+
+
+# ──────────────────────────────────────────────
+# PROCESSO PRINCIPALE
+# ──────────────────────────────────────────────
+def spawn(mode: str, args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="mare_calmo_bench_") as cwd:
+        env = {
+            **os.environ,
+            **MODES[mode],
+            "TRACE_FILE": os.path.join(cwd, "traces.jsonl"),
+            "RECOMPUTE_WORKERS": "0",
+            "HASH_WORKERS": "0",
+            "RATE_LIMIT_ENABLED": "0",
+            "SECRET_KEY": os.environ.get("SECRET_KEY") or secrets.token_urlsafe(48),
+            "PYTHONPATH": os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])),
+        }
+        argv = [
+            sys.executable, "-m", "benchmarks.bench_tracing", "--mode", mode,
+            "--events", str(args.events), "--requests", str(args.requests),
+        ]
+        out = subprocess.run(argv, cwd=cwd, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"Modalità {mode} fallita:\n{out.stderr[-2000:]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--mode", choices=list(MODES), help=argparse.SUPPRESS)  # processo figlio
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        print(json.dumps(asyncio.run(run_mode(args))))
+        return 0
+
+    results = {mode: spawn(mode, args) for mode in MODES}
+
+    print(f"\n🧵 {args.requests} richieste per route, utente con {args.events} eventi\n")
+    print(f"{'Route':<40} | " + " | ".join(f"{mode + ' (µs)':>11}" for mode in MODES))
+    print("-" * (43 + 14 * len(MODES)))
+    for route in ROUTES:
+        print(f"{route:<40} | " + " | ".join(f"{results[mode]['mean_us'][route]:>11.1f}" for mode in MODES))
+
+    print("\nDove va il tempo (tracce al 100%, ms medi per richiesta)\n")
+    print(f"{'Route':<40} | {'richiesta':>9} | {'SQL':>7} | {'servizi':>7} | {'resto':>7}")
+    print("-" * 82)
+    for route, parts in results["100%"]["breakdown"].items():
+        print(
+            f"{route:<40} | {parts['request']:>9.2f} | {parts['sql']:>7.2f} | "
+            f"{parts['service']:>7.2f} | {parts['other']:>7.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Utilità condivise dai benchmark — database temporaneo e conteggio SQL.
+
+I benchmark non toccano mai mare_calmo.db: ognuno lavora su un file
+SQLite temporaneo cancellato alla fine.
+"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.db.database import Base
+import app.models.models  # noqa: F401 — registra le tabelle su Base.metadata
+
+
+@contextmanager
+def temp_sessionmaker():
+    """Factory di sessioni su un database SQLite temporaneo con lo schema completo."""
+    fd, path = tempfile.mkstemp(suffix=".db", prefix="mare_calmo_bench_")
+    os.close(fd)
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    try:
+        yield sessionmaker(bind=engine, autoflush=False)
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+@contextmanager
+def temp_session():
+    """Sessione su un database SQLite temporaneo con lo schema completo."""
+    with temp_sessionmaker() as session_factory:
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+
+class StatementCounter:
+    """Conta gli statement SQL emessi su un engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+def timed(fn, *args, **kwargs) -> tuple[float, object]:
+    """Esegue fn e ritorna (secondi, risultato)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
@@ -58,6 +58,15 @@ export async function submitCheckIn(userId, checkpoint, token) {
   }, token);
 }
 
+/**
+ * Invia in blocco gli eventi registrati offline.
+ * Ogni evento porta il suo created_at (ISO 8601); la risposta
+ * contiene l'esito per elemento.
+ */
+export async function submitEventsBatch(events, token) {
+  return apiPost("/events/batch", events, token);
+}
+
 /**
  * Fetch i pesci dell'utente
  */
@@ -72,6 +81,13 @@ export async function fetchSeaState(userId, token) {
   return apiGet(`/user/${userId}/sea-state`, token);
 }
 
+/**
+ * Fetch pesci e stato del mare in una sola richiesta
+ */
+export async function fetchWorld(userId, token) {
+  return apiGet(`/user/${userId}/world`, token);
+}
+
 /**
  * Ricalcola lo stato dei pesci e del mare
  */